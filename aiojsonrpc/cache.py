@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from time import monotonic
+
+
+MISSING = object()
+
+
+def freeze(value):
+    """ Converts decoded params into a hashable value. """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ResultCache(object):
+    """ LRU cache of rpc method results with optional TTL (seconds).
+
+    Entries are keyed by the params named in `key`, or by all the params
+    if `key` is `None`, plus an arbitrary `namespace` (the serializer name
+    when results are stored serialized).
+    """
+    default_maxsize = 1024
+
+    def __init__(self, ttl=None, maxsize=None, key=None):
+        maxsize = self.default_maxsize if maxsize is None else maxsize
+        if maxsize < 1:
+            raise ValueError('maxsize must be a positive integer')
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.key_params = None if key is None else tuple(key)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def make_key(self, params):
+        """ Returns the key of `params` or `None` if they aren't hashable
+        or aren't given by name.
+        """
+        if not isinstance(params, dict):
+            return None
+        if self.key_params is None:
+            key = freeze(params)
+        else:
+            key = tuple(freeze(params.get(name)) for name in self.key_params)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, namespace, key):
+        entry_key = (namespace, key)
+        try:
+            expires_at, value = self._entries[entry_key]
+        except KeyError:
+            return MISSING
+        if expires_at is not None and expires_at <= monotonic():
+            del self._entries[entry_key]
+            return MISSING
+        self._entries.move_to_end(entry_key)
+        return value
+
+    def set(self, namespace, key, value):
+        entries = self._entries
+        entries[(namespace, key)] = (
+            None if self.ttl is None else monotonic() + self.ttl, value)
+        entries.move_to_end((namespace, key))
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def invalidate(self, params=None):
+        """ Drops the entries of `params`, or all the entries. """
+        if params is None:
+            self._entries.clear()
+            return
+        key = self.make_key(params)
+        for entry_key in [entry_key for entry_key in self._entries
+                          if entry_key[1] == key]:
+            del self._entries[entry_key]
@@ -0,0 +1,39 @@
+class InFlightCalls(object):
+    """ Tasks running the in-flight calls of a connection by request id,
+    so that the client can cancel them with `rpc.cancel`.
+    """
+    def __init__(self):
+        self._tasks = {}
+        self._cancelled = set()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, id):
+        return id in self._tasks
+
+    def add(self, id, task):
+        """ Tracks the call. Returns `False` if a call
+        with the same id is already in flight.
+        """
+        if id in self._tasks:
+            return False
+        self._tasks[id] = task
+        return True
+
+    def discard(self, id):
+        self._tasks.pop(id, None)
+        self._cancelled.discard(id)
+
+    def cancel(self, id):
+        """ Cancels the call. Returns whether it was in flight. """
+        task = self._tasks.pop(id, None)
+        if task is None:
+            return False
+        self._cancelled.add(id)
+        task.cancel()
+        return True
+
+    def was_cancelled(self, id):
+        """ Returns whether the call was cancelled through `cancel`. """
+        return id in self._cancelled
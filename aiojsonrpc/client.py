@@ -2,46 +2,567 @@ import os
 import asyncio
 import aiohttp
 from itertools import count
+from .constants import ACK_METHOD
+from .constants import CANCEL_METHOD
+from .constants import CHUNK_METHOD
 from .constants import JSON_RPC_VERSION
+from .constants import SUBSCRIPTION_METHOD
+from .constants import UNSUBSCRIBE_METHOD
+from . import serializer as serializers_registry
 from .serializer import json
 from .serializer import msgpack
 from .exception import RpcError
 
 
-class Client(object):
-    def __init__(self, service_url, data_type=str, id_iterator=None,
-                 session_params={}):
+class ClientSubscription(object):
+    """ Async iterator over the items the server pushes for a subscription,
+    see `Client.subscribe`.
+
+    Iteration stops when the server closes the subscription; an error
+    of the subscription source is raised as `RpcError`.
+    """
+    def __init__(self, client):
+        self.id = None
+        self._client = client
+        self._queue = asyncio.Queue()
+        self._active = True
+
+    @property
+    def active(self):
+        return self._active
+
+    async def unsubscribe(self):
+        """ Stops the subscription on the server side. """
+        if not self._active:
+            return
+        self._finish(StopAsyncIteration())
+        await self._client.call(UNSUBSCRIBE_METHOD, subscription=self.id)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.unsubscribe()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item, exc = await self._queue.get()
+        if exc is not None:
+            self._queue.put_nowait((item, exc))
+            raise exc
+        return item
+
+    def _on_notification(self, params):
+        if 'result' in params:
+            self._queue.put_nowait((params['result'], None))
+        elif 'error' in params:
+            self._finish(RpcError(params['error']['message'],
+                                  params['error']['code']))
+        else:
+            self._finish(StopAsyncIteration())
+
+    def _finish(self, exc):
+        if self._active:
+            self._active = False
+            self._client._subscriptions.pop(self.id, None)
+            self._queue.put_nowait((None, exc))
+
+
+class ClientStream(object):
+    """ Async iterator over the items streamed in response to a call,
+    see `Client.stream`.
+
+    Consumed items are acknowledged to the server in batches of half
+    the `window`, so that it can send more. The window is replaced
+    by the one the server announces with the first item, as the server
+    may cap it.
+    """
+    def __init__(self, client, id, window):
+        self.id = id
+        self.result = None
+        self._client = client
+        self._window = window
+        self._consumed = 0
+        self._queue = asyncio.Queue()
+        self._active = True
+
+    @property
+    def active(self):
+        return self._active
+
+    def cancel(self):
+        """ Stops the stream on the server side. """
+        if not self._active:
+            return
+        self._finish(StopAsyncIteration())
+        self._client.notify(CANCEL_METHOD, id=self.id)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.cancel()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item, exc = await self._queue.get()
+        if exc is not None:
+            self._queue.put_nowait((item, exc))
+            raise exc
+        self._acknowledge()
+        return item
+
+    def _acknowledge(self):
+        self._consumed += 1
+        if self._active and self._consumed >= max(1, self._window // 2):
+            self._client.notify(ACK_METHOD, id=self.id,
+                                credit=self._consumed)
+            self._consumed = 0
+
+    def _on_chunk(self, params):
+        window = params.get('window')
+        if isinstance(window, int) and window > 0:
+            self._window = window
+        self._queue.put_nowait((params.get('result'), None))
+
+    def _on_response(self, data):
+        if 'error' in data:
+            self._finish(self._client._get_error(data))
+        else:
+            self.result = data.get('result')
+            self._finish(StopAsyncIteration())
+
+    def _finish(self, exc):
+        if self._active:
+            self._active = False
+            self._client._streams.pop(self.id, None)
+            self._queue.put_nowait((None, exc))
+
+
+class BaseClient(object):
+    """ Requests and responses shared by the transports. """
+    def __init__(self, service_url, id_iterator=None, session_params={},
+                 timeout=None):
         self._session_params = session_params
-        self._data_type = data_type
-        self._serializer = json if self._data_type is str else msgpack
         self._id_iterator = id_iterator or count(start=1, step=1)
         self._service_url = service_url
+        self._timeout = timeout
+
+    def create_request(self, method, *args, **params):
+        return self._create_request(next(self._id_iterator), method,
+                                    self._get_params(args, params))
+
+    def _create_request(self, id, method, params, timeout=None):
+        return self._serializer.dumps(
+            self._create_request_object(id, method, params, timeout))
+
+    def create_notification(self, method, *args, **params):
+        return self._serializer.dumps(self._create_notification_object(
+            method, self._get_params(args, params)))
+
+    def _get_params(self, args, params):
+        """ Returns the params of a call given either by position
+        (sent as an array) or by name (sent as an object).
+        """
+        if args and params:
+            raise TypeError('Params must be given either by position '
+                            'or by name')
+        return list(args) if args else params
+
+    def _create_notification_object(self, method, params):
+        return {
+            'jsonrpc': JSON_RPC_VERSION,
+            'method': method,
+            'params': params,
+        }
+
+    def _create_request_object(self, id, method, params, timeout=None):
+        request = {
+            'jsonrpc': JSON_RPC_VERSION,
+            'method': method,
+            'params': params,
+            'id': id,
+        }
+        if timeout is not None:
+            request['timeout'] = timeout
+        return request
+
+    def _get_result(self, data):
+        try:
+            return data['result']
+        except KeyError:
+            raise self._get_error(data)
+
+    def _get_error(self, data):
+        return RpcError(data['error']['message'], data['error']['code'])
+
+
+class Client(BaseClient):
+    """ JSON-RPC websocket client.
+
+    A single connection can carry any number of concurrent calls:
+    a background reader task routes every response to the call
+    waiting for its `id`.
+
+    Messages are serialized with `json` or `msgpack` depending on
+    `data_type`. Alternatively a `serializer` (an object or a name from
+    `aiojsonrpc.serializer` registry) can be requested from the server
+    through the websocket subprotocol; if the server doesn't agree on it
+    the `data_type` default is used. The default is offered as
+    a subprotocol as well.
+
+    Items pushed by the server are consumed through `subscribe`,
+    results of streaming methods through `stream`.
+
+    `ws_params` are passed to `ws_connect`, e.g. `{'compress': 15}`
+    requests permessage-deflate on aiohttp versions supporting it.
+    """
+    def __init__(self, service_url, data_type=str, id_iterator=None,
+                 session_params={}, timeout=None, serializer=None,
+                 ws_params={}):
+        super().__init__(service_url, id_iterator=id_iterator,
+                         session_params=session_params, timeout=timeout)
+        self._default_data_type = data_type
+        self._requested_serializer = serializers_registry.resolve(serializer)
+        self._ws_params = ws_params
+        self._set_serializer(None)
+        self._pending = {}
+        self._subscribing = {}
+        self._subscriptions = {}
+        self._streams = {}
+        self._batches = []
+        self._reader = None
 
     async def __aenter__(self):
         self._session = aiohttp.ClientSession(**self._session_params)
-        self._ws = await self._session.ws_connect(self._service_url)
+        try:
+            self._ws = await self._session.ws_connect(
+                self._service_url, protocols=self._protocols(),
+                **self._ws_params)
+        except BaseException:
+            self._session.close()
+            self._session = None
+            raise
+        if self._requested_serializer is not None:
+            if self._ws.protocol == self._requested_serializer.name:
+                self._set_serializer(self._requested_serializer)
         self._send_request = (self._ws.send_str if self._data_type == str
                               else self._ws.send_bytes)
+        self._reader = asyncio.ensure_future(self._read_responses())
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
+        self._reader.cancel()
         await self._ws.close()
         self._session.close()
         print('websocket connection closed')
 
-    def create_request(self, method, **params):
-        return self._serializer.dumps({
-            'jsonrpc': JSON_RPC_VERSION,
-            'method': method,
-            'params': params,
-            'id': next(self._id_iterator)
-        })
+    def _protocols(self):
+        """ Returns the subprotocols to offer: the requested serializer,
+        if any, and the `data_type` default, so that the server knows
+        the serializer of the connection from the handshake.
+        """
+        default = self._default_serializer().name
+        requested = self._requested_serializer
+        if requested is None or requested.name == default:
+            return (default, )
+        return (requested.name, default)
+
+    def _default_serializer(self):
+        return json if self._default_data_type is str else msgpack
+
+    def _set_serializer(self, serializer):
+        if serializer is None:
+            self._data_type = self._default_data_type
+            self._serializer = self._default_serializer()
+        else:
+            self._data_type = bytes if serializer.binary else str
+            self._serializer = serializer
+
+    @property
+    def pending(self):
+        """ Number of calls waiting for a response. """
+        return len(self._pending)
+
+    @property
+    def closed(self):
+        return self._reader is None or self._reader.done()
 
-    async def call(self, method, **params):
-        self._send_request(self.create_request(method, **params))
-        response = await self._ws.receive()
-        data = self._serializer.loads(response.data)
+    async def wait_closed(self):
+        """ Waits until the connection is closed by either side. """
+        if self._reader is not None:
+            await asyncio.wait([self._reader])
+
+    async def call(self, method, *args, timeout=None, **params):
+        """ Calls remote `method` and waits for its result.
+
+        Params are given either by position, `client.call('Math.add', 1, 2)`,
+        or by name, `client.call('Math.add', x=1, y=2)`.
+        `timeout` (seconds) overrides the client-wide timeout for this call.
+        It's sent along with the request for the server to give up
+        on the call at the same time. On timeout or cancellation the server
+        is asked to cancel the call, and a late response is dropped.
+        To cancel a call, cancel its task:
+
+        ```python
+        call = asyncio.ensure_future(client.call('ReportService.build'))
+        ...
+        call.cancel()
+        ```
+        """
+        return await self._call(next(self._id_iterator), method,
+                                self._get_params(args, params), timeout)
+
+    async def _call(self, id, method, params, timeout):
+        timeout = self._timeout if timeout is None else timeout
+        future = self._add_pending(id)
         try:
-            return data['result']
-        except KeyError:
-            raise RpcError(data['error']['message'], data['error']['code'])
+            self._send_request(self._create_request(id, method, params,
+                                                    timeout))
+            data = await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._cancel_remote(id)
+            raise
+        finally:
+            self._pending.pop(id, None)
+        return self._get_result(data)
+
+    def _cancel_remote(self, id):
+        if not self._ws.closed:
+            self.notify(CANCEL_METHOD, id=id)
+
+    async def subscribe(self, method, *args, timeout=None, **params):
+        """ Calls remote `method` returning a subscription
+        and returns a `ClientSubscription` to iterate over the pushed items:
+
+        ```python
+        async with await client.subscribe('TickerService.prices',
+                                          symbol='ABC') as prices:
+            async for price in prices:
+                print(price)
+        ```
+        """
+        id = next(self._id_iterator)
+        subscription = self._subscribing[id] = ClientSubscription(self)
+        try:
+            await self._call(id, method, self._get_params(args, params),
+                             timeout)
+        finally:
+            self._subscribing.pop(id, None)
+        return subscription
+
+    def stream(self, method, *args, window=16, **params):
+        """ Calls remote streaming `method` and returns a `ClientStream`
+        to iterate over the items as they come. The server sends up to
+        `window` items ahead of the consumer, or less if it caps
+        the window.
+
+        ```python
+        async with client.stream('ReportService.rows', year=2016) as rows:
+            async for row in rows:
+                print(row)
+        ```
+        """
+        params = self._get_params(args, params)
+        id = next(self._id_iterator)
+        stream = self._streams[id] = ClientStream(self, id, window)
+        request = self._create_request_object(id, method, params)
+        request['window'] = window
+        self._send_request(self._serializer.dumps(request))
+        return stream
+
+    def notify(self, method, *args, **params):
+        """ Sends a notification: the server doesn't respond to it,
+        so neither its result nor errors are ever reported.
+        """
+        self._send_request(self.create_notification(method, *args, **params))
+
+    async def batch(self, calls, *, timeout=None):
+        """ Sends all the `calls` in one batch request.
+
+        `calls` is an iterable of `(method, params)` pairs,
+        `params` being a dict or a list of positional params.
+        Returns the results in the order of `calls`; a failed call is
+        represented by its `RpcError` instead of a result.
+
+        An error response without an id, e.g. from a server that
+        can't parse the batch, is raised as `RpcError`. Such a response
+        can't be told apart, so it fails all the batches in flight.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        requests = [self._create_request_object(next(self._id_iterator),
+                                                method, params, timeout)
+                    for method, params in calls]
+        futures = [self._add_pending(request['id']) for request in requests]
+        self._batches.append(futures)
+        try:
+            self._send_request(self._serializer.dumps(requests))
+            responses = await asyncio.wait_for(asyncio.gather(*futures),
+                                               timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            for request, future in zip(requests, futures):
+                if not future.done() or future.cancelled():
+                    self._cancel_remote(request['id'])
+            raise
+        finally:
+            self._batches.remove(futures)
+            for request in requests:
+                self._pending.pop(request['id'], None)
+        for data in responses:
+            if data.get('id') is None:
+                raise self._get_error(data)
+        return [self._get_error(data) if 'error' in data else data['result']
+                for data in responses]
+
+    def _add_pending(self, id):
+        future = asyncio.Future()
+        self._pending[id] = future
+        return future
+
+    async def _read_responses(self):
+        try:
+            while True:
+                response = await self._ws.receive()
+                if response.tp in (aiohttp.MsgType.close,
+                                   aiohttp.MsgType.closed,
+                                   aiohttp.MsgType.error):
+                    break
+                try:
+                    data = self._serializer.loads(response.data)
+                except (ValueError, TypeError):
+                    print('dropped a message that could not be decoded')
+                    continue
+                for item in (data if isinstance(data, list) else (data, )):
+                    if isinstance(item, dict):
+                        self._on_response(item)
+        finally:
+            self._fail_pending(ConnectionError('websocket connection closed'))
+
+    def _on_response(self, data):
+        if data.get('method') == SUBSCRIPTION_METHOD:
+            self._on_notification(data.get('params') or {})
+            return
+        if data.get('method') == CHUNK_METHOD:
+            stream = self._streams.get((data.get('params') or {}).get('id'))
+            if stream is not None:
+                stream._on_chunk(data['params'])
+            return
+        stream = self._streams.get(data.get('id'))
+        if stream is not None:
+            stream._on_response(data)
+            return
+        subscription = self._subscribing.pop(data.get('id'), None)
+        if subscription is not None and 'result' in data:
+            subscription.id = data['result']
+            self._subscriptions[subscription.id] = subscription
+        if data.get('id') is None and 'error' in data:
+            self._on_batch_error(data)
+            return
+        future = self._pending.get(data.get('id'))
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def _on_batch_error(self, data):
+        for futures in self._batches:
+            for future in futures:
+                if not future.done():
+                    future.set_result(data)
+
+    def _on_notification(self, params):
+        subscription = self._subscriptions.get(params.get('subscription'))
+        if subscription is not None:
+            subscription._on_notification(params)
+
+    def _fail_pending(self, exc):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        for subscription in list(self._subscriptions.values()):
+            subscription._finish(exc)
+        for stream in list(self._streams.values()):
+            stream._finish(exc)
+
+
+class HttpClient(BaseClient):
+    """ JSON-RPC client sending every call as an HTTP POST request.
+
+    Requests go through one `aiohttp.ClientSession`, whose connection pool
+    keeps the connections to the server alive between calls. Pass
+    `session` to share a session and its pool between clients; it isn't
+    closed by the client then.
+
+    Messages are serialized with `serializer` (an object or a name from
+    `aiojsonrpc.serializer` registry) and sent with its `content_type`.
+    """
+    def __init__(self, service_url, serializer='json', id_iterator=None,
+                 session_params={}, timeout=None, session=None):
+        super().__init__(service_url, id_iterator=id_iterator,
+                         session_params=session_params, timeout=timeout)
+        self._serializer = serializers_registry.resolve(serializer)
+        self._headers = {'Content-Type': self._serializer.content_type}
+        self._session = session
+        self._owns_session = session is None
+
+    async def __aenter__(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(**self._session_params)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._owns_session:
+            self._session.close()
+            self._session = None
+
+    async def call(self, method, *args, timeout=None, **params):
+        """ Calls remote `method` and returns its result.
+
+        `timeout` (seconds) overrides the client-wide timeout for this call
+        and is sent along with the request, see `Client.call`.
+        """
+        timeout = self._timeout if timeout is None else timeout
+        return self._get_result(await self._post(
+            self._create_request_object(next(self._id_iterator), method,
+                                        self._get_params(args, params),
+                                        timeout),
+            timeout))
+
+    async def notify(self, method, *args, **params):
+        """ Sends a notification, see `Client.notify`. """
+        await self._post(self._create_notification_object(
+            method, self._get_params(args, params)), self._timeout)
+
+    async def batch(self, calls, *, timeout=None):
+        """ Sends all the `calls` in one request, see `Client.batch`. """
+        timeout = self._timeout if timeout is None else timeout
+        requests = [self._create_request_object(next(self._id_iterator),
+                                                method, params, timeout)
+                    for method, params in calls]
+        responses = await self._post(requests, timeout)
+        if not isinstance(responses, list):
+            raise self._get_error(responses)
+        responses = {response.get('id'): response for response in responses}
+        return [self._get_error(data) if 'error' in data else data['result']
+                for data in (responses[request['id']]
+                             for request in requests)]
+
+    async def _post(self, message, timeout):
+        return await asyncio.wait_for(
+            self._exchange(self._serializer.dumps(message)), timeout)
+
+    async def _exchange(self, data):
+        """ Sends serialized `data` and returns the deserialized response,
+        or `None` if there's no response.
+        """
+        async with self._session.post(self._service_url, data=data,
+                                      headers=self._headers) as response:
+            response.raise_for_status()
+            if response.status == 204:
+                return None
+            body = await response.read()
+        if not self._serializer.binary:
+            body = body.decode(response.charset or 'utf-8')
+        return self._serializer.loads(body)
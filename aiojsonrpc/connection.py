@@ -0,0 +1,113 @@
+from .constants import JSON_RPC_VERSION
+from .serializer import json
+
+
+# The serializer of a connection that hasn't shown which one it uses yet.
+UNKNOWN = object()
+
+
+def send_payload(ws, payload):
+    """ Sends a serialized message as a binary or text frame. """
+    if isinstance(payload, bytes):
+        ws.send_bytes(payload)
+    else:
+        ws.send_str(payload)
+
+
+class ConnectionRegistry(object):
+    """ Registry of open websocket connections.
+
+    Adding and removing a connection is O(1). Connections can be tagged
+    (e.g. by user id or topic) to publish notifications to a subset
+    of them. A published notification is serialized once per serializer
+    in use and the same payload is sent to every matching connection.
+    """
+    def __init__(self, default_serializer=json):
+        self._default_serializer = default_serializer
+        self._connections = {}
+        self._tagged = {}
+
+    def __len__(self):
+        return len(self._connections)
+
+    def __iter__(self):
+        return iter(self._connections)
+
+    def __contains__(self, ws):
+        return ws in self._connections
+
+    def add(self, ws, serializer=None, tags=()):
+        """ Registers the connection. Notifications to it are serialized
+        with `serializer`, or the default serializer of the registry.
+        With `serializer=UNKNOWN` notifications skip the connection
+        until its serializer is set, see `set_serializer`.
+        """
+        self._connections[ws] = [serializer or self._default_serializer,
+                                 set()]
+        self.tag(ws, *tags)
+
+    def set_serializer(self, ws, serializer):
+        self._connections[ws][0] = serializer
+
+    def discard(self, ws):
+        try:
+            _, tags = self._connections.pop(ws)
+        except KeyError:
+            return
+        for tag in tags:
+            self._discard_tagged(tag, ws)
+
+    def tag(self, ws, *tags):
+        connection_tags = self._connections[ws][1]
+        for tag in tags:
+            connection_tags.add(tag)
+            self._tagged.setdefault(tag, set()).add(ws)
+
+    def untag(self, ws, *tags):
+        connection_tags = self._connections[ws][1]
+        for tag in tags:
+            connection_tags.discard(tag)
+            self._discard_tagged(tag, ws)
+
+    def tags(self, ws):
+        return frozenset(self._connections[ws][1])
+
+    def connections(self, tag=None):
+        """ Returns the connections with `tag`, or all of them. """
+        if tag is None:
+            return set(self._connections)
+        return set(self._tagged.get(tag, ()))
+
+    def _discard_tagged(self, tag, ws):
+        tagged = self._tagged.get(tag)
+        if tagged is None:
+            return
+        tagged.discard(ws)
+        if not tagged:
+            del self._tagged[tag]
+
+    def publish(self, method, params=None, tag=None):
+        """ Sends a JSON-RPC notification to the connections with `tag`,
+        or to all of them. Returns the number of connections it was sent to.
+        """
+        notification = {'jsonrpc': JSON_RPC_VERSION, 'method': method}
+        if params is not None:
+            notification['params'] = params
+        targets = (self._connections if tag is None
+                   else self._tagged.get(tag, ()))
+        payloads = {}
+        sent = 0
+        for ws in targets:
+            if ws.closed:
+                continue
+            serializer = self._connections[ws][0]
+            if serializer is UNKNOWN:
+                continue
+            try:
+                payload = payloads[serializer]
+            except KeyError:
+                payload = payloads[serializer] = serializer.dumps(
+                    notification)
+            send_payload(ws, payload)
+            sent += 1
+        return sent
@@ -1 +1,25 @@
+from enum import Enum
+
+
 JSON_RPC_VERSION = '2.0'
+
+
+class ServiceLifetime(Enum):
+    """ How long a service instance lives:
+
+        SINGLETON   One instance shared by all the connections,
+                    created without context on the first call.
+        CONNECTION  One instance per connection,
+                    created with the connection context on the first call.
+        CALL        A new instance with the connection context per call.
+    """
+    SINGLETON = 'singleton'
+    CONNECTION = 'connection'
+    CALL = 'call'
+
+
+SUBSCRIPTION_METHOD = 'rpc.subscription'
+UNSUBSCRIBE_METHOD = 'rpc.unsubscribe'
+CHUNK_METHOD = 'rpc.chunk'
+ACK_METHOD = 'rpc.ack'
+CANCEL_METHOD = 'rpc.cancel'
@@ -0,0 +1,222 @@
+import asyncio
+import inspect
+from functools import partial
+from types import MappingProxyType
+from weakref import WeakKeyDictionary
+from .cache import ResultCache
+from .constants import ServiceLifetime
+from .executor import bounded_executor
+from .validation import compile_validator
+
+
+_compiled_services = WeakKeyDictionary()
+# `{service class: {(method name, cache options): ResultCache}}`
+# of the caches enabled by service-wide options.
+_option_caches = WeakKeyDictionary()
+_isasyncgenfunction = getattr(inspect, 'isasyncgenfunction',
+                              lambda fn: False)
+
+
+class RpcMethod(object):
+    """ RPC method prepared for dispatching.
+
+    Knows its full `Service.method` name and whether the underlying
+    function is a coroutine function, so a call doesn't need any lookups.
+
+    Options (see `aiojsonrpc.util.rpc_method`):
+        - executor: run a non-coroutine method in this
+          `concurrent.futures.Executor` or `BoundedExecutor`
+          instead of the event loop thread.
+        - max_pending: submit at most this many calls of the method
+          to the executor at a time, by default its number of workers.
+        - cache_ttl, cache_maxsize, cache_key: cache results
+          in a `ResultCache` shared by all the connections.
+        - with_context: pass the connection context to the method
+          as the first argument after `self`. Can't be combined
+          with the cache, whose results are shared by all the connections.
+        - stream: stream the items of the async iterator the method
+          returns, detected for async generator functions.
+        - validate, schema: check the types of the params,
+          see `aiojsonrpc.validation`. The names or number of the params
+          are always checked.
+
+    Params are given either by name (a dict) or by position (a list).
+    """
+    __slots__ = ('name', 'service_name', 'method_name', 'fn', 'is_coroutine',
+                 'executor', 'cache', 'with_context', 'is_stream',
+                 'validate_params')
+
+    def __init__(self, service_name, method_name, fn, executor=None,
+                 cache_ttl=None, cache_maxsize=None, cache_key=None,
+                 with_context=False, stream=None, validate=False,
+                 schema=None, max_pending=None):
+        self.name = '{}.{}'.format(service_name, method_name)
+        self.service_name = service_name
+        self.method_name = method_name
+        self.fn = fn
+        self.is_coroutine = asyncio.iscoroutinefunction(fn)
+        self.with_context = with_context
+        self.is_stream = (_isasyncgenfunction(fn) if stream is None
+                          else stream)
+        self.executor = (None if self.is_coroutine or self.is_stream
+                         else bounded_executor(executor, max_pending))
+        if cache_ttl is None and cache_maxsize is None and cache_key is None:
+            self.cache = None
+        elif with_context:
+            raise ValueError('{} can\'t both take the context and cache '
+                             'its results'.format(self.name))
+        else:
+            self.cache = ResultCache(ttl=cache_ttl, maxsize=cache_maxsize,
+                                     key=cache_key)
+        self.validate_params = compile_validator(
+            fn, skip=2 if with_context else 1, validate=validate,
+            schema=schema)
+
+    @classmethod
+    def from_function(cls, service_name, method_name, fn, **defaults):
+        """ Creates the rpc method using the options given to `rpc_method`
+        on top of `defaults`.
+        """
+        return cls(service_name, method_name, fn,
+                   **{**defaults, **getattr(fn, 'rpc_options', {})})
+
+    def named_params(self, params):
+        """ Returns params given by position as a dict, if possible. """
+        return self.validate_params.as_named(params)
+
+    async def __call__(self, service, params, context=None):
+        self.validate_params(params)
+        args = (service, context) if self.with_context else (service, )
+        if isinstance(params, list):
+            args += tuple(params)
+            params = {}
+        if self.is_coroutine:
+            return await self.fn(*args, **params)
+        if self.executor is None:
+            return self.fn(*args, **params)
+        return await self.executor.run(partial(self.fn, *args, **params))
+
+
+class ServiceFactory(object):
+    """ Provides instances of a service class according to its lifetime
+    (`aiojsonrpc.constants.ServiceLifetime`).
+    """
+    def __init__(self, service, lifetime=None):
+        self.service = service
+        self.lifetime = ServiceLifetime(
+            lifetime or getattr(service, 'lifetime',
+                                ServiceLifetime.CONNECTION))
+        self._instance = None
+
+    def get(self, name, services):
+        """ Returns the instance for the connection `services`. """
+        if self.lifetime is ServiceLifetime.SINGLETON:
+            if self._instance is None:
+                self._instance = self.service()
+            instance = services[name] = self._instance
+        elif self.lifetime is ServiceLifetime.CONNECTION:
+            instance = services[name] = self.service(**services.context)
+        else:
+            instance = self.service(**services.context)
+        return instance
+
+
+class ServiceMap(dict):
+    """ Service instances of a connection by service name
+    along with the dispatch table of their methods,
+    the connection context, the limits of the connection
+    (`aiojsonrpc.limits`), if any, the `SingleFlight`
+    shared between connections, if any, the `Subscriptions`
+    and `Streams` of the connection, if it supports server push,
+    and its `InFlightCalls`, if the client can cancel them.
+
+    Missing instances are provided by `factories` (`ServiceFactory`)
+    on first use.
+    """
+    def __init__(self, methods, *args, factories=None, context=None,
+                 limits=None, single_flight=None, subscriptions=None,
+                 streams=None, calls=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.methods = methods
+        self.factories = factories or {}
+        self.context = context or {}
+        self.limits = limits
+        self.single_flight = single_flight
+        self.subscriptions = subscriptions
+        self.streams = streams
+        self.calls = calls
+
+    def __missing__(self, name):
+        return self.factories[name].get(name, self)
+
+    @classmethod
+    def from_instances(cls, services):
+        return cls(create_dispatch_table({name: type(service)
+                                          for name, service
+                                          in services.items()}),
+                   services)
+
+
+def compile_service(service):
+    """ Returns `{method_name: RpcMethod}` of the service class.
+    The result is computed once per class.
+    """
+    try:
+        return _compiled_services[service]
+    except KeyError:
+        pass
+    methods = {}
+    for method_name in dir(service):
+        fn = getattr(service, method_name, None)
+        if getattr(fn, 'is_rpc_method', False):
+            methods[method_name] = RpcMethod.from_function(
+                service.__name__, method_name, fn)
+    methods = _compiled_services[service] = MappingProxyType(methods)
+    return methods
+
+
+def create_dispatch_table(services, options=None):
+    """ Creates an immutable mapping of full `Service.method` names
+    to the prepared methods of `services` (`{name: service class}`).
+
+    `options` (`{service name: {option: value}}`) provides service-wide
+    defaults for the options of `rpc_method`.
+    """
+    options = options or {}
+    table = {}
+    for service_name, service in services.items():
+        service_options = options.get(service_name)
+        for method_name, rpc_method in compile_service(service).items():
+            if service_options or service_name != rpc_method.service_name:
+                cache = rpc_method.cache
+                rpc_method = RpcMethod.from_function(
+                    service_name, method_name, rpc_method.fn,
+                    **(service_options or {}))
+                if cache is not None:
+                    rpc_method.cache = cache
+                elif rpc_method.cache is not None:
+                    rpc_method.cache = _share_cache(
+                        service, method_name, rpc_method.cache)
+            table[rpc_method.name] = rpc_method
+    return MappingProxyType(table)
+
+
+def _share_cache(service, method_name, cache):
+    """ Returns the cache created by the same service-wide options before,
+    so the entries survive rebuilding the dispatch table, or `cache`.
+    """
+    key = (method_name, cache.ttl, cache.maxsize, cache.key_params)
+    return _option_caches.setdefault(service, {}).setdefault(key, cache)
+
+
+def method_caches(service, method_name):
+    """ Returns the result caches of the method of the service class,
+    enabled either by `rpc_method` or by service-wide options.
+    """
+    caches = [cache for (name, *_), cache
+              in _option_caches.get(service, {}).items()
+              if name == method_name]
+    rpc_method = compile_service(service).get(method_name)
+    if rpc_method is not None and rpc_method.cache is not None:
+        caches.append(rpc_method.cache)
+    return caches
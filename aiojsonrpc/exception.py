@@ -15,7 +15,13 @@ class RpcErrorCode(Enum):
         -32603  Internal error
             - Internal JSON-RPC error.
         -32000 to -32099    Server error
-            - Reserved for implementation-defined server-errors.
+            - Reserved for implementation-defined server-errors:
+        -32000  Server busy
+            - The call was rejected because the server is overloaded.
+        -32001  Request timeout
+            - The call didn't complete within the `timeout` of the request.
+        -32002  Request cancelled
+            - The call was cancelled by the client.
 
         Ref.: http://www.jsonrpc.org/specification#error_object
     """
@@ -24,6 +30,9 @@ class RpcErrorCode(Enum):
     METHOD_NOT_FOUND = -32601
     INVALID_PARAMS = -32602
     INTERNAL_ERROR = -32603
+    SERVER_BUSY = -32000
+    REQUEST_TIMEOUT = -32001
+    REQUEST_CANCELLED = -32002
 
 
 class RpcError(Exception):
@@ -0,0 +1,44 @@
+import asyncio
+from concurrent.futures import Executor
+
+
+class BoundedExecutor(object):
+    """ Runs functions in a `concurrent.futures.Executor`
+    keeping at most `max_pending` of them submitted at a time.
+
+    Extra calls wait on the event loop instead of piling up
+    in the unbounded work queue of the executor.
+    """
+    def __init__(self, executor, max_pending=None):
+        if max_pending is not None and max_pending < 1:
+            raise ValueError('max_pending must be a positive integer')
+        self._executor = executor
+        self._max_pending = max_pending
+        self._semaphore = None
+
+    @property
+    def executor(self):
+        return self._executor
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        if self._max_pending is None:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+
+def bounded_executor(executor, max_pending=None):
+    """ Wraps a `concurrent.futures.Executor` into `BoundedExecutor`
+    keeping at most `max_pending` calls submitted, by default as many
+    as the executor has workers. A `BoundedExecutor` is returned as is.
+    """
+    if executor is None or isinstance(executor, BoundedExecutor):
+        return executor
+    if not isinstance(executor, Executor):
+        raise TypeError('{!r} is not an executor'.format(executor))
+    if max_pending is None:
+        max_pending = getattr(executor, '_max_workers', None)
+    return BoundedExecutor(executor, max_pending)
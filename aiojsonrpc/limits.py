@@ -0,0 +1,72 @@
+from collections import Counter
+
+
+class Limits(object):
+    """ Limits of in-flight calls used to shed load.
+
+    - per_connection: calls of a single connection;
+    - per_service: calls of a single service, either one number for every
+      service or `{service name: number}`;
+    - total: calls of all the connections using this instance. Share one
+      instance between handlers to limit the whole process.
+
+    A call over a limit is rejected right away with
+    `RpcErrorCode.SERVER_BUSY` instead of being queued.
+    """
+    def __init__(self, per_connection=None, per_service=None, total=None):
+        self.per_connection = per_connection
+        self.per_service = per_service
+        self.total = total
+        self.in_flight = 0
+        self.rejected = 0
+        self.service_in_flight = Counter()
+
+    def connection(self):
+        """ Returns the limits of a new connection. """
+        return ConnectionLimits(self)
+
+    def service_limit(self, service_name):
+        if isinstance(self.per_service, dict):
+            return self.per_service.get(service_name)
+        return self.per_service
+
+    def stats(self):
+        """ Returns the current numbers of in-flight calls (queue depth)
+        and the number of rejected calls so far.
+        """
+        return {
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'services': {name: count for name, count
+                         in self.service_in_flight.items() if count},
+        }
+
+
+class ConnectionLimits(object):
+    def __init__(self, limits):
+        self._limits = limits
+        self.in_flight = 0
+
+    def acquire(self, service_name):
+        """ Takes a slot for a call of the service
+        or returns `False` if one of the limits is reached.
+        """
+        limits = self._limits
+        service_limit = limits.service_limit(service_name)
+        if ((limits.per_connection is not None and
+             self.in_flight >= limits.per_connection) or
+                (limits.total is not None and
+                 limits.in_flight >= limits.total) or
+                (service_limit is not None and
+                 limits.service_in_flight[service_name] >= service_limit)):
+            limits.rejected += 1
+            return False
+        self.in_flight += 1
+        limits.in_flight += 1
+        limits.service_in_flight[service_name] += 1
+        return True
+
+    def release(self, service_name):
+        self.in_flight -= 1
+        self._limits.in_flight -= 1
+        self._limits.service_in_flight[service_name] -= 1
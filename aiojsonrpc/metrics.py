@@ -0,0 +1,148 @@
+""" Metrics of the dispatch path exposed in the Prometheus text format.
+
+Usage:
+
+```python
+from aiohttp import web
+from aiojsonrpc.metrics import Metrics
+from aiojsonrpc.metrics import metrics_handler
+from aiojsonrpc.request_handler import create_default_rpc_websocket_handler
+
+
+metrics = Metrics()
+app = web.Application()
+app.router.add_route('GET', '/ws/json-rpc',
+                     create_default_rpc_websocket_handler(services=services,
+                                                          metrics=metrics))
+app.router.add_route('GET', '/metrics', metrics_handler(metrics))
+```
+"""
+from bisect import bisect_left
+from collections import Counter
+from collections import defaultdict
+from aiohttp import web
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNKNOWN_METHOD = 'unknown'
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for upper_bound, count in zip(self.buckets + (float('inf'), ),
+                                      self.counts):
+            total += count
+            yield upper_bound, total
+
+
+class Metrics(object):
+    """ Per-method call counts, error counts by `RpcErrorCode`,
+    handler and serialization latency histograms
+    and the number of open connections.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.calls = Counter()
+        self.errors = Counter()
+        self.connections = 0
+        self._buckets = buckets
+        self.call_durations = defaultdict(self._create_histogram)
+        self.serialization_durations = defaultdict(self._create_histogram)
+
+    def _create_histogram(self):
+        return Histogram(self._buckets)
+
+    def observe_call(self, method, seconds):
+        self.calls[method] += 1
+        self.call_durations[method].observe(seconds)
+
+    def observe_error(self, method, code):
+        self.errors[(method or UNKNOWN_METHOD, code.name)] += 1
+
+    def observe_serialization(self, serializer, seconds):
+        self.serialization_durations[
+            getattr(serializer, 'name', UNKNOWN_METHOD)].observe(seconds)
+
+    def connection_opened(self):
+        self.connections += 1
+
+    def connection_closed(self):
+        self.connections -= 1
+
+    def render(self):
+        """ Returns the metrics in the Prometheus text exposition format. """
+        lines = []
+        lines.extend(_render_counter(
+            'aiojsonrpc_calls_total', 'Number of rpc method calls.',
+            [((('method', method), ), count)
+             for method, count in sorted(self.calls.items())]))
+        lines.extend(_render_counter(
+            'aiojsonrpc_errors_total', 'Number of error responses.',
+            [((('method', method), ('code', code)), count)
+             for (method, code), count in sorted(self.errors.items())]))
+        lines.extend(_render_histograms(
+            'aiojsonrpc_call_duration_seconds',
+            'Time spent in rpc methods.', 'method', self.call_durations))
+        lines.extend(_render_histograms(
+            'aiojsonrpc_serialization_duration_seconds',
+            'Time spent decoding requests and encoding responses.',
+            'serializer', self.serialization_durations))
+        lines.append('# HELP aiojsonrpc_connections '
+                     'Number of open websocket connections.')
+        lines.append('# TYPE aiojsonrpc_connections gauge')
+        lines.append('aiojsonrpc_connections {}'.format(self.connections))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(labels):
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, _escape(value))
+                                    for name, value in labels))
+
+
+def _format_value(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def _render_counter(name, help, samples):
+    yield '# HELP {} {}'.format(name, help)
+    yield '# TYPE {} counter'.format(name)
+    for labels, value in samples:
+        yield '{}{} {}'.format(name, _format_labels(labels), value)
+
+
+def _render_histograms(name, help, label, histograms):
+    yield '# HELP {} {}'.format(name, help)
+    yield '# TYPE {} histogram'.format(name)
+    for label_value, histogram in sorted(histograms.items()):
+        for upper_bound, count in histogram.cumulative_counts():
+            yield '{}_bucket{} {}'.format(name, _format_labels((
+                (label, label_value), ('le', _format_value(upper_bound)))),
+                count)
+        labels = _format_labels(((label, label_value), ))
+        yield '{}_sum{} {!r}'.format(name, labels, histogram.sum)
+        yield '{}_count{} {}'.format(name, labels, histogram.count)
+
+
+def metrics_handler(metrics):
+    """ Creates an aiohttp handler exposing `metrics`. """
+    async def handler(request):
+        return web.Response(text=metrics.render(),
+                            content_type='text/plain')
+    return handler
@@ -0,0 +1,250 @@
+""" Websocket connections to one or more servers shared by calls.
+
+```python
+from aiojsonrpc.pool import ClientPool
+
+
+async with ClientPool(['ws://10.0.0.1:8888/ws/json-rpc',
+                       'ws://10.0.0.2:8888/ws/json-rpc'], size=4) as pool:
+    print(await pool.call('PrinterService.print', text='Hello'))
+```
+"""
+import asyncio
+import random
+from enum import Enum
+from itertools import count
+from operator import attrgetter
+from .client import Client
+
+
+class Balancing(Enum):
+    """ How a call chooses its connection:
+
+        LEAST_IN_FLIGHT  The one with the fewest calls waiting
+                         for a response.
+        ROUND_ROBIN      Each one in turn.
+    """
+    LEAST_IN_FLIGHT = 'least-in-flight'
+    ROUND_ROBIN = 'round-robin'
+
+
+class PoolConnection(object):
+    """ A connection of the pool, reconnected whenever it's lost. """
+    def __init__(self, url):
+        self.url = url
+        self.client = None
+        self.in_flight = 0
+        self.draining = False
+        self.task = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def available(self):
+        return (self.client is not None and not self.client.closed and
+                not self.draining)
+
+    def acquire(self):
+        self.in_flight += 1
+        self._idle.clear()
+
+    def release(self):
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    async def wait_idle(self):
+        await self._idle.wait()
+
+
+class ClientPool(object):
+    """ Keeps `size` connections (`aiojsonrpc.client.Client`)
+    to every one of `service_urls` and spreads calls across them
+    according to `balancing` (`Balancing` or its value).
+
+    A lost connection is reestablished with exponential backoff,
+    starting from `reconnect_delay` up to `max_reconnect_delay` seconds.
+    The backoff is reset once a connection has stayed up for
+    `max_reconnect_delay` seconds, so an endpoint accepting connections
+    and dropping them right away is redialed with growing delays too.
+    Calls wait for a connection while none is available.
+
+    Closing the pool, or removing an endpoint, drains its connections:
+    they take no new calls and are closed once the calls in flight are
+    done, or `drain_timeout` seconds have passed.
+
+    `client_params` are passed to every `Client`.
+    """
+    def __init__(self, service_urls, size=1,
+                 balancing=Balancing.LEAST_IN_FLIGHT, reconnect_delay=0.1,
+                 max_reconnect_delay=10.0, drain_timeout=None,
+                 client_factory=Client, **client_params):
+        if size < 1:
+            raise ValueError('size must be a positive integer')
+        self._service_urls = list(service_urls)
+        self._size = size
+        self._balancing = Balancing(balancing)
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._drain_timeout = drain_timeout
+        self._client_factory = client_factory
+        self._client_params = client_params
+        self._connections = []
+        self._turn = count()
+        self._changed = None
+        self._closed = True
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def connections(self):
+        return tuple(self._connections)
+
+    @property
+    def in_flight(self):
+        return sum(connection.in_flight for connection in self._connections)
+
+    def start(self):
+        self._changed = asyncio.Event()
+        self._closed = False
+        for url in self._service_urls:
+            self._connect(url)
+
+    def add(self, service_url):
+        """ Opens `size` connections to one more endpoint. """
+        self._service_urls.append(service_url)
+        if not self._closed:
+            self._connect(service_url)
+
+    async def remove(self, service_url):
+        """ Drains and closes the connections to the endpoint. """
+        self._service_urls.remove(service_url)
+        connections = [connection for connection in self._connections
+                       if connection.url == service_url]
+        await self._drain(connections)
+
+    async def close(self):
+        """ Drains and closes all the connections. """
+        self._closed = True
+        self._changed.set()
+        await self._drain(list(self._connections))
+
+    async def call(self, method, *args, timeout=None, **params):
+        """ Calls remote `method` through one of the connections,
+        see `Client.call`. `timeout` includes waiting for a connection.
+        """
+        return await self._run(timeout, lambda client, timeout: client.call(
+            method, *args, timeout=timeout, **params))
+
+    async def batch(self, calls, *, timeout=None):
+        """ Sends all the `calls` through one connection,
+        see `Client.batch`.
+        """
+        return await self._run(timeout, lambda client, timeout: client.batch(
+            calls, timeout=timeout))
+
+    async def notify(self, method, *args, **params):
+        """ Sends a notification through one of the connections. """
+        connection = await self._acquire()
+        try:
+            connection.client.notify(method, *args, **params)
+        finally:
+            connection.release()
+
+    async def _run(self, timeout, call):
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        if timeout is None:
+            connection = await self._acquire()
+        else:
+            connection = await asyncio.wait_for(self._acquire(), timeout)
+            timeout -= loop.time() - started
+            if timeout <= 0:
+                connection.release()
+                raise asyncio.TimeoutError()
+        try:
+            return await call(connection.client, timeout)
+        finally:
+            connection.release()
+
+    async def _acquire(self):
+        while True:
+            connection = self._choose()
+            if connection is not None:
+                connection.acquire()
+                return connection
+            if self._closed:
+                raise ConnectionError('client pool is closed')
+            self._changed.clear()
+            await self._changed.wait()
+
+    def _choose(self):
+        available = [connection for connection in self._connections
+                     if connection.available]
+        if not available:
+            return None
+        turn = next(self._turn) % len(available)
+        if self._balancing is Balancing.ROUND_ROBIN:
+            return available[turn]
+        return min(available[turn:] + available[:turn],
+                   key=attrgetter('in_flight'))
+
+    def _connect(self, url):
+        for _ in range(self._size):
+            connection = PoolConnection(url)
+            connection.task = asyncio.ensure_future(
+                self._keep_connected(connection))
+            self._connections.append(connection)
+
+    async def _keep_connected(self, connection):
+        loop = asyncio.get_event_loop()
+        delay = self._reconnect_delay
+        while not connection.draining:
+            client = self._client_factory(connection.url,
+                                          **self._client_params)
+            try:
+                await client.__aenter__()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('connection to {} failed '
+                      'with exception {}'.format(connection.url, e))
+                delay = await self._back_off(delay)
+                continue
+            connection.client = client
+            self._changed.set()
+            connected_at = loop.time()
+            try:
+                await client.wait_closed()
+            finally:
+                if not connection.draining:
+                    connection.client = None
+                    await client.__aexit__(None, None, None)
+            if loop.time() - connected_at >= self._max_reconnect_delay:
+                delay = self._reconnect_delay
+            elif not connection.draining:
+                delay = await self._back_off(delay)
+
+    async def _back_off(self, delay):
+        """ Sleeps about `delay` seconds and returns the next delay. """
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+        return min(delay * 2, self._max_reconnect_delay)
+
+    async def _drain(self, connections):
+        for connection in connections:
+            connection.draining = True
+        if connections:
+            await asyncio.wait([connection.wait_idle()
+                                for connection in connections],
+                               timeout=self._drain_timeout)
+        for connection in connections:
+            connection.task.cancel()
+            client, connection.client = connection.client, None
+            if client is not None:
+                await client.__aexit__(None, None, None)
+            self._connections.remove(connection)
@@ -1,131 +1,787 @@
 import aiohttp
+import asyncio
+from collections import OrderedDict
+from functools import partial
+from time import perf_counter
+from aiohttp import web
 from aiohttp.web import WebSocketResponse
 from .exception import RpcError
 from .exception import RpcErrorCode
-from .serializer import json
-from .serializer import msgpack
+from . import serializer as serializers_registry
+from .cache import MISSING
+from .cancellation import InFlightCalls
+from .connection import UNKNOWN
+from .connection import ConnectionRegistry
+from .connection import send_payload
 from .constants import JSON_RPC_VERSION
+from .constants import ACK_METHOD
+from .constants import CANCEL_METHOD
+from .constants import UNSUBSCRIBE_METHOD
+from .dispatch import ServiceFactory
+from .dispatch import ServiceMap
+from .dispatch import create_dispatch_table
+from .single_flight import SingleFlight
+from .stream import DEFAULT_WINDOW
+from .stream import Streams
+from .subscription import Subscription
+from .subscription import Subscriptions
 from .util import raise_method_not_found
 
 
+_current_task = getattr(asyncio, 'current_task', None) or (
+    asyncio.Task.current_task)
+
+
+def _is_shareable(result):
+    # A subscription belongs to the connection it's pushed to.
+    return not isinstance(result, Subscription)
+
+
 class WebSocketMessageHandler(object):
-    def __init__(self, bytes_serializer=msgpack, str_serializer=json):
+    """ Handles JSON-RPC messages of websocket connections.
+
+    Binary and text frames are handled by `bytes_serializer` and
+    `str_serializer` respectively, unless a connection negotiates one of
+    `serializers` through the websocket subprotocol. Serializers are
+    given either as objects or as names from `aiojsonrpc.serializer`
+    registry, `serializers` defaults to all the registered ones.
+    HTTP requests are served by the one matching their `Content-Type`.
+
+    Calls, errors and timings are recorded in `metrics`
+    (`aiojsonrpc.metrics.Metrics`) if given.
+
+    A call is cancelled with a "request timeout" error once
+    the `timeout` member of the request (seconds) has passed.
+    """
+    def __init__(self, bytes_serializer='msgpack', str_serializer='json',
+                 serializers=None, metrics=None):
         self.set_bytes_serializer(bytes_serializer)
         self.set_str_serializer(str_serializer)
+        self.set_serializers(serializers or serializers_registry.names())
+        self._metrics = metrics
+        self._builtins = {
+            UNSUBSCRIBE_METHOD: self._unsubscribe,
+            ACK_METHOD: self._ack,
+            CANCEL_METHOD: self._cancel,
+        }
 
-    async def handle_message(self, ws, msg, services):
+    @property
+    def metrics(self):
+        return self._metrics
+
+    async def handle_message(self, ws, msg, services, serializer=None):
         if msg.tp == aiohttp.MsgType.text:
             if msg.data == 'close':
                 await ws.close()
             else:
-                ws.send_str(await self._call_service(services, msg.data,
-                                                     self._str_serializer))
+                await self._handle_data(ws, msg.data, services,
+                                        serializer or self._str_serializer)
         elif msg.tp == aiohttp.MsgType.binary:
-            ws.send_bytes(await self._call_service(services, msg.data,
-                                                   self._bytes_serializer))
+            await self._handle_data(ws, msg.data, services,
+                                    serializer or self._bytes_serializer)
         elif msg.tp == aiohttp.MsgType.error:
             print('ws connection closed '
                   'with exception {}'.format(ws.exception()))
         return ws
 
+    async def handle_data(self, data, services, serializer):
+        """ Returns the serialized response to the request `data`,
+        or `None` if there's nothing to respond with.
+        """
+        return await self._call_service(services, data, serializer)
+
+    async def _handle_data(self, ws, data, services, serializer):
+        pushes = (None if getattr(services, 'subscriptions', None) is None
+                  else [])
+        response = await self._call_service(services, data, serializer,
+                                            pushes)
+        if response is not None:
+            send_payload(ws, response)
+        for start in pushes or ():
+            start(partial(self._push, ws, serializer))
+
+    def _push(self, ws, serializer, notification):
+        if not ws.closed:
+            send_payload(ws, serializer.dumps(notification))
+
+    def frame_serializer(self, msg):
+        """ Returns the default serializer of messages of the type
+        of `msg`, or `None` if it isn't a data frame.
+        """
+        if msg.tp == aiohttp.MsgType.text:
+            return self._str_serializer
+        if msg.tp == aiohttp.MsgType.binary:
+            return self._bytes_serializer
+        return None
+
     def set_bytes_serializer(self, serializer):
-        self._bytes_serializer = serializer
+        self._bytes_serializer = serializers_registry.resolve(serializer)
 
     def set_str_serializer(self, serializer):
-        self._str_serializer = serializer
+        self._str_serializer = serializers_registry.resolve(serializer)
+
+    def set_serializers(self, serializers):
+        self._serializers = OrderedDict(
+            (serializer.name, serializer) for serializer
+            in map(serializers_registry.resolve, serializers))
+        self._content_types = OrderedDict()
+        for serializer in self._serializers.values():
+            content_type = getattr(serializer, 'content_type', None)
+            if content_type is not None:
+                self._content_types.setdefault(content_type, serializer)
+
+    @property
+    def protocols(self):
+        """ Websocket subprotocols to negotiate a serializer with. """
+        return tuple(self._serializers)
+
+    def negotiate(self, protocol):
+        """ Returns the serializer for the subprotocol
+        chosen for a connection or `None` to use the defaults.
+        """
+        return self._serializers.get(protocol)
+
+    def negotiate_content_type(self, content_type):
+        """ Returns the serializer for the `Content-Type`
+        of an HTTP request or `None` if there's no such serializer.
+        """
+        return self._content_types.get(content_type)
+
+    def load_request(self, data, serializer):
+        try:
+            return serializer.loads(data)
+        except (ValueError, TypeError):
+            raise RpcError('Parse error', RpcErrorCode.PARSE_ERROR)
 
     def parse_request(self, data, serializer):
-        request = serializer.loads(data)
-        return request['method'], request['params'], request['id']
+        """ Returns `(method, params, id)` of the serialized request. """
+        return self.parse_request_object(self.load_request(data, serializer))
+
+    def parse_request_object(self, request):
+        """ Returns `(method, params, id)` of the request object.
+        `id` is `None` for notifications, see `is_notification`.
+        """
+        try:
+            method = request['method']
+            params = request.get('params', {})
+            id = request.get('id')
+        except (KeyError, TypeError, AttributeError):
+            method = None
+        if not isinstance(method, str):
+            raise RpcError('Invalid Request', RpcErrorCode.INVALID_REQUEST)
+        return method, params, id
+
+    def parse_timeout(self, request):
+        """ Returns the `timeout` of the request in seconds, if any. """
+        timeout = request.get('timeout')
+        if timeout is None:
+            return None
+        if (isinstance(timeout, bool) or
+                not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise RpcError('Invalid Request', RpcErrorCode.INVALID_REQUEST)
+        return timeout
+
+    def is_notification(self, request):
+        return isinstance(request, dict) and 'id' not in request
 
     def create_result(self, id, result, serializer):
-        return serializer.dumps({
+        envelope = getattr(serializer, 'envelope', None)
+        if envelope is None:
+            return serializer.dumps(self._result(id, result))
+        return envelope.result(id, result)
+
+    def create_error(self, id, message, code, serializer):
+        envelope = getattr(serializer, 'envelope', None)
+        if envelope is None:
+            return serializer.dumps(self._error(id, message, code))
+        return envelope.error(id, code.value, message)
+
+    def create_batch(self, responses, serializer):
+        """ Joins serialized responses into a serialized array. """
+        envelope = getattr(serializer, 'envelope', None)
+        if envelope is None:
+            return serializer.dumps([serializer.loads(response)
+                                     for response in responses])
+        return envelope.batch(responses)
+
+    def _result(self, id, result):
+        return {
             'jsonrpc': JSON_RPC_VERSION,
             'result': result,
             'id': id,
-        })
+        }
 
-    def create_error(self, id, message, code, serializer):
-        return serializer.dumps({
+    def _error(self, id, message, code):
+        return {
             'jsonrpc': JSON_RPC_VERSION,
             'error': {
                 'code': code.value,
                 'message': message,
             },
             'id': id,
-        })
+        }
 
-    async def _call_service(self, services, data, serializer):
-        method, params, id = self.parse_request(data, serializer)
+    async def _call_service(self, services, data, serializer, pushes=None):
+        """ Returns the serialized response to `data`, if any.
+
+        Subscriptions and streams of the called methods are registered
+        and their `start(send)` functions appended to `pushes`, to be called
+        once the response is sent. Without `pushes` neither server push
+        nor streaming is supported.
+        """
+        if not isinstance(services, ServiceMap):
+            services = ServiceMap.from_instances(services)
         try:
+            request = self._decode_request(data, serializer)
+        except RpcError as e:
+            if self._metrics is not None:
+                self._metrics.observe_error(None, e.rpc_error_code)
+            return self._encode_response(self.create_error, serializer,
+                                         None, e.rpc_error_message,
+                                         e.rpc_error_code)
+        if isinstance(request, list):
+            return await self._call_batch(services, request, serializer,
+                                          pushes)
+        return await self._dispatch(services, request, serializer, pushes)
+
+    def _decode_request(self, data, serializer):
+        if self._metrics is None:
+            return self.load_request(data, serializer)
+        started = perf_counter()
+        try:
+            return self.load_request(data, serializer)
+        finally:
+            self._metrics.observe_serialization(serializer,
+                                                perf_counter() - started)
+
+    def _encode_response(self, create_response, serializer, *args):
+        if self._metrics is None:
+            return create_response(*args, serializer)
+        started = perf_counter()
+        response = create_response(*args, serializer)
+        self._metrics.observe_serialization(serializer,
+                                            perf_counter() - started)
+        return response
+
+    def _dump(self, data, serializer):
+        return serializer.dumps(data)
+
+    async def _call_batch(self, services, requests, serializer,
+                          pushes=None):
+        """ Runs the requests of a batch concurrently
+        and returns all the responses in one array,
+        or `None` if the batch consists of notifications only.
+        Responses of streamed calls are sent separately
+        when their streams end.
+        """
+        if not requests:
+            return self.create_error(None, 'Invalid Request',
+                                     RpcErrorCode.INVALID_REQUEST, serializer)
+        responses = [response for response in await asyncio.gather(*(
+                         self._dispatch(services, request, serializer, pushes)
+                         for request in requests))
+                     if response is not None]
+        return self.create_batch(responses, serializer) if responses else None
+
+    async def _dispatch(self, services, request, serializer, pushes=None):
+        """ Calls the requested method and returns the serialized response,
+        or `None` for a notification or a streamed call.
+        An unexpected exception of the call gets an "Internal error"
+        response, so the connection and the rest of a batch aren't affected.
+        """
+        id = request.get('id') if isinstance(request, dict) else None
+        is_notification = self.is_notification(request)
+        rpc_method = None
+        try:
+            method, params, id = self.parse_request_object(request)
+            timeout = self.parse_timeout(request)
+            builtin = self._builtins.get(method)
+            if builtin is not None:
+                result = builtin(services, method, params)
+                if is_notification:
+                    return None
+                return self._encode_response(self.create_result, serializer,
+                                             id, result)
             try:
-                service_name, method_name = method.split('.')
-            except ValueError as e:
-                raise_method_not_found(method)
-            try:
-                service_instance = services[service_name]
+                rpc_method = services.methods[method]
+                service_instance = services[rpc_method.service_name]
             except KeyError:
                 raise_method_not_found(method)
-            result = await service_instance(method_name, **params)
-            return self.create_result(id, result, serializer)
+            if rpc_method.cache is not None and not is_notification:
+                return await self._call_cached(services, rpc_method,
+                                               service_instance, params,
+                                               id, serializer, timeout)
+            result = await self._call_in_flight(services, rpc_method,
+                                                service_instance, params,
+                                                id, timeout)
+            if rpc_method.is_stream and not is_notification:
+                return self._stream(services, request, result, pushes)
+            if isinstance(result, Subscription):
+                result = self._subscribe(services, result, is_notification,
+                                         pushes)
+            if is_notification:
+                return None
+            return self._encode_response(self.create_result, serializer,
+                                         id, result)
         except RpcError as e:
-            return self.create_error(id, e.rpc_error_message,
-                                     e.rpc_error_code, serializer)
+            if self._metrics is not None:
+                self._metrics.observe_error(rpc_method and rpc_method.name,
+                                            e.rpc_error_code)
+            if is_notification:
+                return None
+            return self._encode_response(self.create_error, serializer,
+                                         id, e.rpc_error_message,
+                                         e.rpc_error_code)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print('rpc call failed with exception {!r}'.format(e))
+            if self._metrics is not None:
+                self._metrics.observe_error(rpc_method and rpc_method.name,
+                                            RpcErrorCode.INTERNAL_ERROR)
+            if is_notification:
+                return None
+            return self._encode_response(self.create_error, serializer,
+                                         id, 'Internal error',
+                                         RpcErrorCode.INTERNAL_ERROR)
+
+    def _subscribe(self, services, subscription, is_notification, pushes):
+        """ Registers the subscription and returns its id. """
+        if pushes is None:
+            subscription.close()
+            raise RpcError('Subscriptions are not supported',
+                           RpcErrorCode.INVALID_REQUEST)
+        if is_notification:
+            subscription.close()
+            return None
+        id = services.subscriptions.add(subscription)
+        pushes.append(partial(services.subscriptions.start, subscription))
+        return id
+
+    def _stream(self, services, request, source, pushes):
+        """ Registers the stream of the request, its response
+        is sent when the stream ends.
+        """
+        if pushes is None or services.streams is None:
+            raise RpcError('Streaming is not supported',
+                           RpcErrorCode.INVALID_REQUEST)
+        stream = services.streams.add(request['id'], source,
+                                      request.get('window'))
+        pushes.append(partial(services.streams.start, stream))
+        return None
+
+    def _get_builtin_param(self, params, name):
+        try:
+            return params[name]
+        except (KeyError, TypeError):
+            raise RpcError('Invalid params', RpcErrorCode.INVALID_PARAMS)
+
+    def _unsubscribe(self, services, method, params):
+        if services.subscriptions is None:
+            raise_method_not_found(method)
+        return services.subscriptions.cancel(
+            self._get_builtin_param(params, 'subscription'))
+
+    def _ack(self, services, method, params):
+        if services.streams is None:
+            raise_method_not_found(method)
+        credit = self._get_builtin_param(params, 'credit')
+        if not isinstance(credit, int) or credit < 1:
+            raise RpcError('Invalid params', RpcErrorCode.INVALID_PARAMS)
+        return services.streams.ack(self._get_builtin_param(params, 'id'),
+                                    credit)
+
+    def _cancel(self, services, method, params):
+        if services.streams is None and services.calls is None:
+            raise_method_not_found(method)
+        id = self._get_builtin_param(params, 'id')
+        return ((services.streams is not None and
+                 services.streams.cancel(id)) or
+                (services.calls is not None and services.calls.cancel(id)))
+
+    async def _call_cached(self, services, rpc_method, service, params, id,
+                           serializer, timeout=None):
+        """ Returns the response from the result cache of the method,
+        calling it on a cache miss. Results are cached serialized
+        for serializers providing an envelope.
+        """
+        cache = rpc_method.cache
+        key = cache.make_key(rpc_method.named_params(params))
+        envelope = getattr(serializer, 'envelope', None)
+        namespace = getattr(serializer, 'name', None)
+        cached = MISSING if key is None else cache.get(namespace, key)
+        if cached is MISSING:
+            result = await self._call_in_flight(services, rpc_method,
+                                                service, params, id, timeout)
+            if envelope is None:
+                cached = result
+            else:
+                cached = self._encode_response(self._dump, serializer,
+                                               result)
+            if key is not None:
+                cache.set(namespace, key, cached)
+        if envelope is None:
+            return self._encode_response(self.create_result, serializer,
+                                         id, cached)
+        return envelope.serialized_result(id, cached)
+
+    async def _call_in_flight(self, services, rpc_method, service, params,
+                              id=None, timeout=None):
+        """ Calls the method within `timeout` seconds, if given.
+        On connections tracking in-flight calls the client can cancel
+        the call by its `id`.
+        """
+        calls = services.calls
+        tracked = (calls is not None and id is not None and
+                   calls.add(id, _current_task()))
+        if not tracked and timeout is None:
+            return await self._call_method(services, rpc_method, service,
+                                           params)
+        try:
+            if timeout is None:
+                return await self._call_method(services, rpc_method, service,
+                                               params)
+            return await asyncio.wait_for(
+                self._call_method(services, rpc_method, service, params),
+                timeout)
+        except asyncio.TimeoutError:
+            raise RpcError('Request timeout', RpcErrorCode.REQUEST_TIMEOUT)
+        except asyncio.CancelledError:
+            if tracked and calls.was_cancelled(id):
+                raise RpcError('Request cancelled',
+                               RpcErrorCode.REQUEST_CANCELLED)
+            raise
+        finally:
+            if tracked:
+                calls.discard(id)
+
+    async def _call_method(self, services, rpc_method, service, params):
+        if self._metrics is None:
+            return await self._call_coalesced(services, rpc_method, service,
+                                              params)
+        started = perf_counter()
+        try:
+            return await self._call_coalesced(services, rpc_method, service,
+                                              params)
+        finally:
+            self._metrics.observe_call(rpc_method.name,
+                                       perf_counter() - started)
+
+    async def _call_coalesced(self, services, rpc_method, service, params):
+        if services.single_flight is None or rpc_method.is_stream:
+            return await self._call_limited(services, rpc_method, service,
+                                            params)
+        return await services.single_flight.run(
+            rpc_method.name, rpc_method.named_params(params),
+            partial(self._call_limited, services, rpc_method, service,
+                    params),
+            _is_shareable)
 
+    async def _call_limited(self, services, rpc_method, service, params):
+        limits = services.limits
+        if limits is None:
+            return await rpc_method(service, params, services.context)
+        if not limits.acquire(rpc_method.service_name):
+            raise RpcError('Server busy', RpcErrorCode.SERVER_BUSY)
+        try:
+            return await rpc_method(service, params, services.context)
+        finally:
+            limits.release(rpc_method.service_name)
+
+
+class RpcHandler(object):
+    """ Services served by a transport handler, see `RpcWebsocketHandler`
+    and `RpcHttpHandler`.
 
-class RpcWebsocketHandler(object):
-    def __init__(self, ws_msg_handler, services=None):
+    Pass `limits` (`aiojsonrpc.limits.Limits`) to reject calls
+    with a "server busy" error, once too many of them are in flight.
+
+    With `single_flight` enabled identical concurrent calls (same method
+    and params) of all the clients share one execution. Only enable it
+    when results don't depend on the connection context.
+    """
+    def __init__(self, ws_msg_handler, services=None, limits=None,
+                 metrics=None, single_flight=False):
         self._ws_msg_handler = ws_msg_handler or WebSocketMessageHandler()
+        self._limits = limits
+        self._metrics = metrics
+        self._single_flight = SingleFlight() if single_flight else None
         self._services = {}
+        self._service_options = {}
+        self._service_factories = {}
+        self._methods = create_dispatch_table(self._services)
         try:
             self.register_services(services)
         except TypeError:
             pass
 
-    async def __call__(self, request):
-        self._request = request
-        ws = WebSocketResponse()
-        await ws.prepare(request)
-        await self._save_websocket(ws)
-        try:
-            await self._handle_ws(ws)
-        finally:
-            await self._remove_websocket(ws)
-        print('websocket connection closed')
-        return ws
-
     def register_services(self, services):
         for service in services:
             self.register_service(service)
 
-    def register_service(self, service):
+    def register_service(self, service, lifetime=None, **options):
+        """ Registers the service class.
+
+        `lifetime` (`ServiceLifetime` or its value) overrides
+        the `lifetime` attribute of the service class, which defaults
+        to an instance per connection created on first call.
+
+        `options` are the defaults for the options of `rpc_method`
+        for all the methods of the service, e.g. `executor=thread_pool`
+        to run all its non-coroutine methods in a thread pool.
+        """
         self._services[service.__name__] = service
+        self._service_factories[service.__name__] = ServiceFactory(service,
+                                                                   lifetime)
+        self._service_options[service.__name__] = options
+        self._methods = create_dispatch_table(self._services,
+                                              self._service_options)
         return self._services
 
-    async def _save_websocket(self, ws):
-        self._request.app['websockets'].append(ws)
+    @property
+    def limits(self):
+        return self._limits
 
-    async def _remove_websocket(self, ws):
-        self._request.app['websockets'].remove(ws)
+    @property
+    def methods(self):
+        """ Read-only mapping of `Service.method` names
+        to the registered rpc methods.
+        """
+        return self._methods
 
     def _create_context(self, request, **context) -> dict:
         return {**request.get('_context', {}), **context}
 
     def _get_services(self, **context):
-        return {name: cls(**context) for name, cls in self._services.items()}
+        return ServiceMap(self._methods,
+                          factories=self._service_factories,
+                          context=context,
+                          limits=(None if self._limits is None
+                                  else self._limits.connection()),
+                          single_flight=self._single_flight)
+
+
+class RpcWebsocketHandler(RpcHandler):
+    """ Serves JSON-RPC over a websocket connection.
+
+    By default messages of a connection are handled one by one.
+    Pass `concurrency` to handle up to that many messages of a connection
+    concurrently: every message is dispatched as a separate task and
+    responses are sent as soon as they are ready, to be matched by `id`
+    on the client side. When the limit is reached the handler stops reading
+    from the socket until one of the in-flight calls is done.
+    The client can then cancel an in-flight call with `rpc.cancel`.
+    Calls still in flight when the connection closes are cancelled.
+
+    Pass `limits` (`aiojsonrpc.limits.Limits`) to reject calls
+    with a "server busy" error instead, once too many of them are in flight.
+
+    Open connections are counted in `metrics` if given.
+
+    Open connections are kept in `connections`
+    (`aiojsonrpc.connection.ConnectionRegistry`), or in `app['websockets']`
+    (a `ConnectionRegistry` or a list) if not given.
+    `connection_tags(context)` returns the tags of a new connection.
+    A connection that didn't negotiate a serializer is skipped by
+    `ConnectionRegistry.publish` until its first message, whose frame type
+    tells whether it uses the text or the bytes serializer.
+
+    Methods can push notifications to the client by returning
+    a `aiojsonrpc.subscription.Subscription`. Async generator methods
+    stream their items (`aiojsonrpc.stream`), up to `stream_window`
+    of them ahead of the client.
+
+    With `single_flight` enabled identical concurrent calls (same method
+    and params) of all the connections share one execution. Only enable it
+    when results don't depend on the connection context.
+
+    `ws_params` are passed to the `WebSocketResponse`, e.g.
+    `{'compress': True}` enables permessage-deflate on aiohttp versions
+    supporting it. Compression of large messages only is provided by
+    `aiojsonrpc.serializer.deflate`.
+    """
+    def __init__(self, ws_msg_handler, services=None, concurrency=None,
+                 limits=None, metrics=None, single_flight=False,
+                 connections=None, connection_tags=None,
+                 stream_window=DEFAULT_WINDOW, ws_params=None):
+        if concurrency is not None and concurrency < 1:
+            raise ValueError('concurrency must be a positive integer')
+        self._concurrency = concurrency
+        self._connections = connections
+        self._connection_tags = connection_tags or (lambda context: ())
+        self._stream_window = stream_window
+        self._ws_params = ws_params or {}
+        super().__init__(ws_msg_handler, services=services, limits=limits,
+                         metrics=metrics, single_flight=single_flight)
+
+    async def __call__(self, request):
+        ws = WebSocketResponse(protocols=self._ws_msg_handler.protocols,
+                               **self._ws_params)
+        await ws.prepare(request)
+        context = self._create_context(request)
+        serializer = self._ws_msg_handler.negotiate(ws.protocol)
+        connections = self._get_connections(request)
+        await self._save_websocket(ws, connections, context, serializer)
+        if self._metrics is not None:
+            self._metrics.connection_opened()
+        try:
+            await self._handle_ws(ws, context, serializer, connections)
+        finally:
+            if self._metrics is not None:
+                self._metrics.connection_closed()
+            await self._remove_websocket(ws, connections)
+        print('websocket connection closed')
+        return ws
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def _get_connections(self, request):
+        if self._connections is not None:
+            return self._connections
+        return request.app['websockets']
+
+    async def _save_websocket(self, ws, connections, context,
+                              serializer=None):
+        if isinstance(connections, ConnectionRegistry):
+            connections.add(ws, serializer=serializer or UNKNOWN,
+                            tags=self._connection_tags(context))
+        else:
+            connections.append(ws)
+
+    async def _remove_websocket(self, ws, connections):
+        if isinstance(connections, ConnectionRegistry):
+            connections.discard(ws)
+        else:
+            connections.remove(ws)
+
+    def _get_services(self, **context):
+        services = super()._get_services(**context)
+        services.subscriptions = Subscriptions()
+        services.streams = Streams(self._stream_window)
+        if self._concurrency is not None:
+            services.calls = InFlightCalls()
+        return services
 
-    async def _handle_ws(self, ws):
-        context = self._create_context(self._request)
+    async def _handle_ws(self, ws, context, serializer=None,
+                         connections=None):
+        """ Handles the messages of the connection. Without a negotiated
+        `serializer` its serializer in `connections` is set
+        by the type of the first data frame it sends.
+        """
         _services = self._get_services(**context)
-        async for msg in ws:
-            await self._ws_msg_handler.handle_message(ws, msg, _services)
+        unknown = (serializer is None and
+                   isinstance(connections, ConnectionRegistry))
+        try:
+            if self._concurrency is None:
+                async for msg in ws:
+                    if unknown:
+                        unknown = not self._set_serializer(ws, msg,
+                                                           connections)
+                    await self._ws_msg_handler.handle_message(
+                        ws, msg, _services, serializer)
+            else:
+                await self._handle_ws_concurrently(
+                    ws, _services, serializer,
+                    connections if unknown else None)
+        finally:
+            _services.subscriptions.close()
+            _services.streams.close()
+        return ws
+
+    def _set_serializer(self, ws, msg, connections):
+        """ Returns whether the serializer of the connection is known. """
+        serializer = self._ws_msg_handler.frame_serializer(msg)
+        if serializer is None or ws not in connections:
+            return False
+        connections.set_serializer(ws, serializer)
+        return True
+
+    async def _handle_ws_concurrently(self, ws, services, serializer,
+                                      connections=None):
+        semaphore = asyncio.Semaphore(self._concurrency)
+        pending = set()
+
+        def on_done(task):
+            pending.discard(task)
+            semaphore.release()
+            if not task.cancelled() and task.exception() is not None:
+                print('rpc message handling failed '
+                      'with exception {}'.format(task.exception()))
+
+        try:
+            async for msg in ws:
+                if (connections is not None and
+                        self._set_serializer(ws, msg, connections)):
+                    connections = None
+                await semaphore.acquire()
+                task = asyncio.ensure_future(
+                    self._ws_msg_handler.handle_message(ws, msg, services,
+                                                        serializer))
+                pending.add(task)
+                task.add_done_callback(on_done)
+        finally:
+            # The client is gone, so are the responses to its calls.
+            if pending:
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
         return ws
 
 
-def create_rpc_websocket_handler(ws_msg_handler, services=None):
-    return RpcWebsocketHandler(ws_msg_handler, services=services)
+class RpcHttpHandler(RpcHandler):
+    """ Serves JSON-RPC over HTTP POST requests.
+
+    The request is deserialized by the serializer of the message handler
+    whose `content_type` matches the `Content-Type` of the request,
+    the response is serialized with the same one. A request consisting
+    of notifications only is answered with "204 No Content".
+    Keep-alive connections are handled by aiohttp.
+
+    Every request gets its own services, so services with the
+    `CONNECTION` lifetime live as long as the request. Subscriptions
+    and streaming require a websocket connection.
+    """
+    async def __call__(self, request):
+        serializer = self._ws_msg_handler.negotiate_content_type(
+            request.content_type)
+        if serializer is None:
+            raise web.HTTPUnsupportedMediaType()
+        data = await request.read()
+        if not serializer.binary:
+            try:
+                data = data.decode(request.charset or 'utf-8')
+            except UnicodeDecodeError:
+                raise web.HTTPBadRequest()
+        response = await self._ws_msg_handler.handle_data(
+            data, self._get_services(**self._create_context(request)),
+            serializer)
+        if response is None:
+            return web.Response(status=204)
+        if isinstance(response, bytes):
+            return web.Response(body=response,
+                                content_type=serializer.content_type)
+        return web.Response(text=response,
+                            content_type=serializer.content_type)
+
+
+def create_rpc_websocket_handler(ws_msg_handler, services=None, **kwargs):
+    return RpcWebsocketHandler(ws_msg_handler, services=services, **kwargs)
+
+
+def create_default_rpc_websocket_handler(services=None, metrics=None,
+                                         **kwargs):
+    return create_rpc_websocket_handler(
+        WebSocketMessageHandler(metrics=metrics), services=services,
+        metrics=metrics, **kwargs)
+
+
+def create_rpc_http_handler(ws_msg_handler, services=None, **kwargs):
+    return RpcHttpHandler(ws_msg_handler, services=services, **kwargs)
 
 
-def create_default_rpc_websocket_handler(services=None):
-    return create_rpc_websocket_handler(WebSocketMessageHandler(),
-                                        services=services)
+def create_default_rpc_http_handler(services=None, metrics=None, **kwargs):
+    return create_rpc_http_handler(
+        WebSocketMessageHandler(metrics=metrics), services=services,
+        metrics=metrics, **kwargs)
@@ -0,0 +1,4 @@
+from .registry import get
+from .registry import names
+from .registry import register
+from .registry import resolve
@@ -0,0 +1,86 @@
+""" Per-message compression on top of any serializer.
+
+```python
+from aiojsonrpc import serializer
+from aiojsonrpc.client import Client
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.serializer.deflate import DeflateSerializer
+
+
+json_deflate = DeflateSerializer(json, threshold=4096)
+msg_handler = WebSocketMessageHandler(
+    serializers=serializer.names() + (json_deflate, ))
+client = Client(url, serializer=DeflateSerializer(json, threshold=1024))
+```
+
+Messages of at least `threshold` bytes are compressed with zlib,
+smaller ones are sent as they are, so tiny frames don't pay
+for compression. The serializer is negotiated as `<name>+deflate`
+websocket subprotocol and the threshold (and `level`) is chosen
+independently by each side. Messages are always sent as binary frames.
+
+A compressed message is decompressed to at most `max_size` bytes,
+a larger one is rejected as invalid, so a small frame can't expand
+into an arbitrary amount of memory.
+
+A compressed message is told apart by the zlib header (`0x78`),
+which can't start a JSON document nor a msgpack map or array.
+
+This works with any aiohttp version. aiohttp 3 can also compress whole
+connections with the permessage-deflate extension, see `ws_params`
+of `RpcWebsocketHandler` and `Client`, but can't skip small frames.
+"""
+import zlib
+from .registry import resolve
+
+
+DEFAULT_THRESHOLD = 1024
+DEFAULT_LEVEL = 1
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+_ZLIB_HEADER = 0x78
+
+
+class DeflateSerializer(object):
+    """ Compresses the messages of `serializer` (an object or a name
+    from `aiojsonrpc.serializer` registry) of at least `threshold` bytes
+    with zlib compression `level`. Received messages decompressing
+    to more than `max_size` bytes are rejected.
+    """
+    binary = True
+
+    def __init__(self, serializer, threshold=DEFAULT_THRESHOLD,
+                 level=DEFAULT_LEVEL, max_size=DEFAULT_MAX_SIZE):
+        self.serializer = resolve(serializer)
+        self.name = '{}+deflate'.format(self.serializer.name)
+        self.threshold = threshold
+        self.level = level
+        self.max_size = max_size
+        self._binary = self.serializer.binary
+
+    def dumps(self, obj):
+        data = self.serializer.dumps(obj)
+        if not self._binary:
+            data = data.encode('utf-8')
+        if len(data) < self.threshold:
+            return data
+        return zlib.compress(data, self.level)
+
+    def loads(self, data):
+        if isinstance(data, str):
+            return self.serializer.loads(data)
+        if data[:1] and data[0] == _ZLIB_HEADER:
+            decompressor = zlib.decompressobj()
+            try:
+                data = decompressor.decompress(data, self.max_size)
+            except zlib.error as e:
+                raise ValueError('Invalid compressed message: {}'.format(e))
+            if decompressor.unconsumed_tail:
+                raise ValueError('Compressed message exceeds {} bytes'.format(
+                    self.max_size))
+        if not self._binary:
+            data = bytes(data).decode('utf-8')
+        return self.serializer.loads(data)
+
+    serialize = loads
+    deserialize = dumps
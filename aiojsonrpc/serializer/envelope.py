@@ -0,0 +1,154 @@
+""" Fast encoders of JSON-RPC response envelopes.
+
+Instead of building and serializing a response dict per reply, only
+the result (or error) and the id are serialized and spliced into
+precomputed envelope templates. Serialized error objects of the standard
+errors, with their fixed messages, are cached.
+The parts are joined at once, so a large result is copied only once.
+
+An envelope provides:
+    - result(id, result): a serialized result response;
+    - serialized_result(id, data): a result response
+      of an already serialized result;
+    - error(id, code, message): a serialized error response;
+    - batch(responses): a serialized array of serialized responses.
+"""
+from struct import pack
+from ..constants import JSON_RPC_VERSION
+from ..exception import RpcErrorCode
+
+
+_STANDARD_ERRORS = frozenset((code.value, message) for code, message in (
+    (RpcErrorCode.PARSE_ERROR, 'Parse error'),
+    (RpcErrorCode.INVALID_REQUEST, 'Invalid Request'),
+    (RpcErrorCode.METHOD_NOT_FOUND, 'Method not found'),
+    (RpcErrorCode.INVALID_PARAMS, 'Invalid params'),
+    (RpcErrorCode.INTERNAL_ERROR, 'Internal error'),
+    (RpcErrorCode.SERVER_BUSY, 'Server busy'),
+    (RpcErrorCode.REQUEST_TIMEOUT, 'Request timeout'),
+    (RpcErrorCode.REQUEST_CANCELLED, 'Request cancelled'),
+))
+
+
+class _Envelope(object):
+    def __init__(self, dumps):
+        self._dumps = dumps
+        self._errors = {}
+
+    def _dump_error(self, code, message):
+        key = (code, message)
+        try:
+            return self._errors[key]
+        except KeyError:
+            pass
+        error = self._dumps({'code': code, 'message': message})
+        if key in _STANDARD_ERRORS:
+            self._errors[key] = error
+        return error
+
+
+class JsonEnvelope(_Envelope):
+    def __init__(self, dumps, binary=False):
+        super().__init__(dumps)
+        self._binary = binary
+        version = '{}:{}'.format(self._dump_str('jsonrpc'),
+                                 self._dump_str(JSON_RPC_VERSION))
+        self._result_prefix = self._text(
+            '{{{},{}:'.format(version, self._dump_str('result')))
+        self._error_prefix = self._text(
+            '{{{},{}:'.format(version, self._dump_str('error')))
+        self._id_prefix = self._text(',{}:'.format(self._dump_str('id')))
+        self._suffix = self._text('}')
+        self._separator = self._text(',')
+        self._array_start = self._text('[')
+        self._array_end = self._text(']')
+        self._empty = self._text('')
+
+    def _text(self, value):
+        return value.encode('utf-8') if self._binary else value
+
+    def _dump_str(self, value):
+        dumped = self._dumps(value)
+        return dumped.decode('utf-8') if self._binary else dumped
+
+    def _dump_id(self, id):
+        if type(id) is int:
+            return self._text(str(id))
+        return self._dumps(id)
+
+    def result(self, id, result):
+        return self.serialized_result(id, self._dumps(result))
+
+    def serialized_result(self, id, data):
+        return self._empty.join((self._result_prefix, data, self._id_prefix,
+                                 self._dump_id(id), self._suffix))
+
+    def error(self, id, code, message):
+        return self._empty.join((self._error_prefix,
+                                 self._dump_error(code, message),
+                                 self._id_prefix, self._dump_id(id),
+                                 self._suffix))
+
+    def batch(self, responses):
+        return (self._array_start + self._separator.join(responses) +
+                self._array_end)
+
+
+class MsgpackEnvelope(_Envelope):
+    """ With `bin_type`, a `bytes`, `bytearray` or `memoryview` result
+    is written after a bin header without being packed first.
+
+    The templates are written directly rather than packed with `dumps`,
+    which isn't called until the first response.
+    """
+    _map_header = b'\x83'
+    _binary_types = (bytes, bytearray, memoryview)
+
+    def __init__(self, dumps, bin_type=False):
+        super().__init__(dumps)
+        self._bin_type = bin_type
+        version = _fixstr('jsonrpc') + _fixstr(JSON_RPC_VERSION)
+        self._result_prefix = self._map_header + version + _fixstr('result')
+        self._error_prefix = self._map_header + version + _fixstr('error')
+        self._id_key = _fixstr('id')
+
+    def result(self, id, result):
+        if self._bin_type and isinstance(result, self._binary_types):
+            return b''.join((self._result_prefix, _bin_header(result),
+                             result, self._id_key, self._dumps(id)))
+        return self.serialized_result(id, self._dumps(result))
+
+    def serialized_result(self, id, data):
+        return b''.join((self._result_prefix, data, self._id_key,
+                         self._dumps(id)))
+
+    def error(self, id, code, message):
+        return b''.join((self._error_prefix, self._dump_error(code, message),
+                         self._id_key, self._dumps(id)))
+
+    def batch(self, responses):
+        size = len(responses)
+        if size < 16:
+            header = bytes((0x90 | size, ))
+        elif size < 0x10000:
+            header = b'\xdc' + pack('>H', size)
+        else:
+            header = b'\xdd' + pack('>I', size)
+        return header + b''.join(responses)
+
+
+def _fixstr(value):
+    """ Packs a str shorter than 32 bytes, the same way in every
+    msgpack version.
+    """
+    data = value.encode('utf-8')
+    return bytes((0xa0 | len(data), )) + data
+
+
+def _bin_header(data):
+    size = data.nbytes if isinstance(data, memoryview) else len(data)
+    if size < 0x100:
+        return b'\xc4' + pack('>B', size)
+    if size < 0x10000:
+        return b'\xc5' + pack('>H', size)
+    return b'\xc6' + pack('>I', size)
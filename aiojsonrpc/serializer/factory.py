@@ -1,6 +1,39 @@
+from threading import local
+
+
 def dumps(serializer, *args, **kwargs):
     return serializer.dumps(*args, **kwargs)
 
 
 def loads(serializer, *args, **kwargs):
     return serializer.loads(*args, **kwargs)
+
+
+def unpack_options(msgpack):
+    """ Returns the options of `msgpack.loads` unpacking str as `str`:
+    `raw=False`, or the deprecated `encoding` on msgpack versions
+    before 0.5.2, which have no `raw`.
+    """
+    if getattr(msgpack, 'version', (0, )) < (0, 5, 2):
+        return {'encoding': 'utf-8'}
+    return {'raw': False}
+
+
+def packer_dumps(msgpack, **kwargs):
+    """ Returns `dumps` packing with a `msgpack.Packer` created once
+    per thread instead of a new packer (and its buffer) per call.
+    """
+    packers = local()
+
+    def dumps(obj):
+        try:
+            packer = packers.packer
+        except AttributeError:
+            packer = packers.packer = msgpack.Packer(**kwargs)
+        try:
+            return packer.pack(obj)
+        except Exception:
+            # The packer keeps what it wrote before the failure.
+            packer.reset()
+            raise
+    return dumps
@@ -1,9 +1,15 @@
 import ujson as json
 from functools import partial
 from . import factory
+from .envelope import JsonEnvelope
 
 
+name = 'json'
+binary = False
+content_type = 'application/json'
+
 loads = partial(factory.loads, json)
 dumps = partial(factory.dumps, json)
 serialize = loads
 deserialize = dumps
+envelope = JsonEnvelope(dumps)
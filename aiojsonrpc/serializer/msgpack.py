@@ -1,9 +1,15 @@
 from functools import partial
 from . import factory
+from .envelope import MsgpackEnvelope
 import msgpack
 
 
-loads = partial(factory.loads, msgpack, encoding='utf-8')
-dumps = partial(factory.dumps, msgpack, encoding='utf-8')
+name = 'msgpack'
+binary = True
+content_type = 'application/msgpack'
+
+loads = partial(factory.loads, msgpack, **factory.unpack_options(msgpack))
+dumps = factory.packer_dumps(msgpack, use_bin_type=True)
 serialize = loads
 deserialize = dumps
+envelope = MsgpackEnvelope(dumps)
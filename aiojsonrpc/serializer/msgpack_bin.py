@@ -0,0 +1,28 @@
+""" msgpack with the bin type for binary data.
+
+`bytes`, `bytearray` and `memoryview` values are packed as bin,
+so a method can return a slice of a large buffer without copying it
+into `bytes` first: a binary result is written into the response frame
+directly. Messages are unpacked straight from the received `bytes`,
+`bytearray` or `memoryview`.
+"""
+from functools import partial
+from . import factory
+from .envelope import MsgpackEnvelope
+import msgpack
+
+
+def _default(obj):
+    if isinstance(obj, (bytearray, memoryview)):
+        return bytes(obj)
+    raise TypeError('Cannot serialize {!r}'.format(obj))
+
+
+name = 'msgpack-bin'
+binary = True
+content_type = 'application/x-msgpack-bin'
+loads = partial(factory.loads, msgpack, **factory.unpack_options(msgpack))
+dumps = factory.packer_dumps(msgpack, use_bin_type=True, default=_default)
+serialize = loads
+deserialize = dumps
+envelope = MsgpackEnvelope(dumps, bin_type=True)
@@ -0,0 +1,14 @@
+from functools import partial
+from . import factory
+from .envelope import JsonEnvelope
+import orjson
+
+
+name = 'orjson'
+binary = True
+content_type = 'application/json'
+loads = partial(factory.loads, orjson)
+dumps = partial(factory.dumps, orjson)
+serialize = loads
+deserialize = dumps
+envelope = JsonEnvelope(dumps, binary=True)
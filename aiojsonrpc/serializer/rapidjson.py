@@ -0,0 +1,14 @@
+from functools import partial
+from . import factory
+from .envelope import JsonEnvelope
+import rapidjson
+
+
+name = 'rapidjson'
+binary = False
+content_type = 'application/json'
+loads = partial(factory.loads, rapidjson)
+dumps = partial(factory.dumps, rapidjson)
+serialize = loads
+deserialize = dumps
+envelope = JsonEnvelope(dumps)
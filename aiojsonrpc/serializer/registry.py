@@ -0,0 +1,54 @@
+""" Registry of serializers by name.
+
+A serializer is any object (usually a module) providing:
+    - name: the name to register it with. It's also used as the websocket
+      subprotocol to negotiate the serializer with.
+    - binary: whether `dumps` returns `bytes` rather than `str`.
+    - content_type (optional): the media type of the serialized messages,
+      used to choose the serializer for an HTTP request.
+    - loads(data): deserializes a message.
+    - dumps(obj): serializes a message.
+    - envelope (optional): a fast encoder of responses,
+      see `aiojsonrpc.serializer.envelope`.
+
+`json` (ujson), `msgpack` and `msgpack-bin` are always registered,
+`orjson` and `rapidjson` are registered when the packages are installed.
+`aiojsonrpc.serializer.deflate.DeflateSerializer` compresses large
+messages of any of them.
+"""
+from collections import OrderedDict
+from importlib import import_module
+
+
+_serializers = OrderedDict()
+
+
+def register(serializer, name=None):
+    _serializers[name or serializer.name] = serializer
+    return serializer
+
+
+def get(name):
+    try:
+        return _serializers[name]
+    except KeyError:
+        raise KeyError('Serializer `{}` is not registered'.format(name))
+
+
+def resolve(serializer):
+    """ Returns the registered serializer if `serializer` is a name. """
+    return get(serializer) if isinstance(serializer, str) else serializer
+
+
+def names():
+    return tuple(_serializers)
+
+
+for _module_name in ('json', 'msgpack', 'msgpack_bin'):
+    register(import_module('.' + _module_name, __package__))
+
+for _module_name in ('orjson', 'rapidjson'):
+    try:
+        register(import_module('.' + _module_name, __package__))
+    except ImportError:
+        pass
@@ -1,4 +1,6 @@
-import asyncio
+from .constants import ServiceLifetime
+from .dispatch import compile_service
+from .dispatch import method_caches
 from .util import raise_method_not_found
 
 
@@ -24,18 +26,35 @@ class Service(object):
         def non_rpc_method(self):
             pass
     ```
+
+    `lifetime` (`ServiceLifetime`) defines when instances are created,
+    see `RpcWebsocketHandler.register_service`.
     """
+    lifetime = ServiceLifetime.CONNECTION
+
     def __init__(self, **context):
         self.context = context
 
-    async def __call__(self, method, **params):
+    async def __call__(self, method, *args, **params):
+        """ Calls rpc `method` with params given either by position
+        or by name.
+        """
+        if args and params:
+            raise TypeError('Params must be given either by position '
+                            'or by name')
         try:
-            fn = getattr(self, method)
-            assert fn.is_rpc_method
-        except (AttributeError, AssertionError) as e:
+            rpc_method = compile_service(self.__class__)[method]
+        except KeyError:
             raise_method_not_found('{}.{}'.format(self.__class__.__name__,
                                                   method))
-        result = (await fn(**params)
-                  if asyncio.iscoroutinefunction(fn)
-                  else fn(**params))
-        return result
+        return await rpc_method(self, list(args) if args else params,
+                                self.context)
+
+    @classmethod
+    def invalidate_cache(cls, method, **params):
+        """ Drops the cached results of rpc `method` for `params`,
+        or all of its cached results if no params are given.
+        Caches enabled by `register_service` options are included.
+        """
+        for cache in method_caches(cls, method):
+            cache.invalidate(params or None)
@@ -0,0 +1,49 @@
+import asyncio
+from .cache import freeze
+
+
+class SingleFlight(object):
+    """ Shares one execution between identical concurrent calls.
+
+    While a call of a method with some params is in flight, identical calls
+    wait for its result instead of running the method again.
+    """
+    def __init__(self):
+        self._in_flight = {}
+        self._unshareable = set()
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    async def run(self, method, params, call, shareable=None):
+        """ Returns the result of `call()` shared with the identical
+        in-flight call of `method` with `params`, if there's one.
+        Only calls with params given by name are shared.
+
+        A result for which `shareable(result)` is false is kept
+        by the call that made it, the others make their own calls,
+        and further calls of `method` aren't shared anymore.
+        """
+        if not isinstance(params, dict) or method in self._unshareable:
+            return await call()
+        key = (method, freeze(params))
+        try:
+            future = self._in_flight.get(key)
+        except TypeError:
+            return await call()
+        if future is None:
+            future = self._in_flight[key] = asyncio.ensure_future(call())
+            future.add_done_callback(lambda future: self._forget(key, future))
+            result = await asyncio.shield(future)
+            if shareable is not None and not shareable(result):
+                self._unshareable.add(method)
+            return result
+        result = await asyncio.shield(future)
+        if shareable is not None and not shareable(result):
+            self._unshareable.add(method)
+            return await call()
+        return result
+
+    def _forget(self, key, future):
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
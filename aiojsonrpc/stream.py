@@ -0,0 +1,165 @@
+""" Streaming results of async generator rpc methods.
+
+Instead of a single response, every item the method yields is sent
+as an `rpc.chunk` notification tied to the request id:
+
+    {"id": request id, "result": item}
+
+The first chunk also carries the `window` in effect, which may be
+smaller than the requested one, and the stream ends with the regular
+response to the request, its result being the number of chunks,
+or an error.
+
+Flow control is credit based: the server sends up to `window` chunks
+(the `window` member of the request, capped by the server) ahead of
+the client, which grants more with `rpc.ack` notifications,
+`{"id": request id, "credit": n}`, as it consumes them. The client stops
+a stream early with an `rpc.cancel` notification, `{"id": request id}`.
+The generator isn't advanced while the client has no credit, so memory
+stays bounded on both ends.
+"""
+import asyncio
+from .constants import CHUNK_METHOD
+from .constants import JSON_RPC_VERSION
+from .exception import RpcError
+from .exception import RpcErrorCode
+
+
+DEFAULT_WINDOW = 16
+
+
+class Stream(object):
+    """ Items of an async iterator sent within the credit
+    granted by the client, which never exceeds `window`.
+    """
+    def __init__(self, id, source, window=DEFAULT_WINDOW):
+        self.id = id
+        self.window = window
+        self.sent = 0
+        self._source = source.__aiter__()
+        self._credit = window
+        self._has_credit = asyncio.Event()
+        if window > 0:
+            self._has_credit.set()
+
+    @property
+    def credit(self):
+        return self._credit
+
+    def ack(self, credit):
+        self._credit = min(self._credit + credit, self.window)
+        if self._credit > 0:
+            self._has_credit.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._has_credit.wait()
+        item = await self._source.__anext__()
+        self.sent += 1
+        self._credit -= 1
+        if self._credit <= 0:
+            self._has_credit.clear()
+        return item
+
+
+class Streams(object):
+    """ Active streams of a connection by request id.
+
+    The window requested by the client is capped by `window`.
+    """
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._streams = {}
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, id):
+        return id in self._streams
+
+    def add(self, id, source, window=None):
+        """ Registers the stream of the request `id`.
+        Nothing is sent until it's started.
+        """
+        if id in self._streams:
+            raise RpcError('Stream `{}` already exists'.format(id),
+                           RpcErrorCode.INVALID_REQUEST)
+        if not isinstance(window, int) or window < 1:
+            window = self.window
+        stream = self._streams[id] = Stream(id, source,
+                                            min(window, self.window))
+        return stream
+
+    def start(self, stream, send):
+        """ Starts sending the chunks of the stream
+        and the final response through `send(message)`.
+        """
+        if stream.id not in self._streams:
+            return
+        self._tasks[stream.id] = asyncio.ensure_future(self._send(stream,
+                                                                  send))
+
+    def ack(self, id, credit):
+        """ Grants the stream `credit` more chunks.
+        Returns whether the stream is active.
+        """
+        stream = self._streams.get(id)
+        if stream is None:
+            return False
+        stream.ack(credit)
+        return True
+
+    def cancel(self, id):
+        """ Stops the stream. Returns whether it was active. """
+        stream = self._streams.pop(id, None)
+        if stream is None:
+            return False
+        task = self._tasks.pop(id, None)
+        if task is not None:
+            task.cancel()
+        return True
+
+    def close(self):
+        """ Stops all the streams, e.g. when the connection closes. """
+        for id in list(self._streams):
+            self.cancel(id)
+
+    async def _send(self, stream, send):
+        id = stream.id
+        try:
+            async for item in stream:
+                chunk = self.create_chunk(id, item)
+                if stream.sent == 1:
+                    chunk['params']['window'] = stream.window
+                send(chunk)
+        except asyncio.CancelledError:
+            raise
+        except RpcError as e:
+            send(self.create_response(id, error={
+                'code': e.rpc_error_code.value,
+                'message': e.rpc_error_message,
+            }))
+        except Exception as e:
+            print('stream {} failed with exception {}'.format(id, e))
+            send(self.create_response(id, error={
+                'code': RpcErrorCode.INTERNAL_ERROR.value,
+                'message': 'Internal error',
+            }))
+        else:
+            send(self.create_response(id, result=stream.sent))
+        finally:
+            self._streams.pop(id, None)
+            self._tasks.pop(id, None)
+
+    def create_chunk(self, id, item):
+        return {
+            'jsonrpc': JSON_RPC_VERSION,
+            'method': CHUNK_METHOD,
+            'params': {'id': id, 'result': item},
+        }
+
+    def create_response(self, id, **response):
+        return {'jsonrpc': JSON_RPC_VERSION, 'id': id, **response}
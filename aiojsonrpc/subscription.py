@@ -0,0 +1,167 @@
+""" Server push over the websocket connection.
+
+An rpc method starts a subscription by returning a `Subscription`.
+The client receives the subscription id as the result of the call,
+then `rpc.subscription` notifications:
+
+    {"subscription": id, "result": item}   for every item,
+    {"subscription": id, "error": error}   if the source failed,
+    {"subscription": id, "done": true}     when the subscription is closed
+                                            on the server side.
+
+The client stops a subscription by calling `rpc.unsubscribe`
+with `{"subscription": id}`.
+
+```python
+class TickerService(Service):
+    @rpc_method
+    def prices(self, symbol=''):
+        subscription = Subscription(on_close=self.feed.unsubscribe)
+        self.feed.subscribe(symbol, subscription.publish)
+        return subscription
+
+    @rpc_method
+    def clock(self):
+        return Subscription(self.ticks())  # any async iterator
+```
+"""
+import asyncio
+from itertools import count
+from .constants import JSON_RPC_VERSION
+from .constants import SUBSCRIPTION_METHOD
+from .exception import RpcError
+from .exception import RpcErrorCode
+
+
+_CLOSED = object()
+
+
+class Subscription(object):
+    """ Items pushed to the client.
+
+    Items are either published through `publish` or taken from `source`,
+    an async iterator. Up to `maxsize` published items are queued
+    (unbounded by default); `publish` raises `asyncio.QueueFull` beyond it.
+    `on_close(subscription)` is called once the subscription is closed
+    by either side.
+    """
+    def __init__(self, source=None, maxsize=0, on_close=None):
+        self.id = None
+        self._source = None if source is None else source.__aiter__()
+        self._maxsize = maxsize
+        self._queue = asyncio.Queue()
+        self._on_close = on_close
+        self._closed = False
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, item):
+        """ Queues `item` to be sent to the client. """
+        if self._closed:
+            raise RuntimeError('subscription is closed')
+        if self._maxsize and self._queue.qsize() >= self._maxsize:
+            raise asyncio.QueueFull()
+        self._queue.put_nowait(item)
+
+    def close(self):
+        """ Ends the subscription once the queued items are sent. """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put_nowait(_CLOSED)
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._source is not None:
+            if self._closed:
+                raise StopAsyncIteration
+            return await self._source.__anext__()
+        item = await self._queue.get()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+
+class Subscriptions(object):
+    """ Active subscriptions of a connection by id. """
+    def __init__(self):
+        self._ids = count(start=1, step=1)
+        self._subscriptions = {}
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def __contains__(self, id):
+        return id in self._subscriptions
+
+    def add(self, subscription):
+        """ Registers the subscription and returns its id.
+        Nothing is sent until it's started.
+        """
+        subscription.id = next(self._ids)
+        self._subscriptions[subscription.id] = subscription
+        return subscription.id
+
+    def start(self, subscription, send):
+        """ Starts sending notifications of the subscription
+        through `send(notification)`.
+        """
+        if subscription.id not in self._subscriptions:
+            return
+        self._tasks[subscription.id] = asyncio.ensure_future(
+            self._push(subscription, send))
+
+    def cancel(self, id):
+        """ Stops the subscription. Returns whether it was active. """
+        subscription = self._subscriptions.pop(id, None)
+        if subscription is None:
+            return False
+        task = self._tasks.pop(id, None)
+        if task is not None:
+            task.cancel()
+        subscription.close()
+        return True
+
+    def close(self):
+        """ Stops all the subscriptions, e.g. when the connection closes. """
+        for id in list(self._subscriptions):
+            self.cancel(id)
+
+    async def _push(self, subscription, send):
+        id = subscription.id
+        try:
+            async for item in subscription:
+                send(self.create_notification(id, result=item))
+        except asyncio.CancelledError:
+            raise
+        except RpcError as e:
+            send(self.create_notification(id, error={
+                'code': e.rpc_error_code.value,
+                'message': e.rpc_error_message,
+            }))
+        except Exception as e:
+            print('subscription {} failed with exception {}'.format(id, e))
+            send(self.create_notification(id, error={
+                'code': RpcErrorCode.INTERNAL_ERROR.value,
+                'message': 'Internal error',
+            }))
+        else:
+            send(self.create_notification(id, done=True))
+        finally:
+            self._subscriptions.pop(id, None)
+            self._tasks.pop(id, None)
+            subscription.close()
+
+    def create_notification(self, id, **params):
+        return {
+            'jsonrpc': JSON_RPC_VERSION,
+            'method': SUBSCRIPTION_METHOD,
+            'params': {'subscription': id, **params},
+        }
@@ -1,9 +1,45 @@
+from functools import partial
 from .exception import RpcError
 from .exception import RpcErrorCode
 
 
-def rpc_method(method):
+def rpc_method(method=None, **options):
+    """ Marks a service method as available through RPC.
+
+    Can be used either bare, `@rpc_method`, or with options,
+    `@rpc_method(executor=thread_pool)`:
+        - executor: a `concurrent.futures.Executor`
+          (or `aiojsonrpc.executor.BoundedExecutor`) to run
+          a non-coroutine method in. Note that a `ProcessPoolExecutor`
+          requires both the service instance and params to be picklable.
+        - max_pending: the number of calls of the method submitted to
+          the executor at a time, by default the number of its workers.
+          Extra calls wait on the event loop.
+        - cache_ttl, cache_maxsize, cache_key: cache serialized results
+          of an idempotent method, shared by all the connections.
+          Any of them enables the cache. `cache_ttl` is in seconds
+          (no expiration by default), `cache_maxsize` is the number of
+          entries (LRU), `cache_key` names the params to key the results by
+          (all of them by default). See `Service.invalidate_cache`.
+        - with_context: pass the connection context to the method as the
+          first argument after `self`. Useful for services whose instances
+          aren't bound to a connection, e.g. singletons.
+          Not allowed along with the cache, as the cached results
+          don't depend on the context.
+        - stream: send the items of the async iterator the method returns
+          to the client as they come (`aiojsonrpc.stream`) instead of
+          a single result. Enabled for async generator functions.
+        - validate: check the types of the params against the annotations
+          of the method before calling it.
+        - schema: `{param: type or tuple of types}` to check the params
+          against instead of the annotations.
+          Invalid params get an "Invalid params" error,
+          see `aiojsonrpc.validation`.
+    """
+    if method is None:
+        return partial(rpc_method, **options)
     method.is_rpc_method = True
+    method.rpc_options = options
     return method
 
 
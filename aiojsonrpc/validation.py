@@ -0,0 +1,161 @@
+""" Validation of rpc method params compiled once per method.
+
+Params are given either by name (an object) or by position (an array).
+Their names or number are always checked against the signature
+of the method, so a call with missing or unexpected params gets
+an "Invalid params" error instead of a `TypeError` raised by the call.
+The signature is inspected once, when the method is compiled.
+
+The types of the params are checked as well against
+the annotations of the method with `rpc_method(validate=True)`
+or against `rpc_method(schema={param: type or tuple of types})`.
+Only classes are checked, other annotations are ignored. An `int`
+is a valid `float` while a `bool` is only valid if expected explicitly,
+and a param defaulting to `None` may be `None`.
+"""
+import inspect
+from .exception import RpcError
+from .exception import RpcErrorCode
+
+
+class ParamsValidator(object):
+    """ Checks the params of a call, raising `RpcError`
+    with `RpcErrorCode.INVALID_PARAMS` if they don't fit the method.
+    """
+    __slots__ = ('required', 'accepted', 'types', 'positional',
+                 'min_positional', 'max_positional', 'required_keyword')
+
+    def __init__(self, required=(), accepted=None, types=(), positional=(),
+                 min_positional=0, max_positional=None):
+        self.required = frozenset(required)
+        # `None` for methods accepting any keyword arguments.
+        self.accepted = None if accepted is None else frozenset(accepted)
+        # `(name, position, types, exclude_bool)` of the params
+        # to type check, `position` is `None` for keyword-only params.
+        self.types = tuple(types)
+        # Names of the params that can be given by position.
+        self.positional = tuple(positional)
+        self.min_positional = min_positional
+        # `None` for methods accepting any positional arguments.
+        self.max_positional = max_positional
+        self.required_keyword = self.required - set(self.positional)
+
+    def __call__(self, params):
+        if isinstance(params, list):
+            self._check_positional(params)
+            return
+        if not isinstance(params, dict):
+            raise_invalid_params('params must be an array or an object')
+        if not self.required <= params.keys():
+            raise_invalid_params('missing {}'.format(
+                _names(self.required - params.keys())))
+        if self.accepted is not None and not params.keys() <= self.accepted:
+            raise_invalid_params('unexpected {}'.format(
+                _names(params.keys() - self.accepted)))
+        for name, _, types, exclude_bool in self.types:
+            try:
+                value = params[name]
+            except KeyError:
+                continue
+            _check_type(name, value, types, exclude_bool)
+
+    def _check_positional(self, params):
+        size = len(params)
+        if size < self.min_positional or self.required_keyword:
+            raise_invalid_params('missing {}'.format(_names(
+                self.positional[size:self.min_positional] +
+                tuple(self.required_keyword))))
+        if self.max_positional is not None and size > self.max_positional:
+            raise_invalid_params('expected at most {} params'.format(
+                self.max_positional))
+        for name, position, types, exclude_bool in self.types:
+            if position is not None and position < size:
+                _check_type(name, params[position], types, exclude_bool)
+
+    def as_named(self, params):
+        """ Returns params given by position as `{name: value}`,
+        or unchanged if they can't be named.
+        """
+        if isinstance(params, list) and len(params) <= len(self.positional):
+            return dict(zip(self.positional, params))
+        return params
+
+
+def _check_type(name, value, types, exclude_bool):
+    if (not isinstance(value, types) or
+            exclude_bool and type(value) is bool):
+        raise_invalid_params('`{}` must be {}'.format(
+            name, ' or '.join(type_.__name__ for type_ in types)))
+
+
+def compile_validator(fn, skip=1, validate=False, schema=None):
+    """ Returns the `ParamsValidator` of `fn`, whose first `skip`
+    positional parameters (`self`, the context) aren't params.
+    """
+    try:
+        parameters = list(inspect.signature(fn).parameters.values())
+    except (TypeError, ValueError):
+        return ParamsValidator()
+    required = []
+    accepted = []
+    positional = []
+    min_positional = 0
+    max_positional = 0
+    defaults = {}
+    for parameter in parameters[skip:]:
+        if parameter.kind is parameter.VAR_KEYWORD:
+            accepted = None
+        elif parameter.kind is parameter.VAR_POSITIONAL:
+            max_positional = None
+        else:
+            if parameter.kind is not parameter.KEYWORD_ONLY:
+                positional.append(parameter.name)
+                if max_positional is not None:
+                    max_positional += 1
+                if parameter.default is parameter.empty:
+                    min_positional += 1
+            if accepted is not None:
+                accepted.append(parameter.name)
+            if parameter.default is parameter.empty:
+                if parameter.kind is not parameter.POSITIONAL_ONLY:
+                    required.append(parameter.name)
+            else:
+                defaults[parameter.name] = parameter.default
+    if schema is None and validate:
+        schema = {parameter.name: parameter.annotation
+                  for parameter in parameters[skip:]
+                  if parameter.annotation is not parameter.empty}
+    positions = {name: position for position, name in enumerate(positional)}
+    types = []
+    for name, expected in (schema or {}).items():
+        expected = _compile_types(expected, defaults.get(name, False))
+        if expected is not None:
+            types.append((name, positions.get(name)) + expected)
+    return ParamsValidator(required, accepted, types, positional,
+                           min_positional, max_positional)
+
+
+def _compile_types(expected, default):
+    """ Returns `(types, exclude_bool)` or `None` if `expected`
+    can't be checked.
+    """
+    if not isinstance(expected, tuple):
+        expected = (expected, )
+    if not expected or not all(isinstance(type_, type)
+                               for type_ in expected):
+        return None
+    if float in expected and int not in expected:
+        expected += (int, )
+    if default is None and type(None) not in expected:
+        expected += (type(None), )
+    exclude_bool = int in expected and bool not in expected
+    return expected, exclude_bool
+
+
+def _names(names):
+    return ', '.join('`{}`'.format(name) for name in sorted(names))
+
+
+def raise_invalid_params(reason):
+    raise RpcError('Invalid params: {}'.format(reason),
+                   RpcErrorCode.INVALID_PARAMS)
@@ -0,0 +1,285 @@
+""" Multi-process server: worker processes sharing one port.
+
+Every worker runs its own copy of the app on a `SO_REUSEPORT` socket,
+so the kernel spreads incoming connections across all of them.
+
+```python
+from aiojsonrpc.workers import run_workers
+
+
+def create_app():
+    app = web.Application()
+    app['websockets'] = ConnectionRegistry()
+    app.router.add_route('GET', '/ws/json-rpc',
+                         create_default_rpc_websocket_handler(services))
+    return app
+
+
+run_workers(create_app, port=8888, broadcast=True)
+```
+
+The supervisor restarts workers that die, replaces all of them
+gracefully on SIGHUP and shuts them down gracefully on SIGTERM or SIGINT:
+a worker stops accepting connections, closes its websockets with
+"going away" (clients are expected to reconnect, see
+`aiojsonrpc.pool.ClientPool`) and waits up to `shutdown_timeout`
+seconds for the requests in progress.
+
+With `broadcast` enabled `app['broadcast']` is a `BroadcastChannel`
+publishing notifications to the connections of every worker.
+"""
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from aiohttp import WSCloseCode
+from .serializer import msgpack
+
+
+MAX_DATAGRAM_SIZE = 65536
+RESPAWN_DELAY = 1.0
+
+
+def create_reuseport_socket(host, port, listen=True, backlog=128):
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise RuntimeError('SO_REUSEPORT is not supported on this platform')
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET,
+                         socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if listen:
+            sock.listen(backlog)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class BroadcastChannel(object):
+    """ Publishes notifications to the `ConnectionRegistry` of this
+    and every other worker.
+
+    Workers exchange notifications as unix datagrams in `directory`,
+    so a notification must fit in `MAX_DATAGRAM_SIZE` bytes serialized.
+    """
+    def __init__(self, connections, directory, index, workers):
+        self.connections = connections
+        self._directory = directory
+        self._index = index
+        self._workers = workers
+        self._sock = None
+
+    def _path(self, index):
+        return os.path.join(self._directory, 'worker-{}.sock'.format(index))
+
+    def open(self, loop):
+        path = self._path(self._index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        self._sock.bind(path)
+        self._loop = loop
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def close(self):
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+
+    def publish(self, method, params=None, tag=None):
+        """ Sends a notification to the connections with `tag`,
+        or all of them, of every worker. Returns the number of
+        connections of this worker it was sent to.
+        """
+        data = msgpack.dumps({'method': method, 'params': params,
+                              'tag': tag})
+        for index in range(self._workers):
+            if index == self._index:
+                continue
+            try:
+                self._sock.sendto(data, self._path(index))
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass
+            except OSError as e:
+                print('broadcast to worker {} failed '
+                      'with exception {}'.format(index, e))
+        return self.connections.publish(method, params, tag)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            message = msgpack.loads(data)
+            self.connections.publish(message['method'], message['params'],
+                                     message['tag'])
+
+
+class Worker(object):
+    """ Serves the app created by `create_app()` in the current process
+    until SIGTERM or SIGINT.
+    """
+    def __init__(self, create_app, host, port, index=0, workers=1,
+                 channel_directory=None, shutdown_timeout=10.0):
+        self._create_app = create_app
+        self._host = host
+        self._port = port
+        self._index = index
+        self._workers = workers
+        self._channel_directory = channel_directory
+        self._shutdown_timeout = shutdown_timeout
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        stopping = asyncio.Future(loop=loop)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self._stop, stopping)
+        try:
+            loop.run_until_complete(self.serve(loop, stopping))
+        finally:
+            loop.close()
+
+    def _stop(self, stopping):
+        if not stopping.done():
+            stopping.set_result(None)
+
+    async def serve(self, loop, stopping):
+        app = self._create_app()
+        app.on_shutdown.append(close_websockets)
+        channel = None
+        if self._channel_directory is not None:
+            channel = app['broadcast'] = BroadcastChannel(
+                app['websockets'], self._channel_directory, self._index,
+                self._workers)
+            channel.open(loop)
+        handler = app.make_handler()
+        server = await loop.create_server(
+            handler, sock=create_reuseport_socket(self._host, self._port))
+        try:
+            await stopping
+        finally:
+            server.close()
+            await server.wait_closed()
+            await app.shutdown()
+            await handler.shutdown(self._shutdown_timeout)
+            await app.cleanup()
+            if channel is not None:
+                channel.close()
+
+
+async def close_websockets(app):
+    """ `on_shutdown` handler closing the websockets of the app. """
+    websockets = list(app.get('websockets', ()))
+    if websockets:
+        await asyncio.wait([ws.close(code=WSCloseCode.GOING_AWAY,
+                                     message='Server shutdown')
+                            for ws in websockets])
+
+
+class Supervisor(object):
+    """ Runs `workers` (the number of CPUs by default) worker processes
+    serving the app created by `create_app()` on `host:port`,
+    see the module documentation.
+    """
+    def __init__(self, create_app, host='0.0.0.0', port=8080, workers=None,
+                 broadcast=False, shutdown_timeout=10.0):
+        self._create_app = create_app
+        self._host = host
+        self._workers = workers or os.cpu_count() or 1
+        self._broadcast = broadcast
+        self._shutdown_timeout = shutdown_timeout
+        self._sock = create_reuseport_socket(host, port, listen=False)
+        self.port = self._sock.getsockname()[1]
+        self._pids = {}
+        self._retiring = set()
+        self._running = False
+        self._channel_directory = None
+
+    def run(self):
+        self._running = True
+        if self._broadcast:
+            self._channel_directory = tempfile.mkdtemp(prefix='aiojsonrpc-')
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        try:
+            for index in range(self._workers):
+                self._spawn(index)
+            self._wait()
+        finally:
+            self._sock.close()
+            if self._channel_directory is not None:
+                shutil.rmtree(self._channel_directory, ignore_errors=True)
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self._pids[pid] = (index, time.monotonic())
+            return
+        exit_code = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            self._sock.close()
+            Worker(self._create_app, self._host, self.port, index,
+                   self._workers, self._channel_directory,
+                   self._shutdown_timeout).run()
+        except BaseException as e:
+            print('worker {} failed with exception {}'.format(index, e))
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _wait(self):
+        while self._pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self._pids.pop(pid, (None, None))
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if index is None or not self._running:
+                continue
+            print('worker {} exited with status {}, '
+                  'restarting'.format(index, status))
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            self._spawn(index)
+
+    def _on_stop(self, signum, frame):
+        self._running = False
+        for pid in self._pids:
+            self._kill(pid)
+
+    def _on_restart(self, signum, frame):
+        """ Starts new workers, then gracefully stops the old ones. """
+        retiring = [(pid, index) for pid, (index, _) in self._pids.items()
+                    if pid not in self._retiring]
+        for pid, index in retiring:
+            self._spawn(index)
+        for pid, _ in retiring:
+            self._retiring.add(pid)
+            self._kill(pid)
+
+    def _kill(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def run_workers(create_app, **kwargs):
+    """ Runs the supervisor of worker processes, see `Supervisor`. """
+    Supervisor(create_app, **kwargs).run()
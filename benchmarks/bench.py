@@ -0,0 +1,323 @@
+""" Throughput and latency benchmarks of aiojsonrpc hot paths.
+
+Cases:
+    - dispatch: `WebSocketMessageHandler._call_service` alone,
+      no network involved;
+    - roundtrip: `Client.call` against a local aiohttp server,
+      over a number of concurrent connections;
+    - compression: encoding and decoding a result of repetitive records
+      as is and with `DeflateSerializer` at a few zlib levels.
+
+Each case is run for sync and async services, json and msgpack
+serializers and a few payload sizes. Compression cases also report
+the message size and the link speed below which compression pays off:
+the bytes saved take longer to transfer than the extra CPU time.
+Choose the `DeflateSerializer` threshold as the smallest size
+whose break-even speed is above the speed of your links. Usage:
+
+    python -m benchmarks.bench [--quick] [--filter roundtrip/msgpack]
+                               [--save baseline.json]
+                               [--compare baseline.json [--tolerance 0.1]]
+
+`--save` writes the results as a JSON baseline, `--compare` reports
+cases whose calls/s dropped more than `--tolerance` below the baseline
+and exits with status 1 if there are any.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+import aiohttp
+from aiohttp import web
+from itertools import product
+from aiojsonrpc import __version__
+from aiojsonrpc.client import Client
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.request_handler import create_default_rpc_websocket_handler
+from aiojsonrpc.serializer import json as json_serializer
+from aiojsonrpc.serializer import msgpack as msgpack_serializer
+from aiojsonrpc.serializer.deflate import DeflateSerializer
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+SERIALIZERS = {
+    'json': (json_serializer, str),
+    'msgpack': (msgpack_serializer, bytes),
+}
+SERVICE_KINDS = ('sync', 'async')
+PAYLOAD_SIZES = (16, 1024, 64 * 1024)
+CONNECTIONS = (1, 8, 64)
+COMPRESSION_SIZES = (256, 4 * 1024, 64 * 1024)
+COMPRESSION_LEVELS = (None, 1, 6)
+
+
+class BenchService(Service):
+    @rpc_method
+    def sync(self, payload=''):
+        return payload
+
+    @rpc_method
+    async def async_(self, payload=''):
+        return payload
+
+
+def method_name(kind):
+    return 'BenchService.{}'.format('async_' if kind == 'async' else kind)
+
+
+def format_size(size):
+    return ('{}KiB'.format(size // 1024) if size >= 1024
+            else '{}B'.format(size))
+
+
+def percentile(sorted_values, p):
+    return sorted_values[int(round(p / 100 * (len(sorted_values) - 1)))]
+
+
+def summarize(name, latencies, seconds):
+    latencies = sorted(latencies)
+    return {
+        'name': name,
+        'calls': len(latencies),
+        'seconds': seconds,
+        'calls_per_sec': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+async def bench_dispatch(serializer_name, kind, size, calls):
+    serializer, _ = SERIALIZERS[serializer_name]
+    msg_handler = WebSocketMessageHandler()
+    services = ServiceMap.from_instances({'BenchService': BenchService()})
+    data = serializer.dumps({
+        'jsonrpc': '2.0',
+        'method': method_name(kind),
+        'params': {'payload': 'x' * size},
+        'id': 1,
+    })
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        await msg_handler._call_service(services, data, serializer)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(dispatch_name(serializer_name, kind, size),
+                     latencies, time.perf_counter() - started)
+
+
+def dispatch_name(serializer_name, kind, size):
+    return 'dispatch/{}/{}/{}'.format(serializer_name, kind,
+                                      format_size(size))
+
+
+def make_records(size):
+    """ Returns a result of about `size` bytes of JSON. """
+    return [{'id': i, 'name': 'item-{}'.format(i), 'price': i * 0.25,
+             'in_stock': i % 2 == 0}
+            for i in range(max(1, size // 64))]
+
+
+def bench_compression(serializer_name, size, level, calls):
+    serializer, _ = SERIALIZERS[serializer_name]
+    if level is not None:
+        serializer = DeflateSerializer(serializer, threshold=0, level=level)
+    response = {'jsonrpc': '2.0', 'result': make_records(size), 'id': 1}
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        data = serializer.dumps(response)
+        serializer.loads(data)
+        latencies.append(time.perf_counter() - call_started)
+    result = summarize(compression_name(serializer_name, size, level),
+                       latencies, time.perf_counter() - started)
+    result['bytes'] = len(data)
+    return result
+
+
+def compression_name(serializer_name, size, level):
+    return 'compression/{}/{}/{}'.format(
+        serializer_name, format_size(size),
+        'plain' if level is None else 'deflate-{}'.format(level))
+
+
+def break_even_mbps(plain, compressed):
+    """ Returns the link speed (Mbit/s) below which sending `compressed`
+    takes less time than sending `plain`, CPU time included.
+    """
+    saved_bits = (plain['bytes'] - compressed['bytes']) * 8
+    extra_seconds = compressed['p50_ms'] / 1000 - plain['p50_ms'] / 1000
+    if saved_bits <= 0:
+        return 0.0
+    if extra_seconds <= 0:
+        return float('inf')
+    return saved_bits / extra_seconds / 1e6
+
+
+async def start_server(loop, **handler_params):
+    app = web.Application(loop=loop)
+    app['websockets'] = []
+    app.router.add_route('GET', '/ws/json-rpc',
+                         create_default_rpc_websocket_handler(
+                             services=(BenchService, ), **handler_params))
+    handler = app.make_handler()
+    server = await loop.create_server(handler, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    async def stop():
+        server.close()
+        await server.wait_closed()
+        await app.shutdown()
+        await handler.shutdown(1.0)
+        await app.cleanup()
+    return 'ws://127.0.0.1:{}/ws/json-rpc'.format(port), stop
+
+
+async def bench_roundtrip(url, serializer_name, kind, size, connections,
+                          calls, client_params=None):
+    _, data_type = SERIALIZERS[serializer_name]
+    method = method_name(kind)
+    payload = 'x' * size
+    latencies = []
+
+    async def run_connection(client, calls):
+        for _ in range(calls):
+            call_started = time.perf_counter()
+            await client.call(method, payload=payload)
+            latencies.append(time.perf_counter() - call_started)
+
+    clients = [Client(url, data_type=data_type, **(client_params or {}))
+               for _ in range(connections)]
+    await asyncio.gather(*(client.__aenter__() for client in clients))
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_connection(client,
+                                              max(1, calls // connections))
+                               for client in clients))
+        seconds = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(client.__aexit__(None, None, None)
+                               for client in clients))
+    return summarize(roundtrip_name(serializer_name, kind, size,
+                                    connections),
+                     latencies, seconds)
+
+
+def roundtrip_name(serializer_name, kind, size, connections):
+    return 'roundtrip/{}/{}/{}/c{}'.format(serializer_name, kind,
+                                           format_size(size), connections)
+
+
+async def run(loop, calls, name_filter):
+    results = []
+
+    def report(result):
+        results.append(result)
+        print('{name:<42} {calls_per_sec:>12.1f} calls/s '
+              'p50 {p50_ms:>8.3f} ms  p99 {p99_ms:>8.3f} ms'.format(**result))
+
+    for serializer_name, kind, size in product(SERIALIZERS, SERVICE_KINDS,
+                                               PAYLOAD_SIZES):
+        if name_filter in dispatch_name(serializer_name, kind, size):
+            report(await bench_dispatch(serializer_name, kind, size, calls))
+
+    for serializer_name, size in product(SERIALIZERS, COMPRESSION_SIZES):
+        levels = [level for level in COMPRESSION_LEVELS
+                  if name_filter in compression_name(serializer_name, size,
+                                                     level)]
+        if not levels:
+            continue
+        # The plain case is the reference of the break-even speed,
+        # it's run even if only reported when selected.
+        plain = bench_compression(serializer_name, size, None, calls)
+        if None in levels:
+            report(plain)
+            print('{:<42} {:>12} bytes'.format('', plain['bytes']))
+        for level in levels:
+            if level is None:
+                continue
+            result = bench_compression(serializer_name, size, level, calls)
+            report(result)
+            print('{:<42} {:>12} bytes, pays off below {:.1f} '
+                  'Mbit/s'.format('', result['bytes'],
+                                  break_even_mbps(plain, result)))
+
+    roundtrips = [case for case in product(SERIALIZERS, SERVICE_KINDS,
+                                           PAYLOAD_SIZES, CONNECTIONS)
+                  if name_filter in roundtrip_name(*case)]
+    if not roundtrips:
+        return results
+    url, stop = await start_server(loop)
+    try:
+        for serializer_name, kind, size, connections in roundtrips:
+            report(await bench_roundtrip(url, serializer_name, kind, size,
+                                         connections, calls))
+    finally:
+        await stop()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    baseline = baseline['results']
+    regressions = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None:
+            continue
+        ratio = result['calls_per_sec'] / base['calls_per_sec']
+        if ratio < 1 - tolerance:
+            regressions.append((result['name'], ratio))
+    for name, ratio in regressions:
+        print('REGRESSION {:<42} {:>6.1%} of baseline calls/s'.format(
+            name, ratio))
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as fp:
+        json.dump({
+            'aiojsonrpc': __version__,
+            'aiohttp': aiohttp.__version__,
+            'python': platform.python_version(),
+            'results': {result['name']: result for result in results},
+        }, fp, indent=2, sort_keys=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=2000,
+                        help='calls per case')
+    parser.add_argument('--quick', action='store_true',
+                        help='run 200 calls per case')
+    parser.add_argument('--filter', default='',
+                        help='only run cases whose name contains this')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed calls/s drop against the baseline')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(
+        run(loop, 200 if args.quick else args.calls, args.filter))
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        with open(args.compare) as fp:
+            if compare(results, json.load(fp), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
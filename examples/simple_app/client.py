@@ -26,8 +26,8 @@ async def call_aiojsonrpc_services():
     async with Client(SERVICE_URL, data_type=bytes,
                       session_params=session_params) as client:
         await call(client, 'PrinterService.print', text='Letter')
-        await call(client, 'CameraService.take_photo')
-        await call(client, 'CameraService.take_photo')
+        await asyncio.gather(call(client, 'CameraService.take_photo'),
+                             call(client, 'CameraService.take_photo'))
         await call(client, 'PrinterService.get_firmware_version')
 
     async with Client(SERVICE_URL, data_type=str,
@@ -1,8 +1,14 @@
 import asyncio
 from aiohttp import web
+from aiojsonrpc.connection import ConnectionRegistry
+from aiojsonrpc.metrics import Metrics
+from aiojsonrpc.metrics import metrics_handler
+from aiojsonrpc.constants import ServiceLifetime
 from aiojsonrpc.service import Service
+from aiojsonrpc.request_handler import create_default_rpc_http_handler
 from aiojsonrpc.request_handler import create_default_rpc_websocket_handler
 from aiojsonrpc.util import rpc_method
+from aiojsonrpc.workers import run_workers
 from random import SystemRandom
 from uuid import uuid4
 
@@ -17,6 +23,8 @@ class PrinterService(Service):
 
 
 class CameraService(Service):
+    lifetime = ServiceLifetime.SINGLETON
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._rnd = SystemRandom()
@@ -32,12 +40,18 @@ class CameraService(Service):
 
 def create_app():
     services = (PrinterService, CameraService, )
-    ws_handler = create_default_rpc_websocket_handler(services=services)
+    metrics = Metrics()
+    ws_handler = create_default_rpc_websocket_handler(services=services,
+                                                      metrics=metrics)
     app = web.Application()
-    app['websockets'] = []
+    app['websockets'] = ConnectionRegistry()
     app.router.add_route('GET', '/ws/json-rpc', ws_handler)
+    app.router.add_route('POST', '/json-rpc',
+                         create_default_rpc_http_handler(services=services,
+                                                         metrics=metrics))
+    app.router.add_route('GET', '/metrics', metrics_handler(metrics))
     return app
 
 
 if __name__ == '__main__':
-    web.run_app(create_app(), port=8888)
+    run_workers(create_app, port=8888, broadcast=True)
@@ -27,6 +27,11 @@ install_requires = [
     'msgpack-python>=0.4.7',
 ]
 
+extras_require = {
+    'orjson': ['orjson'],
+    'rapidjson': ['python-rapidjson'],
+}
+
 
 setup_requires = [
     'pytest-runner>=2.7',
@@ -77,6 +82,7 @@ setup(
     license='Apache 2',
     packages=packages,
     install_requires=install_requires,
+    extras_require=extras_require,
     setup_requires=setup_requires,
     tests_require=tests_require,
     include_package_data=True,
@@ -0,0 +1,128 @@
+import pytest
+from unittest import mock
+from aiojsonrpc.cache import MISSING
+from aiojsonrpc.cache import ResultCache
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.request_handler import create_default_rpc_websocket_handler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+@pytest.fixture(scope='function')
+def calls():
+    return []
+
+
+@pytest.fixture(scope='function')
+def cached_service(calls):
+    class CachedService(Service):
+        @rpc_method(cache_maxsize=10, cache_key=('name', ))
+        def greet(self, name='', greeting='Hello'):
+            calls.append(name)
+            return '{}, {}'.format(greeting, name)
+    return CachedService
+
+
+def request(name, id=1, positional=False):
+    return json.dumps({'jsonrpc': '2.0', 'method': 'CachedService.greet',
+                       'params': [name] if positional else {'name': name},
+                       'id': id})
+
+
+def test_lru():
+    cache = ResultCache(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        cache.set('json', cache.make_key({'key': key}), key)
+    assert cache.get('json', cache.make_key({'key': 'a'})) is MISSING
+    assert cache.get('json', cache.make_key({'key': 'c'})) == 'c'
+    assert len(cache) == 2
+
+
+def test_ttl():
+    cache = ResultCache(ttl=10)
+    with mock.patch('aiojsonrpc.cache.monotonic', return_value=100):
+        cache.set('json', 'key', 'value')
+    with mock.patch('aiojsonrpc.cache.monotonic', return_value=105):
+        assert cache.get('json', 'key') == 'value'
+    with mock.patch('aiojsonrpc.cache.monotonic', return_value=110):
+        assert cache.get('json', 'key') is MISSING
+
+
+def test_make_key():
+    assert ResultCache().make_key({'a': [1, {'b': 2}]}) == (
+        ('a', (1, (('b', 2), ))), )
+    assert ResultCache(key=('a', )).make_key({'a': 1, 'b': 2}) == (1, )
+    assert ResultCache().make_key([1, 2]) is None
+
+
+def test_invalidate():
+    cache = ResultCache()
+    cache.set('json', cache.make_key({'a': 1}), 1)
+    cache.set('msgpack', cache.make_key({'a': 1}), 1)
+    cache.set('json', cache.make_key({'a': 2}), 2)
+    cache.invalidate({'a': 1})
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_call(cached_service, calls):
+    msg_handler = WebSocketMessageHandler()
+    services = {'CachedService': cached_service()}
+    for id in (1, 2):
+        response = await msg_handler._call_service(
+            services, request('world', id), json)
+        assert json.loads(response) == {
+            'jsonrpc': '2.0', 'result': 'Hello, world', 'id': id}
+    assert calls == ['world']
+    await msg_handler._call_service(services, request('foo'), json)
+    assert calls == ['world', 'foo']
+    cached_service.invalidate_cache('greet', name='world')
+    await msg_handler._call_service(services, request('world'), json)
+    await msg_handler._call_service(services, request('foo'), json)
+    assert calls == ['world', 'foo', 'world']
+    cached_service.invalidate_cache('greet')
+    await msg_handler._call_service(services, request('foo'), json)
+    assert calls == ['world', 'foo', 'world', 'foo']
+
+
+@pytest.mark.asyncio
+async def test_cached_positional_call(cached_service, calls):
+    msg_handler = WebSocketMessageHandler()
+    services = {'CachedService': cached_service()}
+    for positional in (True, False, True):
+        response = await msg_handler._call_service(
+            services, request('world', positional=positional), json)
+        assert json.loads(response)['result'] == 'Hello, world'
+    assert calls == ['world']
+
+
+@pytest.mark.asyncio
+async def test_service_wide_cache(calls):
+    class GreetService(Service):
+        @rpc_method
+        def greet(self, name=''):
+            calls.append(name)
+            return 'Hello, {}'.format(name)
+
+    class OtherService(Service):
+        pass
+
+    handler = create_default_rpc_websocket_handler()
+    handler.register_service(GreetService, cache_ttl=60)
+    msg_handler = WebSocketMessageHandler()
+    data = json.dumps({'jsonrpc': '2.0', 'method': 'GreetService.greet',
+                       'params': {'name': 'world'}, 'id': 1})
+
+    async def call():
+        await msg_handler._call_service(handler._get_services(), data, json)
+
+    await call()
+    handler.register_service(OtherService)
+    await call()
+    assert calls == ['world']
+    GreetService.invalidate_cache('greet', name='world')
+    await call()
+    assert calls == ['world', 'world']
@@ -0,0 +1,115 @@
+import aiohttp
+import asyncio
+import pytest
+from unittest import mock
+from aiojsonrpc.cancellation import InFlightCalls
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+class SlowService(Service):
+    finished = []
+
+    @rpc_method
+    async def sleep(self, seconds=0):
+        await asyncio.sleep(seconds)
+        self.finished.append(seconds)
+        return seconds
+
+
+def create_msg(request):
+    msg = mock.Mock()
+    msg.tp = aiohttp.MsgType.text
+    msg.data = json.dumps(request)
+    return msg
+
+
+def create_request(id=1, **members):
+    return {'jsonrpc': '2.0', 'method': 'SlowService.sleep',
+            'id': id, **members}
+
+
+@pytest.fixture
+def msg_handler():
+    return WebSocketMessageHandler()
+
+
+@pytest.fixture
+def ws():
+    ws = mock.Mock()
+    ws.closed = False
+    ws.messages = []
+    ws.send_str.side_effect = lambda data: ws.messages.append(
+        json.loads(data))
+    return ws
+
+
+@pytest.fixture
+def services():
+    del SlowService.finished[:]
+    return ServiceMap(create_dispatch_table({'SlowService': SlowService}),
+                      {'SlowService': SlowService()}, calls=InFlightCalls())
+
+
+def test_in_flight_calls():
+    calls = InFlightCalls()
+    task = mock.Mock()
+    assert calls.add(1, task)
+    assert not calls.add(1, mock.Mock())
+    assert 1 in calls
+    assert calls.cancel(1)
+    assert task.cancel.called
+    assert calls.was_cancelled(1)
+    assert not calls.cancel(1)
+    calls.discard(1)
+    assert not calls.was_cancelled(1)
+    assert not calls
+
+
+@pytest.mark.asyncio
+async def test_request_timeout(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request(params={'seconds': 1}, timeout=0.01)),
+        services)
+    assert ws.messages[-1]['error']['code'] == (
+        RpcErrorCode.REQUEST_TIMEOUT.value)
+    await msg_handler.handle_message(
+        ws, create_msg(create_request(params={'seconds': 0}, timeout=1)),
+        services)
+    assert ws.messages[-1]['result'] == 0
+    assert SlowService.finished == [0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('timeout', [0, -1, 'soon', True])
+async def test_invalid_timeout(msg_handler, ws, services, timeout):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request(timeout=timeout)), services)
+    assert ws.messages[-1]['error']['code'] == (
+        RpcErrorCode.INVALID_REQUEST.value)
+
+
+@pytest.mark.asyncio
+async def test_cancel(msg_handler, ws, services):
+    call = asyncio.ensure_future(msg_handler.handle_message(
+        ws, create_msg(create_request(params={'seconds': 1})), services))
+    await asyncio.sleep(0.01)
+    assert 1 in services.calls
+    await msg_handler.handle_message(
+        ws, create_msg({'jsonrpc': '2.0', 'method': 'rpc.cancel',
+                        'params': {'id': 1}}),
+        services)
+    await call
+    assert ws.messages == [{
+        'jsonrpc': '2.0',
+        'error': {'code': RpcErrorCode.REQUEST_CANCELLED.value,
+                  'message': 'Request cancelled'},
+        'id': 1,
+    }]
+    assert not services.calls
+    assert not SlowService.finished
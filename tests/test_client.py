@@ -1,73 +1,116 @@
+import aiohttp
+import asyncio
 import pytest
 from aiojsonrpc.exception import RpcError
 from aiojsonrpc.exception import RpcErrorCode
 from aiojsonrpc.serializer import json
 from aiojsonrpc.client import Client
 from aiojsonrpc.request_handler import WebSocketMessageHandler
+from tests.util import collect
 from tests.util import coro_mock
 from collections import namedtuple
-from functools import partial
 from unittest import mock
 
 
-def rpc_result_args():
-    return 1, 42, json
+def rpc_result_args(id=1):
+    return id, 42, json
 
 
-def rpc_error_args():
-    return 1, 'Method not found', RpcErrorCode.METHOD_NOT_FOUND, json
+def rpc_error_args(id=1):
+    return id, 'Method not found', RpcErrorCode.METHOD_NOT_FOUND, json
 
 
-def ws_receive_result():
-    return WebSocketMessageHandler().create_result(*rpc_result_args())
+def ws_receive_result(request):
+    return WebSocketMessageHandler().create_result(
+        *rpc_result_args(request['id']))
 
 
-def ws_receive_error():
-    return WebSocketMessageHandler().create_error(*rpc_error_args())
+def ws_receive_error(request):
+    return WebSocketMessageHandler().create_error(
+        *rpc_error_args(request['id']))
 
 
-def msg(data):
-    return namedtuple('Msg', 'data')(data=data)
-
-
-msg_result = partial(msg, ws_receive_result())
-msg_error = partial(msg, ws_receive_error())
+def msg(data, tp=aiohttp.MsgType.text):
+    return namedtuple('Msg', 'tp data')(tp=tp, data=data)
 
 
 @pytest.fixture(scope='function')
 def mock_websocket_response():
     class MockWebSocketResponse():
-        def __init__(self, res):
-            self._res = res
+        """ Answers every request with `create_response(request)`
+        once `delay(request)` seconds have passed.
+        """
+        def __init__(self, create_response, delay=lambda request: 0,
+                     protocol=None):
+            self.protocol = protocol
+            self.closed = False
+            self._create_response = create_response
+            self._delay = delay
+            self._responses = None
+            self.requests = []
+
+        @property
+        def responses(self):
+            if self._responses is None:
+                self._responses = asyncio.Queue()
+            return self._responses
 
         @property
         def is_error_response(self):
             try:
-                json.loads(self._res.data)['result']
+                json.loads(self._create_response({'id': 1}))['result']
             except KeyError:
                 return True
             else:
                 return False
 
+        def _respond(self, request):
+            if 'id' not in request:
+                return
+            self.responses.put_nowait(msg(self._create_response(request)))
+
         async def receive(self):
-            return self._res
+            return await self.responses.get()
 
-        async def send_str(self, msg):
-            pass
+        def send_str(self, data):
+            request = json.loads(data)
+            if isinstance(request, list):
+                self.requests.extend(request)
+                self.responses.put_nowait(msg(json.dumps([
+                    json.loads(self._create_response(item))
+                    for item in request])))
+                return
+            self.requests.append(request)
+            asyncio.get_event_loop().call_later(self._delay(request),
+                                                self._respond, request)
 
-        async def send_bytes(self, msg):
+        def send_bytes(self, data):
             pass
 
         async def close(self):
-            pass
+            self.closed = True
+            self.responses.put_nowait(msg(None, aiohttp.MsgType.closed))
     return MockWebSocketResponse
 
 
-@pytest.fixture(scope='function', params=[msg_result(), msg_error()])
+@pytest.fixture(scope='function', params=[ws_receive_result,
+                                          ws_receive_error])
 def ws_response(request, mock_websocket_response):
     return mock_websocket_response(request.param)
 
 
+@pytest.fixture(scope='function')
+def mock_client_session():
+    """ Patches `aiohttp.ClientSession` for the test. Returns a function
+    making the session connect to a given websocket response.
+    """
+    with mock.patch('aiohttp.ClientSession') as MockClientSession:
+        def connect_to(ws_response):
+            session_instance = MockClientSession.return_value
+            session_instance.ws_connect = coro_mock(return_value=ws_response)
+        yield connect_to
+
+
 async def _make_call(client):
     return await client.call('TestService.test_method', foo='bar')
 
@@ -84,12 +127,271 @@ async def _on_success(client):
 
 
 @pytest.mark.asyncio
-async def test_call(ws_response):
+async def test_call(ws_response, mock_client_session):
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        if ws_response.is_error_response:
+            await _on_error(client)
+        else:
+            await _on_success(client)
+
+
+@pytest.mark.asyncio
+async def test_undecodable_messages(mock_websocket_response,
+                                    mock_client_session):
+    ws_response = mock_websocket_response(ws_receive_result)
+    for data in ('{"jsonrpc": ', b'\x93\x01', '[1, "x"]',
+                 '{"jsonrpc": "2.0", "method": "news"}'):
+        ws_response.responses.put_nowait(msg(data))
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        await _on_success(client)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls(mock_websocket_response, mock_client_session):
+    def create_response(request):
+        return WebSocketMessageHandler().create_result(
+            request['id'], request['params']['n'], json)
+
+    ws_response = mock_websocket_response(
+        create_response, delay=lambda request: 0.05 / request['id'])
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        results = await asyncio.gather(*(
+            client.call('TestService.test_method', n=n)
+            for n in range(5)))
+        assert results == list(range(5))
+        assert client.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_call_timeout(mock_websocket_response, mock_client_session):
+    ws_response = mock_websocket_response(ws_receive_result,
+                                          delay=lambda request: 1)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        with pytest.raises(asyncio.TimeoutError):
+            await client.call('TestService.test_method', timeout=0.01)
+        assert client.pending == 0
+        request, cancel = ws_response.requests
+        assert request['timeout'] == 0.01
+        assert cancel == {'jsonrpc': '2.0', 'method': 'rpc.cancel',
+                          'params': {'id': request['id']}}
+
+
+@pytest.mark.asyncio
+async def test_batch(mock_websocket_response, mock_client_session):
+    def create_response(request):
+        if request['method'] == 'TestService.absent_method':
+            return ws_receive_error(request)
+        return WebSocketMessageHandler().create_result(
+            request['id'], request['params']['n'], json)
+
+    ws_response = mock_websocket_response(create_response)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        results = await client.batch([
+            ('TestService.test_method', {'n': 1}),
+            ('TestService.absent_method', {}),
+            ('TestService.test_method', {'n': 3}),
+        ])
+        assert results[0] == 1
+        assert isinstance(results[1], RpcError)
+        assert results[2] == 3
+        assert len(ws_response.requests) == 3
+        assert client.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_rejected(mock_websocket_response, mock_client_session):
+    class BatchRejectingResponse(mock_websocket_response):
+        def send_str(self, data):
+            self.requests.extend(json.loads(data))
+            self.responses.put_nowait(msg(
+                WebSocketMessageHandler().create_error(
+                    None, 'Parse error', RpcErrorCode.PARSE_ERROR, json)))
+
+    mock_client_session(BatchRejectingResponse(ws_receive_result))
+    async with Client('http://example.com/ws/rpc') as client:
+        with pytest.raises(RpcError) as e:
+            await asyncio.wait_for(client.batch([
+                ('TestService.test_method', {'n': 1}),
+                ('TestService.test_method', {'n': 2}),
+            ]), 1)
+        assert 'Parse error' in str(e)
+        assert client.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_notify(ws_response, mock_client_session):
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        client.notify('TestService.test_method', foo='bar')
+        assert ws_response.requests == [{
+            'jsonrpc': '2.0',
+            'method': 'TestService.test_method',
+            'params': {'foo': 'bar'},
+        }]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('protocol,data_type', [('msgpack-bin', bytes),
+                                                (None, str)])
+async def test_serializer_negotiation(mock_websocket_response, protocol,
+                                      data_type, mock_client_session):
+    ws_response = mock_websocket_response(ws_receive_result,
+                                          protocol=protocol)
+    mock_client_session(ws_response)
+    client = Client('http://example.com/ws/rpc',
+                    serializer='msgpack-bin')
+    async with client:
+        ws_connect = client._session.ws_connect
+        assert ws_connect.call_args[1]['protocols'] == ('msgpack-bin',
+                                                        'json')
+        assert client._data_type is data_type
+
+
+@pytest.mark.asyncio
+async def test_ws_params(mock_websocket_response, mock_client_session):
+    mock_client_session(mock_websocket_response(ws_receive_result))
+    client = Client('http://example.com/ws/rpc',
+                    ws_params={'heartbeat': 30})
+    async with client:
+        assert client._session.ws_connect.call_args[1] == {
+            'heartbeat': 30, 'protocols': ('json', )}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('data_type,protocol', [(str, 'json'),
+                                                (bytes, 'msgpack')])
+async def test_default_protocol(mock_websocket_response, data_type,
+                                protocol, mock_client_session):
+    mock_client_session(mock_websocket_response(ws_receive_result))
+    client = Client('http://example.com/ws/rpc', data_type=data_type)
+    async with client:
+        ws_connect = client._session.ws_connect
+        assert ws_connect.call_args[1]['protocols'] == (protocol, )
+        assert client._data_type is data_type
+
+
+@pytest.mark.asyncio
+async def test_subscribe(mock_websocket_response, mock_client_session):
+    def notification(**params):
+        return msg(json.dumps({'jsonrpc': '2.0', 'method': 'rpc.subscription',
+                               'params': {'subscription': 7, **params}}))
+
+    def create_response(request):
+        if request['method'] == 'rpc.unsubscribe':
+            return WebSocketMessageHandler().create_result(
+                request['id'], True, json)
+        loop = asyncio.get_event_loop()
+        for item in ('a', 'b'):
+            loop.call_soon(ws_response.responses.put_nowait,
+                           notification(result=item))
+        loop.call_soon(ws_response.responses.put_nowait,
+                       notification(done=True))
+        return WebSocketMessageHandler().create_result(request['id'], 7, json)
+
+    ws_response = mock_websocket_response(create_response)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        subscription = await client.subscribe('TestService.feed')
+        assert subscription.id == 7
+        assert ['a', 'b'] == await collect(subscription)
+        assert not subscription.active
+        assert not client._subscriptions
+
+        async with await client.subscribe('TestService.feed') as feed:
+            async for item in feed:
+                assert item == 'a'
+                break
+        assert not client._subscriptions
+
+
+@pytest.mark.asyncio
+async def test_subscription_unsubscribe(mock_websocket_response,
+                                        mock_client_session):
+    def create_response(request):
+        result = True if request['method'] == 'rpc.unsubscribe' else 7
+        return WebSocketMessageHandler().create_result(request['id'], result,
+                                                       json)
+
+    ws_response = mock_websocket_response(create_response)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        async with await client.subscribe('TestService.feed'):
+            assert 7 in client._subscriptions
+        assert not client._subscriptions
+        assert ws_response.requests[-1]['method'] == 'rpc.unsubscribe'
+        assert ws_response.requests[-1]['params'] == {'subscription': 7}
+
+
+@pytest.mark.asyncio
+async def test_stream(mock_websocket_response, mock_client_session):
+    def chunk(id, item):
+        return json.dumps({'jsonrpc': '2.0', 'method': 'rpc.chunk',
+                           'params': {'id': id, 'result': item}})
+
+    def create_response(request):
+        """ Sends the first chunk as the response and then, one by one,
+        the rest of them and the actual response.
+        """
+        id, stop = request['id'], request['params']['stop']
+        loop = asyncio.get_event_loop()
+        for item in range(1, stop):
+            loop.call_later(0.001 * item, ws_response.responses.put_nowait,
+                            msg(chunk(id, item)))
+        loop.call_later(0.001 * stop, ws_response.responses.put_nowait,
+                        msg(WebSocketMessageHandler().create_result(
+                            id, stop, json)))
+        return chunk(id, 0)
+
+    ws_response = mock_websocket_response(create_response)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        stream = client.stream('TestService.rows', window=4, stop=5)
+        assert [0, 1, 2, 3, 4] == await collect(stream)
+        assert stream.result == 5
+        assert not client._streams
+        request, *acks = ws_response.requests
+        assert request['window'] == 4
+        assert [ack['params'] for ack in acks] == [
+            {'id': request['id'], 'credit': 2},
+            {'id': request['id'], 'credit': 2},
+        ]
+
+        async with client.stream('TestService.rows', stop=5) as rows:
+            async for row in rows:
+                break
+        assert ws_response.requests[-1]['method'] == 'rpc.cancel'
+        assert not client._streams
+
+
+@pytest.mark.asyncio
+async def test_cancel(mock_websocket_response, mock_client_session):
+    ws_response = mock_websocket_response(ws_receive_result,
+                                          delay=lambda request: 1)
+    mock_client_session(ws_response)
+    async with Client('http://example.com/ws/rpc') as client:
+        call = asyncio.ensure_future(
+            client.call('TestService.test_method'))
+        await asyncio.sleep(0)
+        request, = ws_response.requests
+        assert 'timeout' not in request
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        assert client.pending == 0
+        assert ws_response.requests[-1]['method'] == 'rpc.cancel'
+
+
+@pytest.mark.asyncio
+async def test_connect_failure_closes_session():
     with mock.patch('aiohttp.ClientSession') as MockClientSession:
-        session_instance = MockClientSession.return_value
-        session_instance.ws_connect = coro_mock(return_value=ws_response)
-        async with Client('http://example.com/ws/rpc') as client:
-            if ws_response.is_error_response:
-                await _on_error(client)
-            else:
-                await _on_success(client)
+        session = MockClientSession.return_value
+        session.ws_connect = coro_mock(side_effect=ConnectionRefusedError())
+        client = Client('http://example.com/ws/rpc')
+        with pytest.raises(ConnectionRefusedError):
+            await client.__aenter__()
+        assert session.close.called
@@ -0,0 +1,79 @@
+import pytest
+from unittest import mock
+from aiojsonrpc.connection import UNKNOWN
+from aiojsonrpc.connection import ConnectionRegistry
+from aiojsonrpc.serializer import json
+from aiojsonrpc.serializer import msgpack
+
+
+def create_ws(closed=False):
+    ws = mock.Mock()
+    ws.closed = closed
+    return ws
+
+
+@pytest.fixture
+def registry():
+    return ConnectionRegistry()
+
+
+def test_add_discard(registry):
+    ws = create_ws()
+    registry.add(ws, tags=('room:1', ))
+    assert ws in registry
+    assert len(registry) == 1
+    assert registry.connections('room:1') == {ws}
+    registry.discard(ws)
+    registry.discard(ws)
+    assert ws not in registry
+    assert not registry.connections('room:1')
+    assert not registry._tagged
+
+
+def test_tag_untag(registry):
+    ws = create_ws()
+    registry.add(ws)
+    registry.tag(ws, 'a', 'b')
+    assert registry.tags(ws) == {'a', 'b'}
+    registry.untag(ws, 'a')
+    assert registry.connections('a') == set()
+    assert registry.connections('b') == {ws}
+
+
+def test_publish(registry):
+    text_ws, binary_ws, other_binary_ws, closed_ws = (
+        create_ws(), create_ws(), create_ws(), create_ws(closed=True))
+    registry.add(text_ws, tags=('room', ))
+    registry.add(binary_ws, serializer=msgpack, tags=('room', ))
+    registry.add(other_binary_ws, serializer=msgpack)
+    registry.add(closed_ws, tags=('room', ))
+    notification = {'jsonrpc': '2.0', 'method': 'news', 'params': [1]}
+
+    assert registry.publish('news', [1], tag='room') == 2
+    text_ws.send_str.assert_called_once_with(json.dumps(notification))
+    binary_ws.send_bytes.assert_called_once_with(msgpack.dumps(notification))
+    assert not other_binary_ws.send_bytes.called
+    assert not closed_ws.send_str.called
+
+    assert registry.publish('news', [1]) == 3
+    assert registry.publish('news', tag='absent') == 0
+
+
+def test_publish_serializes_once(registry):
+    serializer = mock.Mock()
+    serializer.dumps.return_value = 'payload'
+    for _ in range(3):
+        registry.add(create_ws(), serializer=serializer)
+    assert registry.publish('news') == 3
+    serializer.dumps.assert_called_once_with({'jsonrpc': '2.0',
+                                              'method': 'news'})
+
+
+def test_publish_unknown_serializer(registry):
+    ws = create_ws()
+    registry.add(ws, serializer=UNKNOWN)
+    assert registry.publish('news') == 0
+    registry.set_serializer(ws, msgpack)
+    assert registry.publish('news') == 1
+    ws.send_bytes.assert_called_once_with(msgpack.dumps(
+        {'jsonrpc': '2.0', 'method': 'news'}))
@@ -0,0 +1,184 @@
+import asyncio
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aiojsonrpc.constants import ServiceLifetime
+from aiojsonrpc.dispatch import ServiceFactory
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import compile_service
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.executor import BoundedExecutor
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+@pytest.fixture(scope='module')
+def test_service():
+    class TestService(Service):
+        @rpc_method
+        def meth(self, answer=0):
+            return answer
+
+        @rpc_method
+        async def async_meth(self, foo=''):
+            return foo
+
+        @rpc_method
+        def thread_name(self):
+            return threading.current_thread().name
+
+        def non_rpc_meth(self):
+            pass
+
+    return TestService
+
+
+@pytest.fixture(scope='module')
+def executor():
+    executor = ThreadPoolExecutor(max_workers=2,
+                                  thread_name_prefix='rpc-executor')
+    yield executor
+    executor.shutdown()
+
+
+def test_compile_service(test_service):
+    methods = compile_service(test_service)
+    assert set(methods) == {'meth', 'async_meth', 'thread_name'}
+    assert not methods['meth'].is_coroutine
+    assert methods['async_meth'].is_coroutine
+    assert methods is compile_service(test_service)
+
+
+def test_create_dispatch_table(test_service):
+    table = create_dispatch_table({'TestService': test_service})
+    assert set(table) == {'TestService.meth', 'TestService.async_meth',
+                          'TestService.thread_name'}
+    assert table['TestService.meth'].service_name == 'TestService'
+    with pytest.raises(TypeError):
+        table['TestService.foo'] = None
+
+
+@pytest.mark.asyncio
+async def test_rpc_method_call(test_service):
+    services = ServiceMap.from_instances({'TestService': test_service()})
+    rpc_method = services.methods['TestService.async_meth']
+    service = services[rpc_method.service_name]
+    assert 'bar' == await rpc_method(service, {'foo': 'bar'})
+    assert 42 == await services.methods['TestService.meth'](service,
+                                                             {'answer': 42})
+
+
+@pytest.mark.asyncio
+async def test_rpc_method_executor(executor):
+    class ExecutorService(Service):
+        @rpc_method(executor=executor)
+        def thread_name(self):
+            return threading.current_thread().name
+
+    service = ExecutorService()
+    assert (await service('thread_name')).startswith('rpc-executor')
+
+
+@pytest.mark.asyncio
+async def test_service_executor(test_service, executor):
+    table = create_dispatch_table({'TestService': test_service},
+                                  {'TestService': {'executor': executor}})
+    rpc_method = table['TestService.thread_name']
+    assert (await rpc_method(test_service(), {})).startswith('rpc-executor')
+    assert table['TestService.async_meth'].executor is None
+    assert compile_service(test_service)['thread_name'].executor is None
+
+
+@pytest.mark.asyncio
+async def test_bounded_executor(executor):
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def job():
+        with lock:
+            running.append(1)
+            max_running.append(len(running))
+        threading.Event().wait(0.01)
+        with lock:
+            running.pop()
+
+    bounded = BoundedExecutor(executor, max_pending=1)
+    await asyncio.gather(*(bounded.run(job) for _ in range(4)))
+    assert max(max_running) == 1
+
+
+def test_executor_max_pending(executor):
+    class ExecutorService(Service):
+        @rpc_method(executor=executor)
+        def default(self):
+            pass
+
+        @rpc_method(executor=executor, max_pending=5)
+        def bounded(self):
+            pass
+
+    methods = compile_service(ExecutorService)
+    assert methods['default'].executor._max_pending == 2
+    assert methods['bounded'].executor._max_pending == 5
+    table = create_dispatch_table(
+        {'ExecutorService': ExecutorService},
+        {'ExecutorService': {'executor': executor, 'max_pending': 3}})
+    assert table['ExecutorService.default'].executor._max_pending == 3
+    assert table['ExecutorService.bounded'].executor._max_pending == 5
+
+
+@pytest.mark.parametrize('lifetime,same_connection,other_connection', [
+    (ServiceLifetime.SINGLETON, True, True),
+    (ServiceLifetime.CONNECTION, True, False),
+    ('call', False, False),
+])
+def test_service_lifetime(test_service, lifetime, same_connection,
+                          other_connection):
+    factories = {'TestService': ServiceFactory(test_service, lifetime)}
+    methods = create_dispatch_table({'TestService': test_service})
+    services = ServiceMap(methods, factories=factories,
+                          context={'user': 'foo'})
+    other_services = ServiceMap(methods, factories=factories)
+    assert not services
+    instance = services['TestService']
+    assert (instance is services['TestService']) is same_connection
+    assert (instance is other_services['TestService']) is other_connection
+    expected_context = ({} if ServiceLifetime(lifetime) is
+                        ServiceLifetime.SINGLETON else {'user': 'foo'})
+    assert instance.context == expected_context
+    with pytest.raises(KeyError):
+        services['AbsentService']
+
+
+def test_service_lifetime_attribute(test_service):
+    class SingletonService(test_service):
+        lifetime = ServiceLifetime.SINGLETON
+
+    assert (ServiceFactory(SingletonService).lifetime is
+            ServiceLifetime.SINGLETON)
+    assert (ServiceFactory(SingletonService, 'call').lifetime is
+            ServiceLifetime.CALL)
+
+
+@pytest.mark.asyncio
+async def test_rpc_method_with_context():
+    class ContextService(Service):
+        @rpc_method(with_context=True)
+        def whoami(self, context, prefix=''):
+            return prefix + context['user']
+
+    rpc_method_ = compile_service(ContextService)['whoami']
+    assert 'me: foo' == await rpc_method_(ContextService(), {'prefix': 'me: '},
+                                          {'user': 'foo'})
+    assert 'bar' == await ContextService(user='bar')('whoami')
+
+
+def test_rpc_method_with_context_not_cached():
+    class ContextService(Service):
+        @rpc_method(with_context=True, cache_ttl=60)
+        def whoami(self, context):
+            return context['user']
+
+    with pytest.raises(ValueError):
+        compile_service(ContextService)
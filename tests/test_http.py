@@ -0,0 +1,98 @@
+import aiohttp
+import pytest
+from aiohttp import web
+from aiojsonrpc.client import HttpClient
+from aiojsonrpc.exception import RpcError
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.request_handler import RpcHttpHandler
+from aiojsonrpc.request_handler import create_default_rpc_http_handler
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+class EchoService(Service):
+    notified = []
+
+    @rpc_method
+    def echo(self, text=''):
+        return text
+
+    @rpc_method
+    def notify(self, text=''):
+        self.notified.append(text)
+
+
+@pytest.fixture
+def server_url(event_loop):
+    app = web.Application(loop=event_loop)
+    app.router.add_route('POST', '/json-rpc',
+                         create_default_rpc_http_handler(
+                             services=(EchoService, )))
+    handler = app.make_handler()
+    server = event_loop.run_until_complete(
+        event_loop.create_server(handler, '127.0.0.1', 0))
+    yield 'http://127.0.0.1:{}/json-rpc'.format(
+        server.sockets[0].getsockname()[1])
+    server.close()
+    event_loop.run_until_complete(server.wait_closed())
+    event_loop.run_until_complete(app.shutdown())
+    event_loop.run_until_complete(handler.shutdown(1.0))
+    event_loop.run_until_complete(app.cleanup())
+
+
+def test_create_default_rpc_http_handler():
+    handler = create_default_rpc_http_handler(services=(EchoService, ))
+    assert isinstance(handler, RpcHttpHandler)
+    assert set(handler.methods) == {'EchoService.echo', 'EchoService.notify'}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('serializer', ['json', 'msgpack', 'msgpack-bin'])
+async def test_http_call(server_url, serializer):
+    async with HttpClient(server_url, serializer=serializer) as client:
+        assert 'foo' == await client.call('EchoService.echo', text='foo')
+        assert 'bar' == await client.call('EchoService.echo', text='bar',
+                                          timeout=1)
+        assert 'baz' == await client.call('EchoService.echo', 'baz')
+        with pytest.raises(TypeError):
+            await client.call('EchoService.echo', 'baz', text='baz')
+        with pytest.raises(RpcError) as e:
+            await client.call('EchoService.absent')
+        assert e.value.rpc_error_code == RpcErrorCode.METHOD_NOT_FOUND.value
+
+
+@pytest.mark.asyncio
+async def test_http_batch_and_notify(server_url):
+    async with HttpClient(server_url) as client:
+        results = await client.batch([('EchoService.echo', {'text': 'a'}),
+                                      ('EchoService.absent', {}),
+                                      ('EchoService.echo', {'text': 'c'})])
+        assert results[0] == 'a'
+        assert isinstance(results[1], RpcError)
+        assert results[2] == 'c'
+        assert await client.notify('EchoService.notify', text='n') is None
+        assert EchoService.notified[-1] == 'n'
+
+
+@pytest.mark.asyncio
+async def test_http_shared_session(server_url):
+    session = aiohttp.ClientSession()
+    try:
+        for _ in range(2):
+            async with HttpClient(server_url, session=session) as client:
+                assert 'foo' == await client.call('EchoService.echo',
+                                                  text='foo')
+        assert not session.closed
+    finally:
+        session.close()
+
+
+@pytest.mark.asyncio
+async def test_http_unsupported_media_type(server_url):
+    session = aiohttp.ClientSession()
+    try:
+        async with session.post(server_url, data='{}', headers={
+                'Content-Type': 'text/plain'}) as response:
+            assert response.status == 415
+    finally:
+        session.close()
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.limits import Limits
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+@pytest.fixture(scope='module')
+def slow_service():
+    class SlowService(Service):
+        @rpc_method
+        async def sleep(self):
+            await asyncio.sleep(0.01)
+            return 'done'
+    return SlowService
+
+
+def test_per_connection_limit():
+    limits = Limits(per_connection=1)
+    connection, other_connection = limits.connection(), limits.connection()
+    assert connection.acquire('FooService')
+    assert not connection.acquire('FooService')
+    assert other_connection.acquire('FooService')
+    connection.release('FooService')
+    assert connection.acquire('FooService')
+    assert limits.stats() == {'in_flight': 2, 'rejected': 1,
+                              'services': {'FooService': 2}}
+
+
+def test_per_service_limit():
+    limits = Limits(per_service={'FooService': 1})
+    connection = limits.connection()
+    assert connection.acquire('FooService')
+    assert not limits.connection().acquire('FooService')
+    assert connection.acquire('BarService')
+    assert Limits(per_service=1).connection().acquire('FooService')
+
+
+def test_total_limit():
+    limits = Limits(total=2)
+    assert limits.connection().acquire('FooService')
+    assert limits.connection().acquire('BarService')
+    assert not limits.connection().acquire('BazService')
+    assert limits.stats()['rejected'] == 1
+
+
+@pytest.mark.asyncio
+async def test_server_busy(slow_service):
+    limits = Limits(per_connection=2)
+    services = ServiceMap(create_dispatch_table({'SlowService': slow_service}),
+                          {'SlowService': slow_service()},
+                          limits=limits.connection())
+    batch = [{'jsonrpc': '2.0', 'method': 'SlowService.sleep', 'id': id}
+             for id in range(3)]
+    responses = json.loads(await WebSocketMessageHandler()._call_service(
+        services, json.dumps(batch), json))
+    assert sorted(response.get('result', '') for response in responses) == [
+        '', 'done', 'done']
+    assert [response['error']['code'] for response in responses
+            if 'error' in response] == [RpcErrorCode.SERVER_BUSY.value]
+    assert limits.stats() == {'in_flight': 0, 'rejected': 1, 'services': {}}
@@ -0,0 +1,70 @@
+import pytest
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.metrics import Histogram
+from aiojsonrpc.metrics import Metrics
+from aiojsonrpc.metrics import metrics_handler
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+
+
+@pytest.fixture(scope='module')
+def test_service():
+    class TestService(Service):
+        @rpc_method
+        def test_method(self):
+            return 'test result'
+    return TestService
+
+
+def request(method, id=1):
+    return json.dumps({'jsonrpc': '2.0', 'method': method, 'id': id})
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert list(histogram.cumulative_counts()) == [
+        (0.1, 2), (1, 3), (float('inf'), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+def test_render():
+    metrics = Metrics(buckets=(0.1, ))
+    metrics.observe_call('TestService.test_method', 0.05)
+    metrics.observe_error(None, RpcErrorCode.PARSE_ERROR)
+    metrics.connection_opened()
+    text = metrics.render()
+    assert ('aiojsonrpc_calls_total{method="TestService.test_method"} 1'
+            in text)
+    assert ('aiojsonrpc_errors_total{method="unknown",code="PARSE_ERROR"} 1'
+            in text)
+    assert ('aiojsonrpc_call_duration_seconds_bucket'
+            '{method="TestService.test_method",le="0.1"} 1' in text)
+    assert ('aiojsonrpc_call_duration_seconds_bucket'
+            '{method="TestService.test_method",le="+Inf"} 1' in text)
+    assert 'aiojsonrpc_connections 1' in text
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_metrics(test_service):
+    metrics = Metrics()
+    msg_handler = WebSocketMessageHandler(metrics=metrics)
+    services = {'TestService': test_service()}
+    for method in ('TestService.test_method', 'TestService.absent_method'):
+        await msg_handler._call_service(services, request(method), json)
+    await msg_handler._call_service(services, '{', json)
+    assert metrics.calls == {'TestService.test_method': 1}
+    assert metrics.errors == {('unknown', 'METHOD_NOT_FOUND'): 1,
+                              ('unknown', 'PARSE_ERROR'): 1}
+    assert metrics.serialization_durations['json'].count == 6
+
+
+@pytest.mark.asyncio
+async def test_metrics_handler():
+    metrics = Metrics()
+    response = await metrics_handler(metrics)(None)
+    assert response.text == metrics.render()
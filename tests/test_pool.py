@@ -0,0 +1,148 @@
+import asyncio
+import pytest
+from aiojsonrpc.pool import Balancing
+from aiojsonrpc.pool import ClientPool
+
+
+class FakeClient(object):
+    """ Answers every call with the url and the call number
+    once `delay` seconds have passed; fails to connect `failures` times.
+    """
+    instances = []
+    failures = {}
+    dropping = set()
+
+    def __init__(self, url, delay=0):
+        self.url = url
+        self.delay = delay
+        self.calls = 0
+        self.exited = False
+        self._closed = None
+
+    async def __aenter__(self):
+        if self.failures.get(self.url):
+            self.failures[self.url] -= 1
+            raise ConnectionRefusedError(self.url)
+        self._closed = asyncio.Event()
+        self.instances.append(self)
+        if self.url in self.dropping:
+            self._closed.set()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.exited = True
+        self._closed.set()
+
+    @property
+    def closed(self):
+        return self._closed is None or self._closed.is_set()
+
+    async def wait_closed(self):
+        await self._closed.wait()
+
+    async def call(self, method, *, timeout=None, **params):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.url
+
+    def lose_connection(self):
+        self._closed.set()
+
+
+@pytest.fixture(autouse=True)
+def fake_clients():
+    del FakeClient.instances[:]
+    FakeClient.failures.clear()
+    FakeClient.dropping.clear()
+
+
+async def wait_connected(pool, count):
+    while sum(connection.available for connection in pool.connections) < count:
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_round_robin():
+    async with ClientPool(['ws://a', 'ws://b'], size=2,
+                          balancing='round-robin',
+                          client_factory=FakeClient) as pool:
+        await wait_connected(pool, 4)
+        results = [await pool.call('Service.method') for _ in range(8)]
+        assert results.count('ws://a') == results.count('ws://b') == 4
+        assert [client.calls for client in FakeClient.instances] == [2] * 4
+    assert all(client.exited for client in FakeClient.instances)
+
+
+@pytest.mark.asyncio
+async def test_least_in_flight():
+    async with ClientPool(['ws://a', 'ws://b'],
+                          balancing=Balancing.LEAST_IN_FLIGHT,
+                          client_factory=FakeClient, delay=0.01) as pool:
+        await wait_connected(pool, 2)
+        calls = [asyncio.ensure_future(pool.call('Service.method'))
+                 for _ in range(4)]
+        await asyncio.sleep(0)
+        assert [connection.in_flight
+                for connection in pool.connections] == [2, 2]
+        assert pool.in_flight == 4
+        await asyncio.gather(*calls)
+        assert pool.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_reconnect():
+    FakeClient.failures['ws://a'] = 2
+    async with ClientPool(['ws://a'], reconnect_delay=0.001,
+                          client_factory=FakeClient) as pool:
+        assert 'ws://a' == await asyncio.wait_for(
+            pool.call('Service.method'), 1)
+        client, = FakeClient.instances
+        client.lose_connection()
+        await asyncio.sleep(0.01)
+        assert client.exited
+        assert 'ws://a' == await pool.call('Service.method')
+        assert len(FakeClient.instances) == 2
+
+
+@pytest.mark.asyncio
+async def test_reconnect_backoff_after_drop():
+    FakeClient.dropping.add('ws://a')
+    async with ClientPool(['ws://a'], reconnect_delay=0.02,
+                          max_reconnect_delay=1.0,
+                          client_factory=FakeClient):
+        await asyncio.sleep(0.1)
+    # Delays of about 0.02, 0.04 and 0.08 s at most fit in 0.1 s.
+    assert 2 <= len(FakeClient.instances) <= 5
+
+
+@pytest.mark.asyncio
+async def test_drain():
+    pool = ClientPool(['ws://a', 'ws://b'], client_factory=FakeClient,
+                      delay=0.02)
+    pool.start()
+    await wait_connected(pool, 2)
+    calls = [asyncio.ensure_future(pool.call('Service.method'))
+             for _ in range(2)]
+    await asyncio.sleep(0)
+    await pool.remove('ws://a')
+    assert calls[0].done()
+    assert [connection.url for connection in pool.connections] == ['ws://b']
+    assert 'ws://b' == await pool.call('Service.method')
+    await pool.close()
+    assert not pool.connections
+    with pytest.raises(ConnectionError):
+        await pool.call('Service.method')
+
+
+@pytest.mark.asyncio
+async def test_call_timeout_waiting_for_connection():
+    FakeClient.failures['ws://a'] = 100
+    async with ClientPool(['ws://a'], reconnect_delay=0.001,
+                          client_factory=FakeClient) as pool:
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.call('Service.method', timeout=0.01)
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        ClientPool(['ws://a'], size=0)
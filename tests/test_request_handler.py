@@ -1,9 +1,13 @@
 import aiohttp
+import asyncio
 import pytest
 from unittest import mock
 from aiojsonrpc import request_handler
+from aiojsonrpc.connection import ConnectionRegistry
 from aiojsonrpc.serializer import msgpack
 from aiojsonrpc.serializer import json
+from aiojsonrpc.serializer import msgpack_bin
+from aiojsonrpc.serializer.deflate import DeflateSerializer
 from aiojsonrpc.service import Service
 from aiojsonrpc.util import rpc_method
 from aiojsonrpc.exception import RpcErrorCode
@@ -29,6 +33,17 @@ def error(method):
         }
 
 
+def request_error(message, code, id=None):
+    return {
+        'jsonrpc': '2.0',
+        'error': {
+            'code': code.value,
+            'message': message,
+        },
+        'id': id,
+    }
+
+
 def msg():
     def _msg(request):
         return request.param
@@ -120,8 +135,9 @@ def invalid_msg_params_binary():
 @pytest.fixture(scope='function')
 def async_iterator():
     class AsyncIterator(object):
-        def __init__(self, seq):
+        def __init__(self, seq, close_delay=0):
             self.iter = iter(seq)
+            self.close_delay = close_delay
 
         async def __aiter__(self):
             return self
@@ -130,6 +146,8 @@ def async_iterator():
             try:
                 return next(self.iter)
             except StopIteration:
+                if self.close_delay:
+                    await asyncio.sleep(self.close_delay)
                 raise StopAsyncIteration
     return AsyncIterator
 
@@ -223,6 +241,197 @@ async def test_msg_handler_on_error(msg_handler, ws, msg_error, services):
     assert not ws.send_bytes.called
 
 
+@pytest.mark.asyncio
+async def test_msg_handler_with_batch(msg_handler, ws, services):
+    batch = [rpc_call(), rpc_call_absent_method()]
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps(batch)), services)
+    assert_send_str_called(ws, [result(), error(batch[1]['method'])])
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_failing_batch_entry(msg_handler, ws):
+    class FailingService(Service):
+        @rpc_method
+        def fail(self):
+            raise ZeroDivisionError()
+
+        @rpc_method
+        def ok(self):
+            return 'ok'
+
+    batch = [{'jsonrpc': '2.0', 'method': 'FailingService.fail', 'id': 1},
+             {'jsonrpc': '2.0', 'method': 'FailingService.fail'},
+             {'jsonrpc': '2.0', 'method': 'FailingService.ok', 'id': 2}]
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps(batch)),
+        {'FailingService': FailingService()})
+    assert_send_str_called(ws, [
+        request_error('Internal error', RpcErrorCode.INTERNAL_ERROR, id=1),
+        {'jsonrpc': '2.0', 'result': 'ok', 'id': 2}])
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_failing_method(msg_handler, ws):
+    class FailingService(Service):
+        @rpc_method
+        def fail(self):
+            raise ValueError()
+
+    request = {'jsonrpc': '2.0', 'method': 'FailingService.fail', 'id': 1}
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps(request)),
+        {'FailingService': FailingService()})
+    assert_send_str_called(ws, request_error(
+        'Internal error', RpcErrorCode.INTERNAL_ERROR, id=1))
+
+
+def test_msg_handler_parse_request(msg_handler):
+    assert msg_handler.parse_request(text_rpc_call(), json) == (
+        'TestService.test_method', {'foo': 'bar', 'answer': 42}, 1)
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_empty_batch(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps([])), services)
+    assert_send_str_called(ws, request_error('Invalid Request',
+                                             RpcErrorCode.INVALID_REQUEST))
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_invalid_request(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps({'id': 1})), services)
+    assert_send_str_called(ws, request_error('Invalid Request',
+                                             RpcErrorCode.INVALID_REQUEST,
+                                             id=1))
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_parse_error(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, '{"method": '), services)
+    assert_send_str_called(ws, request_error('Parse error',
+                                             RpcErrorCode.PARSE_ERROR))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('params,message', [
+    ({'bar': 1}, 'Invalid params: unexpected `bar`'),
+    ([1, 2, 3], 'Invalid params: expected at most 2 params'),
+    ('foo', 'Invalid params: params must be an array or an object'),
+])
+async def test_msg_handler_with_invalid_params(msg_handler, ws, services,
+                                               params, message):
+    request = {**rpc_call(), 'params': params}
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text, json.dumps(request)), services)
+    assert_send_str_called(ws, request_error(message,
+                                             RpcErrorCode.INVALID_PARAMS,
+                                             id=1))
+
+
+def notification(method='TestService.test_method'):
+    request = create_request(method)
+    del request['id']
+    return request
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_notification(msg_handler, ws):
+    calls = []
+
+    class TestService(Service):
+        @rpc_method
+        def test_method(self, **params):
+            calls.append(params)
+
+    services = {'TestService': TestService()}
+    for request in (notification(), notification('TestService.absent')):
+        await msg_handler.handle_message(
+            ws, create_msg(aiohttp.MsgType.text, json.dumps(request)),
+            services)
+    assert calls == [notification()['params']]
+    assert not ws.send_str.called
+    assert not ws.send_bytes.called
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_notification_batch(msg_handler, ws,
+                                                   services):
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text,
+                       json.dumps([notification(), notification()])),
+        services)
+    assert not ws.send_str.called
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.text,
+                       json.dumps([notification(), rpc_call()])),
+        services)
+    assert_send_str_called(ws, [result()])
+
+
+def test_msg_handler_negotiate(msg_handler):
+    assert {'json', 'msgpack', 'msgpack-bin'} <= set(msg_handler.protocols)
+    assert msg_handler.negotiate('msgpack-bin') is msgpack_bin
+    assert msg_handler.negotiate(None) is None
+    msg_handler = request_handler.WebSocketMessageHandler(
+        serializers=['json'])
+    assert msg_handler.protocols == ('json', )
+    assert msg_handler.negotiate('msgpack') is None
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_negotiated_serializer(msg_handler, ws,
+                                                      services):
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.binary, msgpack_bin.dumps(rpc_call())),
+        services, msgpack_bin)
+    assert not ws.send_str.called
+    ws.send_bytes.assert_called_with(msgpack_bin.dumps(result()))
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_deflate(ws, services):
+    json_deflate = DeflateSerializer(json, threshold=64)
+    msg_handler = request_handler.WebSocketMessageHandler(
+        serializers=['json', json_deflate])
+    assert msg_handler.negotiate('json+deflate') is json_deflate
+    client_deflate = DeflateSerializer(json, threshold=0)
+    call = {**rpc_call(), 'params': {'foo': 'x' * 1000}}
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.binary, client_deflate.dumps(call)),
+        services, json_deflate)
+    ws.send_bytes.assert_called_with(json.dumps(result()).encode('utf-8'))
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_corrupt_deflate(msg_handler, services):
+    response = await msg_handler._call_service(
+        services, b'\x78garbage', DeflateSerializer(json))
+    assert json.loads(response.decode('utf-8')) == request_error(
+        'Parse error', RpcErrorCode.PARSE_ERROR)
+
+
+@pytest.mark.asyncio
+async def test_msg_handler_with_binary_result(msg_handler, ws):
+    frame = bytearray(b'\x00\xff' * 1000)
+
+    class BlobService(Service):
+        @rpc_method
+        def blob(self, start=0):
+            return memoryview(frame)[start:]
+
+    call = {'jsonrpc': '2.0', 'method': 'BlobService.blob',
+            'params': {'start': 2}, 'id': 1}
+    await msg_handler.handle_message(
+        ws, create_msg(aiohttp.MsgType.binary, msgpack_bin.dumps(call)),
+        {'BlobService': BlobService()}, msgpack_bin)
+    response = msgpack_bin.loads(ws.send_bytes.call_args[0][0])
+    assert response['result'] == bytes(frame[2:])
+
+
 def test_create_rpc_websocket_handler(test_service):
     req_handler = request_handler.create_rpc_websocket_handler(
         request_handler.WebSocketMessageHandler, services=[test_service])
@@ -247,6 +456,7 @@ async def test_rpc_websocket_handler(MockWebSocketMessageHandler,
         ws_msg_mock.tp = aiohttp.MsgType.close
         ws_instance = MockWebSocketResponse.return_value
         ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
         ws_instance.receive = coro_mock(return_value=ws_msg_mock)
 
         msg_handler = MockWebSocketMessageHandler.return_value
@@ -255,3 +465,168 @@ async def test_rpc_websocket_handler(MockWebSocketMessageHandler,
 
         await request_handler.RpcWebsocketHandler(msg_handler)(req)
         assert msg_handler.handle_message.called
+
+
+@pytest.mark.asyncio
+@mock.patch('aiojsonrpc.request_handler.WebSocketMessageHandler')
+async def test_rpc_websocket_handler_ws_params(MockWebSocketMessageHandler,
+                                               async_iterator):
+    ws_response = 'aiojsonrpc.request_handler.WebSocketResponse'
+    with mock.patch(ws_response) as MockWebSocketResponse:
+        ws_instance = async_iterator(())
+        MockWebSocketResponse.return_value = ws_instance
+        ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
+        msg_handler = MockWebSocketMessageHandler.return_value
+        msg_handler.protocols = ('json', )
+
+        await request_handler.RpcWebsocketHandler(
+            msg_handler, ws_params={'heartbeat': 30})(mock.MagicMock())
+        MockWebSocketResponse.assert_called_once_with(protocols=('json', ),
+                                                      heartbeat=30)
+
+
+@pytest.mark.asyncio
+@mock.patch('aiojsonrpc.request_handler.WebSocketMessageHandler')
+async def test_rpc_websocket_handler_concurrency(MockWebSocketMessageHandler,
+                                                 async_iterator):
+    ws_response = 'aiojsonrpc.request_handler.WebSocketResponse'
+    with mock.patch(ws_response) as MockWebSocketResponse:
+        MockWebSocketResponse.return_value = async_iterator(range(5),
+                                                            close_delay=0.1)
+        ws_instance = MockWebSocketResponse.return_value
+        ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
+
+        in_flight = set()
+        in_flight_history = []
+
+        async def handle_message(ws, msg, services, serializer=None):
+            in_flight.add(msg)
+            in_flight_history.append(len(in_flight))
+            try:
+                await asyncio.sleep(0.01)
+            finally:
+                in_flight.discard(msg)
+
+        msg_handler = MockWebSocketMessageHandler.return_value
+        msg_handler.handle_message = handle_message
+        req = mock.MagicMock()
+
+        await request_handler.RpcWebsocketHandler(msg_handler,
+                                                  concurrency=2)(req)
+        assert len(in_flight_history) == 5
+        assert max(in_flight_history) == 2
+        assert not in_flight
+
+
+@pytest.mark.asyncio
+@mock.patch('aiojsonrpc.request_handler.WebSocketMessageHandler')
+async def test_rpc_websocket_handler_cancels_on_close(
+        MockWebSocketMessageHandler, async_iterator):
+    ws_response = 'aiojsonrpc.request_handler.WebSocketResponse'
+    with mock.patch(ws_response) as MockWebSocketResponse:
+        MockWebSocketResponse.return_value = async_iterator(range(2),
+                                                            close_delay=0.01)
+        ws_instance = MockWebSocketResponse.return_value
+        ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
+        cancelled = []
+
+        async def handle_message(ws, msg, services, serializer=None):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(msg)
+                raise
+
+        msg_handler = MockWebSocketMessageHandler.return_value
+        msg_handler.handle_message = handle_message
+
+        await asyncio.wait_for(request_handler.RpcWebsocketHandler(
+            msg_handler, concurrency=2)(mock.MagicMock()), 1)
+        assert sorted(cancelled) == [0, 1]
+
+
+def test_rpc_websocket_handler_invalid_concurrency():
+    with pytest.raises(ValueError):
+        request_handler.RpcWebsocketHandler(None, concurrency=0)
+
+
+def test_rpc_websocket_handler_lazy_services():
+    instances = []
+
+    class LazyService(Service):
+        def __init__(self, **context):
+            super().__init__(**context)
+            instances.append(self)
+
+    handler = request_handler.create_default_rpc_websocket_handler()
+    handler.register_service(LazyService, lifetime='singleton')
+    services = handler._get_services(user='foo')
+    assert not instances
+    assert services['LazyService'] is handler._get_services()['LazyService']
+    assert len(instances) == 1
+
+
+@pytest.mark.asyncio
+@mock.patch('aiojsonrpc.request_handler.WebSocketMessageHandler')
+async def test_rpc_websocket_handler_connection_registry(
+        MockWebSocketMessageHandler, async_iterator):
+    ws_response = 'aiojsonrpc.request_handler.WebSocketResponse'
+    with mock.patch(ws_response) as MockWebSocketResponse:
+        MockWebSocketResponse.return_value = async_iterator(range(1))
+        ws_instance = MockWebSocketResponse.return_value
+        ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
+        connections = ConnectionRegistry()
+        seen = []
+
+        async def handle_message(ws, msg, services, serializer=None):
+            seen.append((ws in connections, connections.tags(ws)))
+
+        msg_handler = MockWebSocketMessageHandler.return_value
+        msg_handler.handle_message = handle_message
+        msg_handler.negotiate.return_value = json
+        req = mock.MagicMock()
+        req.get.return_value = {'user': 'foo'}
+
+        handler = request_handler.RpcWebsocketHandler(
+            msg_handler, connections=connections,
+            connection_tags=lambda context: ('user:' + context['user'], ))
+        await handler(req)
+        assert seen == [(True, {'user:foo'})]
+        assert not connections
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('concurrency', [None, 2])
+async def test_rpc_websocket_handler_frame_serializer(async_iterator,
+                                                      concurrency):
+    connections = ConnectionRegistry()
+    published = []
+
+    class MsgHandler(request_handler.WebSocketMessageHandler):
+        async def handle_message(self, ws, msg, services, serializer=None):
+            published.append(connections.publish('news', [1]))
+
+    ws_response = 'aiojsonrpc.request_handler.WebSocketResponse'
+    with mock.patch(ws_response) as MockWebSocketResponse:
+        ws_instance = async_iterator([
+            create_msg(aiohttp.MsgType.ping, None),
+            create_msg(aiohttp.MsgType.binary, binary_rpc_call())],
+            close_delay=0.01)
+        MockWebSocketResponse.return_value = ws_instance
+        ws_instance.prepare = coro_mock()
+        ws_instance.protocol = None
+        ws_instance.closed = False
+        ws_instance.send_bytes = mock.Mock()
+        ws_instance.send_str = mock.Mock()
+        await request_handler.RpcWebsocketHandler(
+            MsgHandler(), connections=connections,
+            concurrency=concurrency)(mock.MagicMock())
+    # Messages handled concurrently all run after the binary frame is read.
+    assert published == ([0, 1] if concurrency is None else [1, 1])
+    assert not ws_instance.send_str.called
+    ws_instance.send_bytes.assert_called_with(msgpack.dumps(
+        {'jsonrpc': '2.0', 'method': 'news', 'params': [1]}))
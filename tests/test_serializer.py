@@ -1,14 +1,19 @@
 import json
 import msgpack
 import pytest
+from unittest import mock
+from aiojsonrpc import serializer as registry
 from aiojsonrpc.serializer import factory
 from aiojsonrpc.serializer import json as json_serializer
 from aiojsonrpc.serializer import msgpack as msgpack_serializer
+from aiojsonrpc.serializer import msgpack_bin as msgpack_bin_serializer
+from aiojsonrpc.serializer.deflate import DeflateSerializer
+from aiojsonrpc.serializer.envelope import MsgpackEnvelope
 
 
-@pytest.fixture(scope='function', params=[json_serializer, msgpack_serializer])
+@pytest.fixture(scope='function', params=registry.names())
 def serializer(request):
-    return request.param
+    return registry.get(request.param)
 
 
 @pytest.fixture(scope='function')
@@ -23,18 +28,164 @@ def data_str(data_dict):
 
 @pytest.fixture(scope='function')
 def data_bytes(data_dict):
-    return msgpack.dumps(data_dict, encoding='utf-8')
+    return msgpack.dumps(data_dict, use_bin_type=True)
 
 
 def test_factory(data_dict, data_str, data_bytes):
     assert factory.dumps(json, data_dict) == data_str
     assert factory.loads(json, data_str) == data_dict
-    assert factory.dumps(msgpack, data_dict, encoding='utf-8') == data_bytes
-    assert factory.loads(msgpack, data_bytes, encoding='utf-8') == data_dict
+    assert factory.dumps(msgpack, data_dict, use_bin_type=True) == data_bytes
+    assert factory.loads(msgpack, data_bytes,
+                         **factory.unpack_options(msgpack)) == data_dict
 
 
-def test_serializers(serializer):
+@pytest.mark.parametrize('version, options', [
+    ((0, 4, 8), {'encoding': 'utf-8'}),
+    ((0, 5, 2), {'raw': False}),
+    ((1, 0, 0), {'raw': False}),
+])
+def test_unpack_options(version, options):
+    assert factory.unpack_options(mock.Mock(version=version)) == options
+
+
+def test_serializers(serializer, data_dict):
     assert serializer.loads
     assert serializer.dumps
     assert serializer.serialize
     assert serializer.deserialize
+    assert serializer.loads(serializer.dumps(data_dict)) == data_dict
+    assert isinstance(serializer.dumps(data_dict),
+                      bytes if serializer.binary else str)
+
+
+def test_registry():
+    assert registry.get('json') is json_serializer
+    assert registry.get('msgpack') is msgpack_serializer
+    assert registry.resolve('msgpack-bin') is msgpack_bin_serializer
+    assert registry.resolve(json_serializer) is json_serializer
+    with pytest.raises(KeyError):
+        registry.get('no-such-serializer')
+
+
+def test_msgpack_bin(data_dict):
+    data = {**data_dict, 'blob': b'\x00\xff'}
+    assert msgpack_bin_serializer.loads(
+        msgpack_bin_serializer.dumps(data)) == data
+
+
+def result_response(id, result):
+    return {'jsonrpc': '2.0', 'result': result, 'id': id}
+
+
+def error_response(id, code, message):
+    return {'jsonrpc': '2.0', 'error': {'code': code, 'message': message},
+            'id': id}
+
+
+@pytest.mark.parametrize('id', [1, 2 ** 40, 'abc', None])
+@pytest.mark.parametrize('result', [42, 'foo/bar', None, [1, 'a'],
+                                    {'foo': 'bar', 'answer': 42}])
+def test_envelope_result(serializer, id, result):
+    assert (serializer.envelope.result(id, result) ==
+            serializer.dumps(result_response(id, result)))
+    assert (serializer.envelope.serialized_result(
+                id, serializer.dumps(result)) ==
+            serializer.dumps(result_response(id, result)))
+
+
+@pytest.mark.parametrize('id', [1, 'abc', None])
+def test_envelope_error(serializer, id):
+    for _ in range(2):
+        assert (serializer.envelope.error(id, -32601, 'Method not found') ==
+                serializer.dumps(error_response(id, -32601,
+                                                'Method not found')))
+
+
+def test_envelope_caches_standard_errors(serializer):
+    envelope = serializer.envelope
+    for code, message in ((-32601, 'Method `a` not found'),
+                          (-32603, 'Internal error')):
+        assert envelope.error(1, code, message) == serializer.dumps(
+            error_response(1, code, message))
+    assert (-32601, 'Method `a` not found') not in envelope._errors
+    assert (-32603, 'Internal error') in envelope._errors
+
+
+@pytest.mark.parametrize('size', [1, 3, 20])
+def test_envelope_batch(serializer, size):
+    responses = [result_response(id, id * 2) for id in range(size)]
+    assert serializer.loads(serializer.envelope.batch(
+        [serializer.dumps(response) for response in responses])) == responses
+
+
+@pytest.mark.parametrize('blob', [b'', b'\x00\xff' * 10,
+                                  bytearray(b'x' * 300),
+                                  memoryview(b'y' * 70000)[1:]])
+def test_envelope_binary_result(blob):
+    data = msgpack_bin_serializer.envelope.result(7, blob)
+    assert msgpack_bin_serializer.loads(data) == result_response(7,
+                                                                 bytes(blob))
+    assert msgpack_bin_serializer.loads(memoryview(data)) == result_response(
+        7, bytes(blob))
+
+
+def test_msgpack_envelope_created_without_packing():
+    dumps = mock.Mock(side_effect=TypeError)
+    envelope = MsgpackEnvelope(dumps)
+    assert not dumps.called
+    assert envelope._id_key == msgpack_serializer.dumps('id')
+    assert envelope._result_prefix == b'\x83' + b''.join(
+        msgpack_serializer.dumps(key) for key in ('jsonrpc', '2.0', 'result'))
+
+
+def test_msgpack_bin_buffers(data_dict):
+    data = {**data_dict, 'blob': memoryview(b'\x00\xff'),
+            'array': bytearray(b'\x01')}
+    assert msgpack_bin_serializer.loads(bytearray(
+        msgpack_bin_serializer.dumps(data))) == {**data_dict,
+                                                 'blob': b'\x00\xff',
+                                                 'array': b'\x01'}
+
+
+@pytest.mark.parametrize('serializer', [msgpack_serializer,
+                                        msgpack_bin_serializer])
+def test_packer_reset_on_error(serializer, data_dict):
+    with pytest.raises(TypeError):
+        serializer.dumps([1, object()])
+    assert serializer.loads(serializer.dumps(data_dict)) == data_dict
+
+
+@pytest.mark.parametrize('inner', ['json', 'msgpack', 'msgpack-bin'])
+def test_deflate(inner):
+    serializer = DeflateSerializer(inner, threshold=64)
+    assert serializer.name == inner + '+deflate'
+    small = {'answer': 42}
+    large = {'items': [{'key': 'value'}] * 100}
+    plain = registry.get(inner).dumps
+    expected = plain(small)
+    if isinstance(expected, str):
+        expected = expected.encode('utf-8')
+    assert serializer.dumps(small) == expected
+    data = serializer.dumps(large)
+    assert isinstance(data, bytes)
+    assert len(data) < len(plain(large)) // 4
+    for obj in (small, large):
+        assert serializer.loads(serializer.dumps(obj)) == obj
+        assert serializer.loads(memoryview(serializer.dumps(obj))) == obj
+
+
+def test_deflate_text_message():
+    assert DeflateSerializer('json').loads('{"answer": 42}') == {'answer': 42}
+
+
+def test_deflate_corrupt_message():
+    with pytest.raises(ValueError):
+        DeflateSerializer('json').loads(b'\x78garbage')
+
+
+def test_deflate_max_size():
+    large = ['x' * 100] * 100
+    data = DeflateSerializer('json', threshold=0).dumps(large)
+    assert DeflateSerializer('json', max_size=20000).loads(data) == large
+    with pytest.raises(ValueError):
+        DeflateSerializer('json', max_size=1000).loads(data)
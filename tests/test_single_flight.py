@@ -0,0 +1,126 @@
+import asyncio
+import pytest
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.single_flight import SingleFlight
+from aiojsonrpc.subscription import Subscription
+from aiojsonrpc.subscription import Subscriptions
+from aiojsonrpc.util import rpc_method
+
+
+@pytest.fixture(scope='function')
+def calls():
+    return []
+
+
+@pytest.fixture(scope='function')
+def slow_service(calls):
+    class SlowService(Service):
+        @rpc_method
+        async def lookup(self, key=''):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+    return SlowService
+
+
+@pytest.mark.asyncio
+async def test_single_flight(calls):
+    single_flight = SingleFlight()
+
+    async def call(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    results = await asyncio.gather(*(
+        single_flight.run('lookup', {'key': key}, lambda key=key: call(key))
+        for key in ('a', 'a', 'b', 'a')))
+    assert results == ['a', 'a', 'b', 'a']
+    assert sorted(calls) == ['a', 'b']
+    assert not single_flight
+
+
+@pytest.mark.asyncio
+async def test_single_flight_error():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    results = await asyncio.gather(
+        single_flight.run('lookup', {}, call),
+        single_flight.run('lookup', {}, call),
+        return_exceptions=True)
+    assert [str(result) for result in results] == ['failed', 'failed']
+
+
+@pytest.mark.asyncio
+async def test_coalesced_calls_across_connections(slow_service, calls):
+    msg_handler = WebSocketMessageHandler()
+    methods = create_dispatch_table({'SlowService': slow_service})
+    single_flight = SingleFlight()
+    connections = [ServiceMap(methods, {'SlowService': slow_service()},
+                              single_flight=single_flight)
+                   for _ in range(3)]
+    responses = await asyncio.gather(*(
+        msg_handler._call_service(services, json.dumps({
+            'jsonrpc': '2.0', 'method': 'SlowService.lookup',
+            'params': {'key': 'foo'}, 'id': id}), json)
+        for id, services in enumerate(connections)))
+    assert [json.loads(response) for response in responses] == [
+        {'jsonrpc': '2.0', 'result': 'FOO', 'id': id} for id in range(3)]
+    assert calls == ['foo']
+
+
+@pytest.mark.asyncio
+async def test_single_flight_unshareable():
+    single_flight = SingleFlight()
+    results = []
+
+    async def call():
+        await asyncio.sleep(0.01)
+        results.append(object())
+        return results[-1]
+
+    def run():
+        return single_flight.run('subscribe', {}, call,
+                                 lambda result: False)
+
+    first, second = await asyncio.gather(run(), run())
+    assert first is not second
+    assert len(results) == 2
+    await run()
+    assert len(results) == 3
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_are_not_coalesced():
+    subscriptions = []
+
+    class FeedService(Service):
+        @rpc_method
+        async def follow(self):
+            await asyncio.sleep(0.01)
+            subscriptions.append(Subscription())
+            return subscriptions[-1]
+
+    msg_handler = WebSocketMessageHandler()
+    methods = create_dispatch_table({'FeedService': FeedService})
+    single_flight = SingleFlight()
+    connections = [ServiceMap(methods, {'FeedService': FeedService()},
+                              single_flight=single_flight,
+                              subscriptions=Subscriptions())
+                   for _ in range(2)]
+    await asyncio.gather(*(
+        msg_handler._call_service(services, json.dumps({
+            'jsonrpc': '2.0', 'method': 'FeedService.follow',
+            'id': 1}), json, [])
+        for services in connections))
+    assert len(subscriptions) == 2
+    subscriptions[0].close()
+    assert not subscriptions[1].closed
@@ -0,0 +1,201 @@
+import aiohttp
+import asyncio
+import pytest
+import sys
+from unittest import mock
+from aiojsonrpc.client import ClientStream
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import compile_service
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.exception import RpcError
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.stream import Streams
+from aiojsonrpc.subscription import Subscriptions
+from aiojsonrpc.util import rpc_method
+
+
+class Rows(object):
+    def __init__(self, stop, fail_at=None):
+        self.pulled = 0
+        self._stop = stop
+        self._fail_at = fail_at
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        if self.pulled == self._fail_at:
+            raise RpcError('Row is broken', RpcErrorCode.INTERNAL_ERROR)
+        if self.pulled >= self._stop:
+            raise StopAsyncIteration
+        self.pulled += 1
+        return self.pulled
+
+
+class ReportService(Service):
+    sources = []
+
+    @rpc_method(stream=True)
+    def rows(self, stop=0, fail_at=None):
+        source = Rows(stop, fail_at)
+        self.sources.append(source)
+        return source
+
+
+def create_msg(request):
+    msg = mock.Mock()
+    msg.tp = aiohttp.MsgType.text
+    msg.data = json.dumps(request)
+    return msg
+
+
+def create_request(method, id=1, **params):
+    return {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': id}
+
+
+def create_notification(method, **params):
+    return {'jsonrpc': '2.0', 'method': method, 'params': params}
+
+
+@pytest.fixture
+def msg_handler():
+    return WebSocketMessageHandler()
+
+
+@pytest.fixture
+def ws():
+    ws = mock.Mock()
+    ws.closed = False
+    ws.messages = []
+    ws.send_str.side_effect = lambda data: ws.messages.append(
+        json.loads(data))
+    return ws
+
+
+@pytest.fixture
+def services():
+    del ReportService.sources[:]
+    return ServiceMap(create_dispatch_table({'ReportService': ReportService}),
+                      {'ReportService': ReportService()},
+                      subscriptions=Subscriptions(), streams=Streams(4))
+
+
+@pytest.mark.asyncio
+async def test_stream(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('ReportService.rows', stop=3)),
+        services)
+    await asyncio.sleep(0.01)
+    assert ws.messages == [
+        create_notification('rpc.chunk', id=1, result=1, window=4),
+        create_notification('rpc.chunk', id=1, result=2),
+        create_notification('rpc.chunk', id=1, result=3),
+        {'jsonrpc': '2.0', 'result': 3, 'id': 1},
+    ]
+    assert not services.streams
+
+
+@pytest.mark.asyncio
+async def test_stream_flow_control(msg_handler, ws, services):
+    request = create_request('ReportService.rows', stop=10)
+    request['window'] = 2
+    await msg_handler.handle_message(ws, create_msg(request), services)
+    await asyncio.sleep(0.01)
+    source, = ReportService.sources
+    assert source.pulled == 2
+    assert len(ws.messages) == 2
+
+    await msg_handler.handle_message(
+        ws, create_msg(create_notification('rpc.ack', id=1, credit=20)),
+        services)
+    await asyncio.sleep(0.01)
+    assert source.pulled == 4
+    assert len(ws.messages) == 4
+
+    await msg_handler.handle_message(
+        ws, create_msg(create_notification('rpc.cancel', id=1)), services)
+    await asyncio.sleep(0.01)
+    assert len(ws.messages) == 4
+    assert not services.streams
+
+
+@pytest.mark.asyncio
+async def test_stream_window_capped_by_server():
+    streams = Streams(4)
+    client = mock.Mock()
+    client._streams = {}
+    client.notify.side_effect = lambda method, id, credit: streams.ack(
+        id, credit)
+    client_stream = client._streams[1] = ClientStream(client, 1, 64)
+
+    def send(message):
+        if message.get('method') == 'rpc.chunk':
+            client_stream._on_chunk(message['params'])
+        else:
+            client_stream._on_response(message)
+
+    async def collect():
+        items = []
+        async for item in client_stream:
+            items.append(item)
+        return items
+
+    streams.start(streams.add(1, Rows(40), window=64), send)
+    items = await asyncio.wait_for(collect(), 1)
+    assert items == list(range(1, 41))
+    assert client_stream.result == 40
+
+
+@pytest.mark.asyncio
+async def test_stream_error(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('ReportService.rows', stop=3,
+                                      fail_at=1)),
+        services)
+    await asyncio.sleep(0.01)
+    assert ws.messages[-1] == {
+        'jsonrpc': '2.0',
+        'error': {'code': RpcErrorCode.INTERNAL_ERROR.value,
+                  'message': 'Row is broken'},
+        'id': 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_stream_not_supported(msg_handler, ws):
+    services = ServiceMap.from_instances({'ReportService': ReportService()})
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('ReportService.rows', stop=3)),
+        services)
+    assert ws.messages[-1]['error']['code'] == (
+        RpcErrorCode.INVALID_REQUEST.value)
+
+
+@pytest.mark.asyncio
+async def test_streams_close(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('ReportService.rows', stop=100)),
+        services)
+    assert len(services.streams) == 1
+    services.streams.close()
+    await asyncio.sleep(0.01)
+    assert not services.streams
+    assert ReportService.sources[0].pulled <= 4
+
+
+@pytest.mark.skipif(sys.version_info < (3, 6),
+                    reason='async generators require Python 3.6')
+def test_async_generator_is_stream():
+    namespace = {'rpc_method': rpc_method, 'Service': Service}
+    exec('class GeneratorService(Service):\n'
+         '    @rpc_method\n'
+         '    async def rows(self):\n'
+         '        yield 1\n', namespace)
+    methods = compile_service(namespace['GeneratorService'])
+    assert methods['rows'].is_stream
+    assert methods['rows'].executor is None
+    assert not compile_service(ReportService)['rows'].is_coroutine
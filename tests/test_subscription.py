@@ -0,0 +1,147 @@
+import aiohttp
+import asyncio
+import pytest
+from unittest import mock
+from aiojsonrpc.dispatch import ServiceMap
+from aiojsonrpc.dispatch import create_dispatch_table
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.request_handler import WebSocketMessageHandler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.subscription import Subscription
+from aiojsonrpc.subscription import Subscriptions
+from aiojsonrpc.util import rpc_method
+from tests.util import collect
+
+
+class AsyncRange(object):
+    def __init__(self, stop):
+        self._iter = iter(range(stop))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await asyncio.sleep(0)
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FeedService(Service):
+    subscriptions = []
+
+    @rpc_method
+    def feed(self):
+        subscription = Subscription(on_close=self.subscriptions.remove)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    @rpc_method
+    def count(self, stop=0):
+        return Subscription(AsyncRange(stop))
+
+
+def create_msg(request):
+    msg = mock.Mock()
+    msg.tp = aiohttp.MsgType.text
+    msg.data = json.dumps(request)
+    return msg
+
+
+def create_request(method, id=1, **params):
+    return {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': id}
+
+
+@pytest.fixture
+def msg_handler():
+    return WebSocketMessageHandler()
+
+
+@pytest.fixture
+def ws():
+    ws = mock.Mock()
+    ws.closed = False
+    ws.messages = []
+    ws.send_str.side_effect = lambda data: ws.messages.append(
+        json.loads(data))
+    return ws
+
+
+@pytest.fixture
+def services():
+    return ServiceMap(create_dispatch_table({'FeedService': FeedService}),
+                      {'FeedService': FeedService()},
+                      subscriptions=Subscriptions())
+
+
+@pytest.mark.asyncio
+async def test_subscription_publish():
+    subscription = Subscription(maxsize=2)
+    subscription.publish(1)
+    subscription.publish(2)
+    with pytest.raises(asyncio.QueueFull):
+        subscription.publish(3)
+    subscription.close()
+    assert subscription.closed
+    with pytest.raises(RuntimeError):
+        subscription.publish(4)
+    assert [1, 2] == await collect(subscription)
+
+
+@pytest.mark.asyncio
+async def test_subscription_source(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('FeedService.count', stop=2)), services)
+    await asyncio.sleep(0.01)
+    assert [message.get('result', message.get('params'))
+            for message in ws.messages] == [
+        1,
+        {'subscription': 1, 'result': 0},
+        {'subscription': 1, 'result': 1},
+        {'subscription': 1, 'done': True},
+    ]
+    assert not services.subscriptions
+
+
+@pytest.mark.asyncio
+async def test_subscription_unsubscribe(msg_handler, ws, services):
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('FeedService.feed')), services)
+    subscription, = FeedService.subscriptions
+    subscription.publish('news')
+    await asyncio.sleep(0.01)
+    assert ws.messages[-1]['params'] == {'subscription': 1,
+                                         'result': 'news'}
+
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('rpc.unsubscribe', id=2,
+                                      subscription=1)),
+        services)
+    assert ws.messages[-1] == {'jsonrpc': '2.0', 'result': True, 'id': 2}
+    assert subscription.closed
+    assert not FeedService.subscriptions
+    assert not services.subscriptions
+
+
+@pytest.mark.asyncio
+async def test_subscriptions_close(msg_handler, ws, services):
+    for id in range(2):
+        await msg_handler.handle_message(
+            ws, create_msg(create_request('FeedService.feed', id=id)),
+            services)
+    assert len(services.subscriptions) == 2
+    services.subscriptions.close()
+    assert not services.subscriptions
+    assert not FeedService.subscriptions
+
+
+@pytest.mark.asyncio
+async def test_subscription_not_supported(msg_handler, ws):
+    services = ServiceMap.from_instances({'FeedService': FeedService()})
+    await msg_handler.handle_message(
+        ws, create_msg(create_request('FeedService.feed')), services)
+    assert ws.messages[-1]['error']['code'] == (
+        RpcErrorCode.INVALID_REQUEST.value)
+    assert not FeedService.subscriptions
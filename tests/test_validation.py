@@ -0,0 +1,121 @@
+import pytest
+from aiojsonrpc.exception import RpcError
+from aiojsonrpc.exception import RpcErrorCode
+from aiojsonrpc.dispatch import compile_service
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+from aiojsonrpc.validation import compile_validator
+
+
+def assert_invalid(validate, params, reason):
+    with pytest.raises(RpcError) as e:
+        validate(params)
+    assert e.value.rpc_error_code is RpcErrorCode.INVALID_PARAMS
+    assert e.value.rpc_error_message == 'Invalid params: ' + reason
+
+
+def test_names():
+    def meth(self, a, b=1, *args, c, d=None):
+        pass
+
+    validate = compile_validator(meth)
+    validate({'a': 1, 'c': 2})
+    validate({'a': 1, 'b': 2, 'c': 3, 'd': 4})
+    assert_invalid(validate, {'b': 1}, 'missing `a`, `c`')
+    assert_invalid(validate, {'a': 1, 'c': 2, 'e': 3, 'f': 4},
+                   'unexpected `e`, `f`')
+    assert_invalid(validate, 'a', 'params must be an array or an object')
+
+
+def test_positional():
+    def meth(self, a, b=1, c: int = 2):
+        pass
+
+    validate = compile_validator(meth, validate=True)
+    validate([1])
+    validate([1, 2, 3])
+    assert_invalid(validate, [], 'missing `a`')
+    assert_invalid(validate, [1, 2, 3, 4], 'expected at most 3 params')
+    assert_invalid(validate, [1, 2, '3'], '`c` must be int')
+    assert validate.as_named([1, 2]) == {'a': 1, 'b': 2}
+    assert validate.as_named({'a': 1}) == {'a': 1}
+
+
+def test_positional_var_positional():
+    def meth(self, context, a, *args, b, c=None):
+        pass
+
+    validate = compile_validator(meth, skip=2)
+    assert_invalid(validate, [1, 2], 'missing `b`')
+    validate({'a': 1, 'b': 2})
+
+    def meth(self, a: str, *args: int):
+        pass
+
+    validate = compile_validator(meth, validate=True)
+    validate(['a', 'b', 'c'])
+    assert validate.as_named(['a', 'b']) == ['a', 'b']
+
+
+def test_var_keyword():
+    def meth(self, context, a, **params):
+        pass
+
+    validate = compile_validator(meth, skip=2)
+    validate({'a': 1, 'b': 2})
+    assert_invalid(validate, {'context': 1}, 'missing `a`')
+
+
+def test_annotations():
+    def meth(self, a: int, b: float = 0.0, c: (str, bytes) = None,
+             d: bool = False, e: 'str' = '', f: list = ()):
+        pass
+
+    assert compile_validator(meth).types == compile_validator(
+        meth, validate=False).types == ()
+    validate = compile_validator(meth, validate=True)
+    validate({'a': 1, 'b': 2, 'c': None, 'd': True, 'e': 3, 'f': []})
+    validate({'a': 1, 'b': 2.5, 'c': b'x'})
+    assert_invalid(validate, {'a': '1'}, '`a` must be int')
+    assert_invalid(validate, {'a': True}, '`a` must be int')
+    assert_invalid(validate, {'a': 1, 'b': '2'}, '`b` must be float or int')
+    assert_invalid(validate, {'a': 1, 'c': 1},
+                   '`c` must be str or bytes or NoneType')
+    assert_invalid(validate, {'a': 1, 'd': 1}, '`d` must be bool')
+    assert_invalid(validate, {'a': 1, 'f': {}}, '`f` must be list')
+
+
+def test_schema():
+    def meth(self, a: int = 0, b=None):
+        pass
+
+    validate = compile_validator(meth, validate=True, schema={'b': dict})
+    validate({'a': 'not checked', 'b': {}})
+    assert_invalid(validate, {'b': []}, '`b` must be dict or NoneType')
+
+
+@pytest.mark.asyncio
+async def test_service_validation():
+    class ValidatedService(Service):
+        @rpc_method(validate=True)
+        def add(self, x: int, y: int = 0):
+            return x + y
+
+        @rpc_method(with_context=True, schema={'prefix': str})
+        def whoami(self, context, prefix=''):
+            return prefix + context['user']
+
+    methods = compile_service(ValidatedService)
+    assert methods['add'].validate_params.required == {'x'}
+    service = ValidatedService(user='foo')
+    assert 3 == await service('add', x=1, y=2)
+    assert 3 == await service('add', 1, 2)
+    with pytest.raises(TypeError):
+        await service('add', 1, y=2)
+    assert 'me: foo' == await service('whoami', prefix='me: ')
+    with pytest.raises(RpcError):
+        await service('add', x='1')
+    with pytest.raises(RpcError):
+        await service('add', y=1)
+    with pytest.raises(RpcError):
+        await service('whoami', prefix=1)
@@ -0,0 +1,100 @@
+import aiohttp
+import asyncio
+import os
+import pytest
+import signal
+from aiohttp import web
+from aiojsonrpc.client import HttpClient
+from aiojsonrpc.connection import ConnectionRegistry
+from aiojsonrpc.request_handler import create_default_rpc_http_handler
+from aiojsonrpc.request_handler import create_default_rpc_websocket_handler
+from aiojsonrpc.serializer import json
+from aiojsonrpc.service import Service
+from aiojsonrpc.util import rpc_method
+from aiojsonrpc.workers import Supervisor
+
+
+class ProcessService(Service):
+    @rpc_method
+    def pid(self):
+        return os.getpid()
+
+
+async def publish(request):
+    return web.Response(text=str(request.app['broadcast'].publish(
+        'news', ['hello'])))
+
+
+def create_app():
+    app = web.Application()
+    app['websockets'] = ConnectionRegistry()
+    app.router.add_route('GET', '/ws/json-rpc',
+                         create_default_rpc_websocket_handler(
+                             services=(ProcessService, )))
+    app.router.add_route('POST', '/json-rpc',
+                         create_default_rpc_http_handler(
+                             services=(ProcessService, )))
+    app.router.add_route('POST', '/publish', publish)
+    return app
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor(create_app, host='127.0.0.1', port=0, workers=2,
+                            broadcast=True, shutdown_timeout=1.0)
+    pid = os.fork()
+    if not pid:
+        try:
+            supervisor.run()
+        finally:
+            os._exit(0)
+    yield supervisor
+    os.kill(pid, signal.SIGTERM)
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+
+
+async def connect(session, url):
+    for _ in range(100):
+        try:
+            return await session.ws_connect(url)
+        except (aiohttp.ClientError, OSError):
+            await asyncio.sleep(0.05)
+    raise AssertionError('workers did not start')
+
+
+async def worker_pid(ws):
+    ws.send_str(json.dumps({'jsonrpc': '2.0', 'method': 'ProcessService.pid',
+                            'id': 1}))
+    return json.loads((await ws.receive()).data)['result']
+
+
+@pytest.mark.asyncio
+async def test_workers_share_port_and_broadcast(supervisor):
+    url = 'http://127.0.0.1:{}'.format(supervisor.port)
+    session = aiohttp.ClientSession()
+    opened = []
+    try:
+        connections = {}
+        for _ in range(50):
+            ws = await connect(session, url + '/ws/json-rpc')
+            opened.append(ws)
+            connections.setdefault(await worker_pid(ws), ws)
+            if len(connections) == 2:
+                break
+        assert len(connections) == 2
+
+        async with HttpClient(url + '/json-rpc', session=session) as client:
+            assert await client.call('ProcessService.pid') in connections
+
+        async with session.post(url + '/publish') as response:
+            assert int(await response.text()) >= 1
+        for ws in connections.values():
+            notification = json.loads((await asyncio.wait_for(
+                ws.receive(), 5)).data)
+            assert notification == {'jsonrpc': '2.0', 'method': 'news',
+                                    'params': ['hello']}
+    finally:
+        for ws in opened:
+            await ws.close()
+        session.close()
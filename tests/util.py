@@ -8,3 +8,11 @@ def coro_mock(**kwargs):
                        side_effect=asyncio.coroutine(coro))
     corofn.coro = coro
     return corofn
+
+
+async def collect(async_iterable):
+    """ Returns the items of `async_iterable` as a list. """
+    items = []
+    async for item in async_iterable:
+        items.append(item)
+    return items